@@ -0,0 +1,204 @@
+"""خادم Bot API وهمي لاختبار الحمل بدون لمس قنوات حقيقية.
+
+يطبّق الدوال التي يستخدمها main.py ويرجع كائنات صالحة لـ python-telegram-bot،
+مع تأخير قابل للضبط وحقن أخطاء 429.
+
+تشغيل مستقل:
+    python -m bench.fake_bot_api --port 8081 --latency-ms 20 --rate-429 0.01
+ثم شغّل البوت مع BOT_API_BASE_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BOT_USER = {"id": 999_000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+# المستخدمون 1..admins مشرفون في كل محادثة؛ البقية أعضاء عاديون
+config = {"latency_ms": 0.0, "jitter_ms": 0.0, "rate_429": 0.0, "retry_after": 1, "admins": 5}
+calls: Counter = Counter()
+throttled: Counter = Counter()
+message_ids = itertools.count(1)
+# تحديثات تُسلَّم عبر getUpdates (تُضاف من /__bench/updates لاختبار وضع polling)
+pending_updates: list[dict] = []
+updates_arrived = asyncio.Event()
+webhook = {"url": "", "allowed_updates": []}
+
+# الدوال التي يطبّق عليها تيليجرام حدود الإرسال (ويُحقن فيها 429)
+THROTTLED_PREFIXES = ("send", "edit", "copy", "forward")
+
+app = FastAPI()
+
+
+async def read_params(request: Request) -> dict:
+    # PTB يرسل urlencoded (أو multipart عند رفع ملفات) والقيم المركّبة كنص JSON
+    content_type = request.headers.get("content-type", "")
+    if "json" in content_type:
+        return await request.json()
+    if content_type.startswith("multipart/"):
+        # يحتاج python-multipart؛ البوت يرسل file_id فقط فلا يصل هنا عادة
+        items = [(k, v if isinstance(v, str) else "<file>") for k, v in (await request.form()).items()]
+    else:
+        items = parse_qsl((await request.body()).decode())
+    params = {}
+    for key, value in items:
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def user_obj(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def chat_obj(chat_id) -> dict:
+    if isinstance(chat_id, str):
+        # @username → معرّف قناة ثابت
+        chat_id = -1_002_000_000_000 - sum(map(ord, chat_id))
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+    return {"id": chat_id, "type": "channel", "title": f"chat {chat_id}"}
+
+
+def message_obj(params: dict) -> dict:
+    msg = {
+        "message_id": next(message_ids),
+        "date": int(time.time()),
+        "chat": chat_obj(params.get("chat_id", 0)),
+        "from": BOT_USER,
+    }
+    if "text" in params:
+        msg["text"] = str(params["text"])
+    if params.get("caption"):
+        msg["caption"] = str(params["caption"])
+    if isinstance(params.get("reply_markup"), dict):
+        msg["reply_markup"] = params["reply_markup"]
+    return msg
+
+
+def chat_member(user_id: int) -> dict:
+    if 0 < user_id <= config["admins"]:
+        return {"status": "creator", "user": user_obj(user_id), "is_anonymous": False}
+    return {"status": "member", "user": user_obj(user_id)}
+
+
+def respond(method: str, params: dict):
+    if method == "getMe":
+        return BOT_USER
+    if method == "sendMediaGroup":
+        return [message_obj(params) for _ in params.get("media") or [None]]
+    if method.startswith(("send", "copy", "forward")):
+        return message_obj(params)
+    if method.startswith("edit"):
+        return message_obj(params) if "chat_id" in params else True
+    if method == "getChat":
+        chat = chat_obj(params.get("chat_id", 0))
+        return {**chat, "accent_color_id": 0, "max_reaction_count": 11}
+    if method == "getChatMember":
+        return chat_member(int(params.get("user_id", 0)))
+    if method == "getChatAdministrators":
+        return [chat_member(uid) for uid in range(1, config["admins"] + 1)]
+    if method == "setWebhook":
+        webhook.update(url=params.get("url", ""), allowed_updates=params.get("allowed_updates") or [])
+        return True
+    if method == "deleteWebhook":
+        webhook.update(url="", allowed_updates=[])
+        return True
+    if method == "getWebhookInfo":
+        return {**webhook, "has_custom_certificate": False, "pending_update_count": 0}
+    # answerCallbackQuery / deleteMessage / setWebhook / deleteWebhook ...
+    return True
+
+
+async def get_updates(params: dict) -> list[dict]:
+    # نفس دلالة offset في تيليجرام: كل ما قبله يُعتبر مؤكدًا ويُحذف
+    offset = params.get("offset")
+    if offset is not None:
+        pending_updates[:] = [u for u in pending_updates if u["update_id"] >= int(offset)]
+    if not pending_updates and params.get("timeout"):
+        updates_arrived.clear()
+        try:
+            await asyncio.wait_for(updates_arrived.wait(), timeout=float(params["timeout"]))
+        except asyncio.TimeoutError:
+            pass
+    return pending_updates[:int(params.get("limit") or 100)]
+
+
+@app.post("/bot{token}/{method}")
+async def bot_method(token: str, method: str, request: Request):
+    params = await read_params(request)
+    calls[method] += 1
+    if method == "getUpdates":
+        return {"ok": True, "result": await get_updates(params)}
+
+    delay = config["latency_ms"] + random.uniform(-1, 1) * config["jitter_ms"]
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+    if method.startswith(THROTTLED_PREFIXES) and random.random() < config["rate_429"]:
+        throttled[method] += 1
+        retry_after = config["retry_after"]
+        return JSONResponse({
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        }, status_code=429)
+
+    return {"ok": True, "result": respond(method, params)}
+
+
+@app.get("/__bench/stats")
+async def bench_stats():
+    return {"calls": dict(calls), "total": sum(calls.values()), "throttled": dict(throttled)}
+
+
+@app.post("/__bench/reset")
+async def bench_reset():
+    calls.clear()
+    throttled.clear()
+    return {"ok": True}
+
+
+@app.post("/__bench/updates")
+async def bench_updates(request: Request):
+    pending_updates.extend(await request.json())
+    updates_arrived.set()
+    return {"pending": len(pending_updates)}
+
+
+@app.post("/__bench/config")
+async def bench_config(request: Request):
+    config.update({k: v for k, v in (await request.json()).items() if k in config})
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter around the mean")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="probability of a 429 on send/edit calls")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--admins", type=int, default=5, help="user ids 1..N are admins everywhere")
+    args = parser.parse_args()
+    config.update(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_429=args.rate_429,
+        retry_after=args.retry_after, admins=args.admins,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
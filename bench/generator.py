@@ -0,0 +1,129 @@
+"""مولّد تحديثات تيليجرام اصطناعية لسيناريوهات الحمل.
+
+كل سيناريو يرجع "موجات": قائمة من قوائم تحديثات. تحديثات الموجة الواحدة
+تُرسل بالتوازي، والموجات بالتتابع حتى يبقى ترتيب خطوات المستخدم الواحد صحيحًا.
+"""
+import itertools
+import time
+
+# المستخدمون 1..5 مشرفون في الخادم الوهمي (--admins)
+ADMIN_IDS = range(1, 6)
+USER_ID_BASE = 100_000
+CHANNEL_ID = -1_001_000_000_001
+
+
+class UpdateFactory:
+    def __init__(self, start_update_id: int = 1):
+        self._update_ids = itertools.count(start_update_id)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _private_message(self, user_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"user{user_id}"},
+            "from": self._user(user_id),
+            **fields,
+        }
+
+    def message(self, user_id: int, text: str) -> dict:
+        return {"update_id": next(self._update_ids), "message": self._private_message(user_id, text=text)}
+
+    def command(self, user_id: int, command: str, arg: str | None = None) -> dict:
+        text = f"/{command}" + (f" {arg}" if arg else "")
+        entities = [{"type": "bot_command", "offset": 0, "length": len(command) + 1}]
+        return {
+            "update_id": next(self._update_ids),
+            "message": self._private_message(user_id, text=text, entities=entities),
+        }
+
+    def forward_from_channel(self, user_id: int, channel_id: int) -> dict:
+        origin = {
+            "type": "channel",
+            "chat": {"id": channel_id, "type": "channel", "title": f"chat {channel_id}"},
+            "message_id": 1,
+            "date": int(time.time()),
+        }
+        return {
+            "update_id": next(self._update_ids),
+            "message": self._private_message(user_id, text="forwarded post", forward_origin=origin),
+        }
+
+    def callback(self, user_id: int, data: str, message: dict | None = None) -> dict:
+        if message is None:
+            message = self._private_message(user_id, text="controls")
+            message["from"] = {"id": 999_000, "is_bot": True, "first_name": "Bench"}
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": message,
+            },
+        }
+
+
+def channel_post(message_id: int, channel_id: int = CHANNEL_ID) -> dict:
+    # منشور قناة بأزرار التفاعل الابتدائية كما ينشرها البوت
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": channel_id, "type": "channel", "title": "bench channel"},
+        "text": "post",
+        "reply_markup": {"inline_keyboard": [[
+            {"text": "😍 0", "callback_data": "like"},
+            {"text": "😐  0", "callback_data": "dislike"},
+        ]]},
+    }
+
+
+def reaction_storm(factory: UpdateFactory, scale: float = 1.0) -> list[list[dict]]:
+    # 1000 ضغطة على 5 منشورات في موجة واحدة (مع تكرارات لاختبار منع التصويت المزدوج)
+    posts = [channel_post(10_000 + i) for i in range(5)]
+    users = int(200 * scale)
+    wave = []
+    for i in range(users):
+        for j, post in enumerate(posts):
+            data = "like" if (i + j) % 3 else "dislike"
+            wave.append(factory.callback(USER_ID_BASE + i, data, post))
+    return [wave]
+
+
+def inquiry_burst(factory: UpdateFactory, scale: float = 1.0) -> list[list[dict]]:
+    # كل مستخدم: رابط الملاحظة → نص → إرسال (إشعار كل المشرفين في الخلفية)
+    users = [USER_ID_BASE + 50_000 + i for i in range(int(200 * scale))]
+    deep_link = f"inq_{CHANNEL_ID}_{20_000}"
+    return [
+        [factory.command(uid, "start", deep_link) for uid in users],
+        [factory.message(uid, f"ملاحظة رقم {uid}") for uid in users],
+        [factory.callback(uid, "send_inquiry") for uid in users],
+    ]
+
+
+def concurrent_publishing(factory: UpdateFactory, scale: float = 1.0) -> list[list[dict]]:
+    # كل مشرف يربط قناته ثم ينشر عدة منشورات بالتوازي مع بقية المشرفين
+    admins = list(ADMIN_IDS)
+    rounds = max(1, int(4 * scale))
+    waves = [[factory.forward_from_channel(aid, CHANNEL_ID - aid) for aid in admins]]
+    for n in range(rounds):
+        waves += [
+            [factory.message(aid, "jop") for aid in admins],
+            [factory.message(aid, f"منشور {n} من المشرف {aid}") for aid in admins],
+            [factory.callback(aid, "admin_done_input") for aid in admins],
+            [factory.callback(aid, "set_reactions_yes") for aid in admins],
+            [factory.callback(aid, "confirm_publish") for aid in admins],
+        ]
+    return waves
+
+
+SCENARIOS = {
+    "reactions": reaction_storm,
+    "inquiries": inquiry_burst,
+    "publishing": concurrent_publishing,
+}
@@ -0,0 +1,218 @@
+"""مشغّل اختبار الحمل: خادم Bot API وهمي + البوت الحقيقي + تحديثات اصطناعية.
+
+يشغّل bench.fake_bot_api و main:app كعمليتين منفصلتين، ويرسل موجات كل سيناريو
+إلى /webhook/{secret}، ثم ينتظر حتى يعالج البوت كل التحديثات (من /metrics).
+يطبع لكل سيناريو: معدل الاستقبال والمعالجة، p50/p99 لزمن الويبهوك، وعدد طلبات Bot API.
+
+مثال:
+    python -m bench.run --scenarios reactions,inquiries,publishing --latency-ms 30 --rate-429 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench.generator import SCENARIOS, UpdateFactory
+
+ROOT = Path(__file__).resolve().parent.parent
+WEBHOOK_SECRET = "bench-secret"
+# البوت يرفض أي طلب ويبهوك بدون هيدر السر الذي يسجّله في set_webhook
+WEBHOOK_HEADERS = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def wait_until_ready(client: httpx.AsyncClient, bot_url: str, timeout: float = 60.0):
+    # /health يرد 200 قبل انتهاء bootstrap()؛ البوت جاهز فعلًا حين تُسجَّل آخر مراحل التشغيل (updates) في /metrics
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        health = await client.get(f"{bot_url}/health")
+        if health.status_code >= 500:
+            raise RuntimeError(f"bot failed to start: {health.text}")
+        if 'bot_startup_phase_seconds{phase="updates"}' in (await client.get(f"{bot_url}/metrics")).text:
+            return
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"bot did not finish startup within {timeout}s")
+
+
+async def processed_updates(client: httpx.AsyncClient, bot_url: str) -> int:
+    # مجموع bot_update_duration_seconds_count لكل الأنواع = التحديثات المُعالجة
+    text = (await client.get(f"{bot_url}/metrics")).text
+    return int(sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line.startswith("bot_update_duration_seconds_count")
+    ))
+
+
+async def post_wave(client: httpx.AsyncClient, url: str, wave: list[dict], concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def post_one(update: dict):
+        async with semaphore:
+            t0 = time.perf_counter()
+            response = await client.post(url, json=update, headers=WEBHOOK_HEADERS)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            response.raise_for_status()
+
+    await asyncio.gather(*(post_one(u) for u in wave))
+    return latencies
+
+
+async def run_scenario(name: str, args, client: httpx.AsyncClient, factory: UpdateFactory,
+                       bot_url: str, api_url: str) -> dict:
+    waves = SCENARIOS[name](factory, args.scale)
+    total = sum(len(w) for w in waves)
+    baseline = await processed_updates(client, bot_url)
+    await client.post(f"{api_url}/__bench/reset")
+
+    webhook_url = f"{bot_url}/webhook/{WEBHOOK_SECRET}"
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for wave in waves:
+        latencies += await post_wave(client, webhook_url, wave, args.concurrency)
+    sent_at = time.perf_counter()
+
+    deadline = time.monotonic() + args.drain_timeout
+    while await processed_updates(client, bot_url) < baseline + total:
+        if time.monotonic() > deadline:
+            print(f"[{name}] drain timeout: not all updates were processed", file=sys.stderr)
+            break
+        await asyncio.sleep(0.05)
+    drained_at = time.perf_counter()
+    # إشعارات الخلفية (fan-out / تعديلات التفاعل المؤجلة) تنتهي بعد المعالجة بقليل
+    await asyncio.sleep(args.settle)
+
+    stats = (await client.get(f"{api_url}/__bench/stats")).json()
+    return {
+        "scenario": name,
+        "updates": total,
+        "ingest_per_s": round(total / (sent_at - started), 1),
+        "processed_per_s": round(total / (drained_at - started), 1),
+        "webhook_p50_ms": round(percentile(latencies, 50), 2),
+        "webhook_p99_ms": round(percentile(latencies, 99), 2),
+        "api_calls": stats["total"],
+        "api_calls_per_update": round(stats["total"] / total, 2),
+        "api_429": sum(stats["throttled"].values()),
+        "api_by_method": stats["calls"],
+    }
+
+
+def print_report(results: list[dict]):
+    columns = ["scenario", "updates", "ingest_per_s", "processed_per_s",
+               "webhook_p50_ms", "webhook_p99_ms", "api_calls", "api_calls_per_update", "api_429"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in columns))
+    for r in results:
+        methods = ", ".join(f"{m}={n}" for m, n in sorted(r["api_by_method"].items(), key=lambda kv: -kv[1]))
+        print(f"\n{r['scenario']}: {methods}")
+
+
+async def main_async(args):
+    api_port, bot_port = free_port(), free_port()
+    api_url, bot_url = f"http://127.0.0.1:{api_port}", f"http://127.0.0.1:{bot_port}"
+
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as tmp:
+        api_proc = subprocess.Popen(
+            [sys.executable, "-m", "bench.fake_bot_api", "--port", str(api_port),
+             "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+             "--rate-429", str(args.rate_429)],
+            cwd=ROOT,
+        )
+        env = {
+            **os.environ,
+            "TOKEN": "123456:bench",
+            "WEBHOOK_SECRET": WEBHOOK_SECRET,
+            "BOT_API_BASE_URL": api_url,
+            "STATE_DB_PATH": str(Path(tmp) / "state.db"),
+            "UPDATE_JOURNAL_PATH": str(Path(tmp) / "updates.journal"),
+            "PUBLIC_URL": "",
+            "RENDER_EXTERNAL_URL": "",
+            # المشغّل يرسل للويبهوك مباشرة؛ بدون هذا يتحول البوت لـ polling لغياب الرابط العام
+            "UPDATE_MODE": "webhook",
+        }
+        bot_proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(bot_port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL if args.quiet else None,
+            stderr=subprocess.DEVNULL if args.quiet else None,
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+                await wait_until_up(client, f"{api_url}/__bench/stats")
+                await wait_until_up(client, f"{bot_url}/health")
+                await wait_until_ready(client, bot_url)
+                factory = UpdateFactory()
+                results = [
+                    await run_scenario(name, args, client, factory, bot_url, api_url)
+                    for name in args.scenarios
+                ]
+        finally:
+            for proc in (bot_proc, api_proc):
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    print_report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against a fake Bot API")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x for x in s.split(",") if x], help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the size of every scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="parallel webhook requests per wave")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake Bot API mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fake Bot API 429 probability on send/edit")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to wait for background sends")
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--quiet", action="store_true", help="hide bot logs")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
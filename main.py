@@ -1,8 +1,32 @@
 import os
 import re
+import json
+import time
+import heapq
+import itertools
+import base64
+import hashlib
+import hmac
+import socket
+import sqlite3
+import asyncio
 import logging
-from datetime import datetime
-
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+try:
+    # أسرع بعدة مرات من json في تحليل أجسام الويبهوك؛ في requirements.txt ونعود لـ json لو غاب
+    import orjson
+except ImportError:
+    orjson = None
+
+import httpx
 from fastapi import FastAPI, Request
 from fastapi.responses import PlainTextResponse
 
@@ -11,12 +35,20 @@ from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
 )
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
+    BaseRateLimiter,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    ChatMemberHandler,
     filters,
     ContextTypes,
 )
@@ -38,13 +70,905 @@ if not TOKEN:
 
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "super-secret-path")
 
+# عنوان Bot API (فارغ = api.telegram.org)؛ bench/ يوجّهه لخادم وهمي محلي
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL", "").rstrip("/")
+
 # نفضّل PUBLIC_URL لو موجود، وإلا نرجع لـ RENDER_EXTERNAL_URL
 APP_URL = os.getenv("PUBLIC_URL") or os.getenv("RENDER_EXTERNAL_URL")
 
+# استقبال التحديثات: auto (ويبهوك لو وُجد APP_URL وإلا long polling) أو webhook أو polling
+UPDATE_MODE = os.getenv("UPDATE_MODE", "auto")
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "30"))  # مدة انتظار getUpdates عند عدم وجود تحديثات
+POLL_LIMIT = 100  # أقصى ما يسمح به getUpdates في الطلب الواحد
+# لا نطلب دفعة جديدة والطابور ممتلئ: المعالجة هي عنق الزجاجة لا الاستقبال
+POLL_MAX_BACKLOG = int(os.getenv("POLL_MAX_BACKLOG", "1000"))
+
+# سجل التحديثات الإلحاقي: الويبهوك يكتب فيه ويرد فورًا، والمعالجة تتم في الخلفية
+JOURNAL_PATH = os.getenv("UPDATE_JOURNAL_PATH", "updates.journal")
+JOURNAL_FSYNC = os.getenv("UPDATE_JOURNAL_FSYNC", "0") == "1"
+JOURNAL_COMPACT_BYTES = int(os.getenv("UPDATE_JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "5"))
+# عدد التحديثات التي تُعالج بالتوازي؛ تحديثات نفس المستخدم تبقى بترتيب وصولها
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+# منع التكرار: تيليجرام يعيد إرسال التحديث لو تأخر ردنا؛ نتذكر آخر UPDATE_DEDUP_WINDOW معرّف
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "4096"))
+# حفظ النافذة في مخزن الحالة كل UPDATE_DEDUP_PERSIST_INTERVAL ثانية (0 = بدون حفظ)
+UPDATE_DEDUP_PERSIST_INTERVAL = float(os.getenv("UPDATE_DEDUP_PERSIST_INTERVAL", "5"))
+
+# كاش صلاحيات المشرفين (chat_id, user_id) → مدة الصلاحية والحد الأقصى للعناصر
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "300"))
+ADMIN_CACHE_MAX = int(os.getenv("ADMIN_CACHE_MAX", "10000"))
+
+# قوائم مشرفي القنوات تُحدّث في الخلفية كل ROSTER_REFRESH_INTERVAL ثانية (بحد أقصى ADMIN_CACHE_MAX قناة، LRU)
+ROSTER_REFRESH_INTERVAL = int(os.getenv("ROSTER_REFRESH_INTERVAL", "600"))
+
+# نافذة دمج ضغطات التفاعل على نفس المنشور في تعديل أزرار واحد (ثوانٍ)
+REACTION_EDIT_WINDOW = float(os.getenv("REACTION_EDIT_WINDOW", "2.0"))
+
+# سجل منع التفاعل المكرر: المنشورات الخاملة تنتقل للقرص، والأقدم من الحد الأقصى تُحذف نهائيًا
+REACTION_HOT_SECONDS = int(os.getenv("REACTION_HOT_SECONDS", str(6 * 3600)))
+REACTION_DEDUP_MAX_AGE = int(os.getenv("REACTION_DEDUP_MAX_AGE", str(90 * 86400)))  # 0 = بلا حذف
+REACTION_SWEEP_INTERVAL = int(os.getenv("REACTION_SWEEP_INTERVAL", "300"))
+# فوق هذا العدد من المتفاعلين يتحول المنشور لـ Bloom filter (0 = معطّل)
+REACTION_BLOOM_THRESHOLD = int(os.getenv("REACTION_BLOOM_THRESHOLD", "0"))
+
+# حدود الإرسال: عام (رسالة/ث)، لكل محادثة خاصة (رسالة/ث)، لكل مجموعة/قناة (رسالة/دقيقة)
+RATE_LIMIT_GLOBAL = float(os.getenv("RATE_LIMIT_GLOBAL", "30"))
+RATE_LIMIT_PRIVATE = float(os.getenv("RATE_LIMIT_PRIVATE", "1"))
+RATE_LIMIT_GROUP_PER_MIN = float(os.getenv("RATE_LIMIT_GROUP_PER_MIN", "20"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+RATE_LIMIT_CHAT_BUCKETS_MAX = int(os.getenv("RATE_LIMIT_CHAT_BUCKETS_MAX", "5000"))
+
+# عدد الإرسالات المتزامنة عند إشعار مشرفي القناة
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+
+# النشر المجدول: المنشورات المستحقة في نفس الخانة الزمنية تُنشر كدفعة واحدة
+SCHEDULE_TZ = ZoneInfo(os.getenv("SCHEDULE_TZ", "Asia/Riyadh"))
+SCHEDULE_SLOT_SECONDS = int(os.getenv("SCHEDULE_SLOT_SECONDS", "60"))
+
+# الألبومات: تيليجرام يرسل كل عنصر كتحديث مستقل بنفس media_group_id؛ ننتظر هدوءًا قصيرًا ثم نؤكد
+ALBUM_COLLECT_WINDOW = float(os.getenv("ALBUM_COLLECT_WINDOW", "1.0"))
+ALBUM_MAX_ITEMS = 10  # حد sendMediaGroup
+ALBUM_COMPANION_TEXT = "⬆️ شاركنا رأيك في المنشور أعلاه"
+
+# مسودات الرد: جلسة لكل مشرف تنتهي تلقائيًا بعد REPLY_SESSION_TTL ثانية من آخر تعديل
+REPLY_SESSION_TTL = float(os.getenv("REPLY_SESSION_TTL", "900"))
+
+# مسودات النشر والاستفسارات المتروكة: تُحذف بعد SESSION_IDLE_TTL ثانية بلا نشاط،
+# ولو زاد عددها عن SESSION_MAX_ENTRIES لكل نوع يُحذف الأقدم نشاطًا أولًا (0 = بلا حد)
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "86400"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "5000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+# إزالة أزرار التحكم من رسائل المسودات المنتهية حتى لا يضغطها المستخدم على جلسة غير موجودة
+SESSION_STRIP_CONTROLS = os.getenv("SESSION_STRIP_CONTROLS", "1") == "1"
+# آخر نشاط يُكتب مرة كل دقيقة على الأكثر حتى لا تتحول كل رسالة لكتابة على القرص
+SESSION_TOUCH_INTERVAL = 60.0
+
+# قوالب الردود الجاهزة لكل قناة: عدد الأزرار في صفحة الاختيار والحدود عند الإضافة
+QUICK_REPLY_PAGE_SIZE = int(os.getenv("QUICK_REPLY_PAGE_SIZE", "8"))
+QUICK_REPLY_MAX_TEMPLATES = int(os.getenv("QUICK_REPLY_MAX_TEMPLATES", "50"))
+QUICK_REPLY_MAX_CHARS = 3500
+
+# صندوق الاستفسارات /inbox: عدد العناصر في الصفحة
+INBOX_PAGE_SIZE = int(os.getenv("INBOX_PAGE_SIZE", "5"))
+
+# /metrics: توكن اختياري (Authorization: Bearer ...) لو كان الرابط عامًا
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# تتبّع التحديثات البطيئة: ما يتجاوز SLOW_UPDATE_MS يُحفظ (أبطأ SLOW_TRACE_KEEP) في /debug/slow
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", "1000"))
+SLOW_TRACE_KEEP = int(os.getenv("SLOW_TRACE_KEEP", "20"))
+SLOW_UPDATE_PROFILE = os.getenv("SLOW_UPDATE_PROFILE", "0") == "1"  # cProfile لكل تحديث (مكلف؛ للتشخيص فقط)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")  # بدونه /debug/slow معطّل
+
+# أنواع التحديثات التي نطلبها من تيليجرام (chat_member لا يصل إلا إذا طُلب صراحةً)
+ALLOWED_UPDATES = ["message", "callback_query", "chat_member", "my_chat_member"]
+# ما عداها يُسقط قبل السجل وقبل بناء كائنات PTB (يجب أن تطابق الهاندلرات المسجّلة)
+HANDLED_UPDATE_TYPES = frozenset(ALLOWED_UPDATES)
+
+
+# مخزن الحالة: sqlite (يبقى بعد إعادة التشغيل) أو memory (السلوك القديم)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.db")
+# الكتابة المؤجلة: نجمع التعديلات ونكتبها دفعة واحدة كل STATE_FLUSH_INTERVAL ثانية أو عند الهدوء
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "1.0"))
+STATE_FLUSH_BATCH = int(os.getenv("STATE_FLUSH_BATCH", "500"))
+
+# التنسيق بين العمليات: local (عملية واحدة) أو sqlite (عدة workers على نفس الملف)
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local")
+COORDINATION_DB_PATH = os.getenv("COORDINATION_DB_PATH", STATE_DB_PATH)
+# مدة صلاحية القفل (ثوانٍ): قفل عملية ماتت يسقط بعدها تلقائيًا
+COORDINATION_LOCK_TTL = float(os.getenv("COORDINATION_LOCK_TTL", "60"))
+# أقصى انتظار لقفل قبل الفشل (أقفال المستخدمين تستمر في الانتظار مع تحذير بعد كل مهلة)
+COORDINATION_LOCK_WAIT = float(os.getenv("COORDINATION_LOCK_WAIT", "10"))
+# كل worker يحجز خانة (ملف سجل تحديثات خاص به) ويجددها دوريًا
+WORKER_SLOTS = int(os.getenv("WORKER_SLOTS", "32"))
+WORKER_LEASE_TTL = float(os.getenv("WORKER_LEASE_TTL", "30"))
+
+PROCESS_STARTED_AT = time.monotonic()
+
+# =========================
+# مخزن الحالة (ذاكرة / SQLite)
+# =========================
+def _state_default(o):
+    if isinstance(o, (set, frozenset)):
+        return {"__set__": list(o)}
+    raise TypeError(f"Object of type {type(o).__name__} is not state-serializable")
+
+def _state_hook(d: dict):
+    if len(d) == 1 and "__set__" in d:
+        return set(d["__set__"])
+    return d
+
+def encode_state(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_state_default)
+
+def decode_state(raw: str):
+    return json.loads(raw, object_hook=_state_hook)
+
+
+# مفاتيح الحالة التي لمسها التحديث الجاري (انظر SQLiteStateStore.scope)
+current_state_scope: ContextVar[set | None] = ContextVar("current_state_scope", default=None)
+
+
+class MemoryStateStore:
+    # السلوك القديم: كل شيء في ذاكرة العملية ويضيع مع إعادة التشغيل
+    backend = "memory"
+
+    def __init__(self):
+        self.stats = {"flushes": 0, "rows_written": 0, "flush_ms_total": 0.0, "last_flush_ms": 0.0}
+        self._blobs: dict[str, dict] = {}
+
+    def mapping(self, name: str) -> MutableMapping:
+        return {}
+
+    def blob_get(self, ns: str, key) -> str | None:
+        return self._blobs.get(ns, {}).get(key)
+
+    def blob_put_many(self, ns: str, items: list[tuple[object, str]]):
+        self._blobs.setdefault(ns, {}).update(items)
+
+    def blob_prune(self, ns: str, older_than: float) -> list:
+        blobs = self._blobs.get(ns, {})
+        stale = [k for k, raw in blobs.items() if json.loads(raw).get("t", 0) < older_than]
+        for k in stale:
+            del blobs[k]
+        return stale
+
+    def flush_due(self) -> bool:
+        return False
+
+    def flush(self):
+        pass
+
+    def scope(self):
+        return nullcontext()
+
+    def refresh(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PersistentMapping(MutableMapping):
+    # بديل مباشر لـ dict: يُحمّل كل مفتاح من SQLite عند أول وصول إليه فقط،
+    # وكل مفتاح يُلمس (قراءة أو كتابة) يُفحص عند التفريغ لأن القيم المتداخلة قد تتغير في مكانها.
+    def __init__(self, store: "SQLiteStateStore", name: str):
+        self._store = store
+        self._name = name
+        self._cache: dict = {}
+        self._written: dict = {}    # key → hash آخر قيمة كُتبت للقرص
+        self._missing: set = set()  # مفاتيح تأكدنا أنها غير موجودة في القرص
+        self._deleted: set = set()
+        self._loaded_all = False
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            self._store._touch(self, key)
+            return self._cache[key]
+        if self._loaded_all or key in self._missing or key in self._deleted:
+            raise KeyError(key)
+        raw = self._store._load(self._name, key)
+        if raw is None:
+            if len(self._missing) > 50_000:
+                self._missing.clear()
+            self._missing.add(key)
+            raise KeyError(key)
+        value = decode_state(raw)
+        self._cache[key] = value
+        self._written[key] = hash(raw)
+        self._store._touch(self, key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._cache[key] = value
+        self._missing.discard(key)
+        self._deleted.discard(key)
+        self._store._touch(self, key)
+
+    def __delitem__(self, key):
+        self[key]  # KeyError لو غير موجود
+        del self._cache[key]
+        self._deleted.add(key)
+        self._store._touch(self, key)
+
+    def _load_all(self):
+        if self._loaded_all:
+            return
+        for key, raw in self._store._load_namespace(self._name):
+            if key not in self._cache and key not in self._deleted:
+                self._cache[key] = decode_state(raw)
+                self._written[key] = hash(raw)
+        self._missing.clear()
+        self._loaded_all = True
+
+    def __iter__(self):
+        self._load_all()
+        return iter(list(self._cache))
+
+    def __len__(self):
+        self._load_all()
+        return len(self._cache)
+
+    def resident_count(self) -> int:
+        # عدد المفاتيح المحمّلة في الذاكرة فعلًا (len() تُحمّل النطاق كاملًا من القرص)
+        return len(self._cache)
+
+    def reload(self, key):
+        # يُسقط نسخة الذاكرة حتى لو لُمست، فيُقرأ المفتاح من القرص عند الوصول التالي (تحت قفل المفتاح: locked_state)
+        self._cache.pop(key, None)
+        self._written.pop(key, None)
+        self._missing.discard(key)
+        self._deleted.discard(key)
+        self._loaded_all = False
+
+    def forget(self, key):
+        # نُسقط مفتاحًا مطابقًا للقرص من الذاكرة فقط؛ يُحمّل من جديد عند أول وصول
+        if (self._name, key) in self._store._touched:
+            return
+        self._cache.pop(key, None)
+        self._written.pop(key, None)
+        self._loaded_all = False
+
+    def _reset(self):
+        # بعد التفريغ فقط: كل ما في الذاكرة مطابق للقرص فنُسقطه ليُقرأ من جديد
+        self._cache.clear()
+        self._written.clear()
+        self._missing.clear()
+        self._loaded_all = False
+
+    def _collect(self, key) -> tuple[object, str | None, int | None] | None:
+        # يرجع (key, json, hash) للكتابة، (key, None, None) للحذف، أو None لو لم يتغير شيء.
+        # لا يغيّر شيئًا: ما كُتب يُسجَّل في _mark_written بعد نجاح COMMIT فقط
+        if key in self._cache:
+            raw = encode_state(self._cache[key])
+            digest = hash(raw)
+            if self._written.get(key) == digest:
+                return None
+            return key, raw, digest
+        if key in self._deleted:
+            return key, None, None
+        return None
+
+    def _mark_written(self, key, digest: int | None):
+        if digest is None:
+            self._deleted.discard(key)
+            self._written.pop(key, None)
+        else:
+            self._written[key] = digest
+
+
+class SQLiteStateStore:
+    backend = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._mappings: dict[str, PersistentMapping] = {}
+        self._touched: set[tuple[str, object]] = set()  # (namespace, key)
+        self._scopes: dict[int, set] = {}  # مفاتيح كل تحديث قيد المعالجة
+        self._last_flush = time.monotonic()
+        self.stats = {"flushes": 0, "rows_written": 0, "flush_ms_total": 0.0, "last_flush_ms": 0.0}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # نفتح الاتصال عند أول استخدام لا عند الاستيراد
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # عدة workers على نفس الملف: ننتظر قفل الكتابة بدل الفشل فورًا
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+            )
+        return self._conn
+
+    def mapping(self, name: str) -> PersistentMapping:
+        if name not in self._mappings:
+            self._mappings[name] = PersistentMapping(self, name)
+        return self._mappings[name]
+
+    def _touch(self, mapping: PersistentMapping, key):
+        self._touched.add((mapping._name, key))
+        keys = current_state_scope.get()
+        if keys is not None:
+            keys.add((mapping._name, key))
+
+    @contextmanager
+    def scope(self):
+        # التحديثات تُعالج بالتوازي فقد يحدث التفريغ وهاندلر ما زال يمسك قيمة ويعدّلها بعد await:
+        # مفاتيح التحديث الجاري تبقى معلّمة بعد كل تفريغ، وتُعلَّم مرة أخيرة عند انتهائه
+        keys: set[tuple[str, object]] = set()
+        token = current_state_scope.set(keys)
+        self._scopes[id(keys)] = keys
+        try:
+            yield
+        finally:
+            current_state_scope.reset(token)
+            del self._scopes[id(keys)]
+            self._touched |= keys
+
+    def _load(self, ns: str, key) -> str | None:
+        row = self.conn.execute(
+            "SELECT value FROM kv WHERE ns = ? AND key = ?", (ns, json.dumps(key))
+        ).fetchone()
+        return row[0] if row else None
+
+    def _load_namespace(self, ns: str):
+        for key, raw in self.conn.execute("SELECT key, value FROM kv WHERE ns = ?", (ns,)):
+            yield json.loads(key), raw
+
+    # قيم خام تُكتب فورًا بلا كاش في الذاكرة (للطبقة الباردة)
+    def blob_get(self, ns: str, key) -> str | None:
+        return self._load(ns, key)
+
+    def blob_put_many(self, ns: str, items: list[tuple[object, str]]):
+        self.conn.executemany(
+            "INSERT INTO kv (ns, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value",
+            [(ns, json.dumps(k), raw) for k, raw in items],
+        )
+
+    def blob_prune(self, ns: str, older_than: float) -> list:
+        rows = self.conn.execute(
+            "SELECT key FROM kv WHERE ns = ? AND json_extract(value, '$.t') < ?", (ns, older_than)
+        ).fetchall()
+        self.conn.executemany("DELETE FROM kv WHERE ns = ? AND key = ?", [(ns, r[0]) for r in rows])
+        return [json.loads(r[0]) for r in rows]
+
+    def flush_due(self) -> bool:
+        return bool(self._touched) and (
+            len(self._touched) >= STATE_FLUSH_BATCH
+            or time.monotonic() - self._last_flush >= STATE_FLUSH_INTERVAL
+        )
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._touched:
+            return
+        t0 = time.perf_counter()
+        upserts, deletes, written = [], [], []
+        for ns, key in self._touched:
+            mapping = self._mappings[ns]
+            change = mapping._collect(key)
+            if change is None:
+                continue
+            k, raw, digest = change
+            written.append((mapping, k, digest))
+            if raw is None:
+                deletes.append((ns, json.dumps(k)))
+            else:
+                upserts.append((ns, json.dumps(k), raw))
+
+        # لو فشلت الكتابة يبقى كل شيء كما كان (المفاتيح معلّمة و_written القديم) فتُعاد في التفريغ التالي
+        if upserts or deletes:
+            conn = self.conn
+            conn.execute("BEGIN")
+            try:
+                if upserts:
+                    conn.executemany(
+                        "INSERT INTO kv (ns, key, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value",
+                        upserts,
+                    )
+                if deletes:
+                    conn.executemany("DELETE FROM kv WHERE ns = ? AND key = ?", deletes)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        for mapping, k, digest in written:
+            mapping._mark_written(k, digest)
+        self._touched.clear()
+        for keys in self._scopes.values():
+            self._touched |= keys
+
+        elapsed = (time.perf_counter() - t0) * 1000
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(upserts) + len(deletes)
+        self.stats["flush_ms_total"] += elapsed
+        self.stats["last_flush_ms"] = elapsed
+
+    def refresh(self):
+        # وضع الحالة المشتركة: عمليات أخرى تكتب في نفس الملف، فنكتب تعديلاتنا ثم نقرأ من جديد
+        self.flush()
+        for mapping in self._mappings.values():
+            mapping._reset()
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+
+state_store = SQLiteStateStore(STATE_DB_PATH) if STATE_BACKEND == "sqlite" else MemoryStateStore()
+
+# =========================
+# التنسيق بين الـ workers (أقفال بمدة صلاحية + تسجيل لمرة واحدة + عدّادات ذرّية)
+# =========================
+class LocalCoordinator:
+    # عملية واحدة: نفس الواجهة في الذاكرة، والعدّادات في مخزن الحالة حتى تبقى بعد إعادة التشغيل
+    backend = "local"
+    shared = False
+
+    def __init__(self, store):
+        self._locks: dict[str, tuple[str, float]] = {}
+        self._once: dict[str, dict] = {}
+        self._counters = store.mapping("counters")
+        self._tokens = itertools.count(1)
+
+    def acquire(self, name: str, ttl: float) -> str | None:
+        now = time.time()
+        held = self._locks.get(name)
+        if held and held[1] > now:
+            return None
+        token = str(next(self._tokens))
+        self._locks[name] = (token, now + ttl)
+        return token
+
+    def renew(self, name: str, token: str, ttl: float) -> bool:
+        held = self._locks.get(name)
+        if not held or held[0] != token:
+            return False
+        self._locks[name] = (token, time.time() + ttl)
+        return True
+
+    def release(self, name: str, token: str):
+        held = self._locks.get(name)
+        if held and held[0] == token:
+            del self._locks[name]
+
+    def add_once(self, name: str, member) -> bool:
+        members = self._once.setdefault(name, {})
+        if member in members:
+            return False
+        members[member] = time.time()
+        return True
+
+    def discard_once(self, name: str, member):
+        self._once.get(name, {}).pop(member, None)
+
+    def incr(self, name: str, by: int = 1, initial: int = 0) -> int:
+        self._counters[name] = self._counters.get(name, initial) + by
+        return self._counters[name]
+
+    def counter(self, name: str) -> int | None:
+        return self._counters.get(name)
+
+    def prune(self, prefix: str, older_than: float) -> int:
+        stale = [name for name in self._once if name.startswith(prefix)
+                 and max(self._once[name].values(), default=0) < older_than]
+        for name in stale:
+            del self._once[name]
+        self.purge_locks()
+        return len(stale)
+
+    def purge_locks(self) -> int:
+        # أقفال انتهت صلاحيتها ولم تُحرَّر (العملية سقطت أو أُلغيت المهمة)
+        now = time.time()
+        expired = [n for n, (_, expires_at) in self._locks.items() if expires_at <= now]
+        for name in expired:
+            del self._locks[name]
+        return len(expired)
+
+    def close(self):
+        pass
+
+
+class SQLiteCoordinator:
+    # عدة workers على نفس الجهاز: ملف SQLite مشترك وكل عملية ذرّية في جملة SQL واحدة
+    backend = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._conn: sqlite3.Connection | None = None
+        self._tokens = itertools.count(1)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS coord_locks ("
+                " name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS coord_once ("
+                " name TEXT NOT NULL, member TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (name, member)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS coord_counters ("
+                " name TEXT PRIMARY KEY, value INTEGER NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID;"
+            )
+        return self._conn
+
+    def acquire(self, name: str, ttl: float) -> str | None:
+        # نأخذ القفل لو كان حرًّا أو انتهت صلاحيته (صاحبه مات أو تأخر)
+        token = f"{self.owner}:{next(self._tokens)}"
+        now = time.time()
+        cur = self.conn.execute(
+            "INSERT INTO coord_locks (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE coord_locks.expires_at <= ?",
+            (name, token, now + ttl, now),
+        )
+        return token if cur.rowcount else None
+
+    def renew(self, name: str, token: str, ttl: float) -> bool:
+        cur = self.conn.execute(
+            "UPDATE coord_locks SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl, name, token),
+        )
+        return bool(cur.rowcount)
+
+    def release(self, name: str, token: str):
+        self.conn.execute("DELETE FROM coord_locks WHERE name = ? AND owner = ?", (name, token))
+
+    def add_once(self, name: str, member) -> bool:
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO coord_once (name, member, created_at) VALUES (?, ?, ?)",
+            (name, str(member), time.time()),
+        )
+        return bool(cur.rowcount)
+
+    def discard_once(self, name: str, member):
+        self.conn.execute("DELETE FROM coord_once WHERE name = ? AND member = ?", (name, str(member)))
+
+    def incr(self, name: str, by: int = 1, initial: int = 0) -> int:
+        # initial يُستخدم فقط لو لم يوجد العدّاد بعد (مثلًا: الأرقام المكتوبة على الأزرار)
+        return self.conn.execute(
+            "INSERT INTO coord_counters (name, value, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + ?, updated_at = excluded.updated_at "
+            "RETURNING value",
+            (name, initial + by, time.time(), by),
+        ).fetchone()[0]
+
+    def counter(self, name: str) -> int | None:
+        row = self.conn.execute("SELECT value FROM coord_counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def prune(self, prefix: str, older_than: float) -> int:
+        conn = self.conn
+        n = len(prefix)
+        removed = conn.execute(
+            "DELETE FROM coord_once WHERE substr(name, 1, ?) = ? AND created_at < ?", (n, prefix, older_than)
+        ).rowcount
+        conn.execute(
+            "DELETE FROM coord_counters WHERE substr(name, 1, ?) = ? AND updated_at < ?", (n, prefix, older_than)
+        )
+        self.purge_locks()
+        return removed
+
+    def purge_locks(self) -> int:
+        return self.conn.execute("DELETE FROM coord_locks WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+if COORDINATION_BACKEND == "sqlite":
+    if state_store.backend != "sqlite":
+        raise RuntimeError("COORDINATION_BACKEND=sqlite requires STATE_BACKEND=sqlite (shared state file)")
+    coordinator = SQLiteCoordinator(COORDINATION_DB_PATH)
+else:
+    coordinator = LocalCoordinator(state_store)
+
+# يمنع تحديث الحالة من الخارج (مهام المجدول) أثناء معالجة تحديث في نفس العملية
+state_guard = asyncio.Lock()
+
+class CoordinationLockTimeout(RuntimeError):
+    pass
+
+@asynccontextmanager
+async def coordination_lock(name: str, ttl: float = COORDINATION_LOCK_TTL, wait: float = COORDINATION_LOCK_WAIT,
+                            retry: bool = False):
+    # لا نكمل بدون القفل أبدًا: بعد wait ثانية نفشل (CoordinationLockTimeout)، أو مع retry نحذّر ونواصل الانتظار.
+    # الأقفال بمدة صلاحية، فقفل عملية ماتت يتحرر خلال ttl على الأكثر
+    scope = name.split(":", 1)[0]
+    started = time.perf_counter()
+    deadline = started + wait
+    token = coordinator.acquire(name, ttl)
+    delay = 0.005
+    while token is None:
+        if time.perf_counter() >= deadline:
+            LOCK_TIMEOUTS.inc(scope)
+            if not retry:
+                LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, scope)
+                raise CoordinationLockTimeout(f"lock {name} not acquired within {wait:.1f}s")
+            logging.warning("[COORD] lock %s still busy after %.1fs; waiting", name, time.perf_counter() - started)
+            deadline += wait
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+        token = coordinator.acquire(name, ttl)
+    LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, scope)
+    try:
+        yield token
+    finally:
+        coordinator.release(name, token)
+
+@asynccontextmanager
+async def fresh_state():
+    # الحالة المشتركة: ننتظر انتهاء التحديث الجاري ثم نقرأ ما كتبته العمليات الأخرى ونكتب تعديلاتنا فور الانتهاء
+    if not coordinator.shared:
+        yield
+        return
+    async with state_guard:
+        state_store.refresh()
+        try:
+            yield
+        finally:
+            state_store.flush()
+
+@asynccontextmanager
+async def locked_state(mapping, key):
+    # مفاتيح يكتبها أكثر من مستخدم (المنشورات المجدولة، قوالب القناة): fresh_state يقرأ المفتاح في بداية التحديث
+    # ويكتبه كاملًا في نهايته، فتعديلان متزامنان من workerين يضيع أحدهما.
+    # داخل fresh_state: نأخذ قفل المفتاح، نقرأه من القرص من جديد، ونكتبه قبل تحرير القفل
+    if not coordinator.shared:
+        yield
+        return
+    async with coordination_lock(f"state:{mapping._name}:{key}"):
+        mapping.reload(key)
+        try:
+            yield
+        finally:
+            state_store.flush()
+
+# =========================
+# مخزن الاستفسارات (معرّف ثابت + فهارس)
+# =========================
+# المعرّف يتزايد مع الزمن، لذا ترتيب المعرّف = ترتيب الوصول والصفحات تُقطع بالمعرّف (keyset)
+INQUIRY_PENDING = "pending"
+INQUIRY_ANSWERED = "answered"
+
+
+class MemoryInquiryStore:
+    def __init__(self):
+        self._records: dict[int, dict] = {}
+        self._next_id = 1
+        self._by_status: dict[tuple, list[int]] = {}  # (source_chat_id, status) → معرّفات مرتبة
+        self._by_post: dict[tuple, int] = {}          # (source_chat_id, post_message_id, user_id) → معرّف
+        self._by_user: dict[int, list[int]] = {}
+
+    def add(self, record: dict) -> int | None:
+        # None لو سبق للمستخدم استفسار على نفس المنشور
+        post_key = (record.get("source_chat_id"), record.get("post_message_id"), record["user_id"])
+        if record.get("post_message_id") is not None and post_key in self._by_post:
+            return None
+        inq_id = self._next_id
+        self._next_id += 1
+        self._records[inq_id] = {**record, "id": inq_id}
+        self._by_status.setdefault((record.get("source_chat_id"), record["status"]), []).append(inq_id)
+        if record.get("post_message_id") is not None:
+            self._by_post[post_key] = inq_id
+        self._by_user.setdefault(record["user_id"], []).append(inq_id)
+        return inq_id
+
+    def get(self, inq_id: int) -> dict | None:
+        record = self._records.get(inq_id)
+        return dict(record) if record else None
+
+    def update(self, inq_id: int, **fields):
+        record = self._records.get(inq_id)
+        if record is None:
+            return
+        old_status = record["status"]
+        record.update(fields)
+        if record["status"] != old_status:
+            ids = self._by_status[(record.get("source_chat_id"), old_status)]
+            del ids[bisect_left(ids, inq_id)]
+            new_ids = self._by_status.setdefault((record.get("source_chat_id"), record["status"]), [])
+            new_ids.insert(bisect_left(new_ids, inq_id), inq_id)
+
+    def exists_for_post(self, user_id: int, source_chat_id: int, post_message_id: int) -> bool:
+        return (source_chat_id, post_message_id, user_id) in self._by_post
+
+    def latest_for_user(self, user_id: int) -> dict | None:
+        ids = self._by_user.get(user_id)
+        return self.get(ids[-1]) if ids else None
+
+    def page(self, source_chat_id: int, status: str, before: int | None = None,
+             after: int | None = None, limit: int = INBOX_PAGE_SIZE) -> list[dict]:
+        # الأحدث أولًا؛ before/after مؤشرا الصفحة التالية/السابقة
+        ids = self._by_status.get((source_chat_id, status), [])
+        if after is not None:
+            i = bisect_right(ids, after)
+            chunk = ids[i:i + limit]
+        else:
+            j = bisect_left(ids, before) if before is not None else len(ids)
+            chunk = ids[max(0, j - limit):j]
+        return [self.get(inq_id) for inq_id in reversed(chunk)]
+
+
+class SQLiteInquiryStore:
+    # جدول مستقل بجانب kv: الأعمدة المفهرسة منفصلة وبقية السجل JSON
+    def __init__(self, store: SQLiteStateStore):
+        self.store = store
+        self._ready = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = self.store.conn
+        if not self._ready:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS inquiries ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id INTEGER NOT NULL, source_chat_id INTEGER, post_message_id INTEGER,"
+                " status TEXT NOT NULL, created_at REAL NOT NULL, data TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS inquiries_inbox ON inquiries (source_chat_id, status, id);"
+                "CREATE UNIQUE INDEX IF NOT EXISTS inquiries_post ON inquiries"
+                " (source_chat_id, post_message_id, user_id) WHERE post_message_id IS NOT NULL;"
+                "CREATE INDEX IF NOT EXISTS inquiries_user ON inquiries (user_id, id);"
+                "CREATE INDEX IF NOT EXISTS inquiries_created ON inquiries (created_at);"
+            )
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def _row(row) -> dict | None:
+        if row is None:
+            return None
+        record = decode_state(row[2])
+        record["id"], record["status"] = row[0], row[1]
+        return record
+
+    def add(self, record: dict) -> int | None:
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO inquiries"
+            " (user_id, source_chat_id, post_message_id, status, created_at, data)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (record["user_id"], record.get("source_chat_id"), record.get("post_message_id"),
+             record["status"], time.time(), encode_state(record)),
+        )
+        return cur.lastrowid if cur.rowcount else None
+
+    def get(self, inq_id: int) -> dict | None:
+        return self._row(self.conn.execute(
+            "SELECT id, status, data FROM inquiries WHERE id = ?", (inq_id,)
+        ).fetchone())
+
+    def update(self, inq_id: int, **fields):
+        record = self.get(inq_id)
+        if record is None:
+            return
+        record.update(fields)
+        self.conn.execute(
+            "UPDATE inquiries SET status = ?, data = ? WHERE id = ?",
+            (record["status"], encode_state(record), inq_id),
+        )
+
+    def exists_for_post(self, user_id: int, source_chat_id: int, post_message_id: int) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM inquiries WHERE source_chat_id = ? AND post_message_id = ? AND user_id = ?",
+            (source_chat_id, post_message_id, user_id),
+        ).fetchone() is not None
+
+    def latest_for_user(self, user_id: int) -> dict | None:
+        return self._row(self.conn.execute(
+            "SELECT id, status, data FROM inquiries WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone())
+
+    def page(self, source_chat_id: int, status: str, before: int | None = None,
+             after: int | None = None, limit: int = INBOX_PAGE_SIZE) -> list[dict]:
+        if after is not None:
+            rows = self.conn.execute(
+                "SELECT id, status, data FROM inquiries WHERE source_chat_id = ? AND status = ? AND id > ?"
+                " ORDER BY id ASC LIMIT ?", (source_chat_id, status, after, limit),
+            ).fetchall()
+            rows.reverse()
+        else:
+            rows = self.conn.execute(
+                "SELECT id, status, data FROM inquiries WHERE source_chat_id = ? AND status = ? AND id < ?"
+                " ORDER BY id DESC LIMIT ?",
+                (source_chat_id, status, before if before is not None else 1 << 62, limit),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+
+inquiry_store = SQLiteInquiryStore(state_store) if state_store.backend == "sqlite" else MemoryInquiryStore()
+
+def migrate_legacy_inquiries():
+    # الشكل القديم: bot_data["inquiries"] بمفتاح المستخدم (استفسار واحد لكل مستخدم)
+    legacy = state_store.mapping("inquiries")
+    for uid in list(legacy):
+        record = legacy.pop(uid)
+        record.setdefault("user_id", uid)
+        record["status"] = INQUIRY_ANSWERED if record.get("handled_by") else INQUIRY_PENDING
+        inquiry_store.add(record)
+    records = state_store.mapping("inquiry_records")
+    for key in list(records):
+        del records[key]
+    state_store.flush()
+
+def inquiry_ref(inq_id: int) -> str:
+    return f"i{inq_id}"
+
+def resolve_inquiry(ref: str) -> dict | None:
+    # الأزرار الجديدة تحمل معرّف الاستفسار (i123)؛ القديمة تحمل معرّف المستخدم → آخر استفسار له
+    if ref.startswith("i") and ref[1:].isdigit():
+        return inquiry_store.get(int(ref[1:]))
+    if ref.isdigit():
+        return inquiry_store.latest_for_user(int(ref))
+    return None
 
 # جلسات العمل
-admin_sessions: dict[int, dict] = {}   # جلسات النشر لكل مشرف (target_channel_id يُخزَّن هنا بعد الربط)
-admin_inquiries: dict[int, dict] = {}  # جلسات الاستفسار لكل مستخدم
+admin_sessions: MutableMapping[int, dict] = state_store.mapping("admin_sessions")    # جلسات النشر لكل مشرف (target_channel_id يُخزَّن هنا بعد الربط)
+admin_inquiries: MutableMapping[int, dict] = state_store.mapping("admin_inquiries")  # جلسات الاستفسار لكل مستخدم
+reply_sessions: MutableMapping[int, dict] = state_store.mapping("reply_sessions")    # مسودات الرد لكل مشرف
+quick_reply_pickers: MutableMapping[str, dict] = state_store.mapping("quick_reply_pickers")  # "chat:msg" → الاستفسار الذي فُتحت له قائمة الردود
+
+# =========================
+# قوالب جاهزة تُبنى مرة واحدة (أنماط + أزرار ثابتة)
+# =========================
+LINK_RE = re.compile(r'(https?://\S+)')
+JOP_RE = re.compile(r"\s*jop\s*", flags=re.IGNORECASE)
+REACTION_COUNT_RE = re.compile(r"(\d+)\s*$")
+
+DONE_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("✅ تم", callback_data="admin_done_input")]])
+REACTIONS_CHOICE_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("✅ نعم", callback_data="set_reactions_yes"),
+        InlineKeyboardButton("❌ لا", callback_data="set_reactions_no")
+    ]
+])
+PREVIEW_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("✅ المعاينة", callback_data="preview_post")]])
+PUBLISH_CONTROLS_ROW = (
+    InlineKeyboardButton("✅ نشر", callback_data="confirm_publish"),
+    InlineKeyboardButton("🕒 جدولة", callback_data="schedule_publish"),
+    InlineKeyboardButton("❌ إلغاء", callback_data="cancel_publish"),
+)
+PUBLISH_KEYBOARD = InlineKeyboardMarkup([PUBLISH_CONTROLS_ROW])
+PUBLISH_WITH_REACTIONS_KEYBOARD = InlineKeyboardMarkup([
+    (
+        InlineKeyboardButton("😍 إعجاب", callback_data="none"),
+        InlineKeyboardButton("😐 لا يعجبني", callback_data="none")
+    ),
+    PUBLISH_CONTROLS_ROW,
+])
+INITIAL_REACTIONS_ROW = (
+    InlineKeyboardButton("😍 0", callback_data="like"),
+    InlineKeyboardButton("😐  0", callback_data="dislike")
+)
+INQUIRY_SEND_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📤 إرسال", callback_data="send_inquiry")],
+    [InlineKeyboardButton("❌ إلغاء", callback_data="cancel_inquiry")]
+])
+REPLY_SEND_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📤 إرسال الرد", callback_data="send_custom_reply")],
+    [InlineKeyboardButton("❌ إلغاء", callback_data="cancel_reply")]
+])
+
+# يُملأ في warm_up() عند التشغيل: اسم البوت وقالب رابط "رفع ملاحظة"
+BOT_USERNAME: str | None = None
+INQUIRY_LINK_TEMPLATE: str | None = None
 
 # =========================
 # أدوات مساعدة
@@ -63,7 +987,22 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     sess = admin_sessions.get(uid)
     await update.message.reply_text(
         f"session_open: {bool(sess and sess.get('awaiting_input'))}\n"
-        f"target_channel_id: {sess.get('target_channel_id') if sess else None}"
+        f"target_channel_id: {sess.get('target_channel_id') if sess else None}\n"
+        f"destinations: {len(destination_ids(sess)) if sess else 0}\n"
+        f"admin_cache: size={len(admin_cache)} hits={admin_cache_stats['hits']} "
+        f"misses={admin_cache_stats['misses']} invalidations={admin_cache_stats['invalidations']}\n"
+        f"state: backend={state_store.backend} flushes={state_store.stats['flushes']} "
+        f"rows={state_store.stats['rows_written']} last_flush_ms={state_store.stats['last_flush_ms']:.2f} "
+        f"write_ms_per_update={state_store.stats['flush_ms_total'] / max(1, updates_processed):.3f}\n"
+        f"coordination: backend={coordinator.backend} worker_slot={worker_slot}\n"
+        f"sessions: drafts={session_live_counts.get('admin_sessions', '-')} "
+        f"inquiries={session_live_counts.get('admin_inquiries', '-')} idle_ttl={SESSION_IDLE_TTL:.0f}s "
+        f"max={SESSION_MAX_ENTRIES}\n"
+        f"reactions: clicks={reaction_edit_stats['clicks']} edits={reaction_edit_stats['edits']} "
+        f"hot_posts={len(reaction_dedup.hot)} rolled_cold={reaction_dedup.stats['rolled_cold']} "
+        f"evicted={reaction_dedup.stats['evicted']}\n"
+        f"rate: requests={rate_limiter.stats['requests']} queued={rate_limiter.stats['queued']} "
+        f"retry_after={rate_limiter.stats['retry_after']} gave_up={rate_limiter.stats['gave_up']}"
     )
 
 async def reset_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -72,26 +1011,166 @@ async def reset_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not sess:
         await update.message.reply_text("لا توجد جلسة نشر حالية.")
         return
-    target = sess.get("target_channel_id")
-    admin_sessions[uid] = {"target_channel_id": target} if target else {}
+    admin_sessions[uid] = binding_of(sess) if sess.get("target_channel_id") else {}
     await update.message.reply_text("✅ تم إنهاء جلسة النشر. اكتب jop لبدء جلسة جديدة.")
 
 def auto_hide_links(text: str) -> str:
-    return re.sub(r'(https?://\S+)', r'<a href="\1">اضغط هنا</a>', text or "")
-
-async def get_bot_username(context: ContextTypes.DEFAULT_TYPE) -> str:
-    me = await context.bot.get_me()
-    return me.username
+    return LINK_RE.sub(r'<a href="\1">اضغط هنا</a>', text or "")
+
+async def get_inquiry_link(bot, chat_id: int, message_id: int) -> str:
+    global BOT_USERNAME
+    if not INQUIRY_LINK_TEMPLATE:
+        if not BOT_USERNAME:
+            BOT_USERNAME = (await bot.get_me()).username
+        build_link_templates()
+    return INQUIRY_LINK_TEMPLATE.format(chat_id=chat_id, message_id=message_id)
+
+def build_link_templates():
+    global INQUIRY_LINK_TEMPLATE
+    INQUIRY_LINK_TEMPLATE = f"https://t.me/{BOT_USERNAME}?start=inq_{{chat_id}}_{{message_id}}"
+
+async def warm_up():
+    # كل ما لا يتغير طوال عمر العملية نجهّزه مرة واحدة قبل استقبال التحديثات
+    global BOT_USERNAME
+    t0 = time.perf_counter()
+    # initialize() جلب هوية البوت عبر get_me مسبقًا
+    BOT_USERNAME = application.bot.username
+    build_link_templates()
+    logging.info("[WARMUP] bot=@%s ready in %.1f ms", BOT_USERNAME, (time.perf_counter() - t0) * 1000)
+
+# كاش نتائج get_chat_member: (chat_id, user_id) → (is_admin, expires_at)
+admin_cache: OrderedDict[tuple[int, int], tuple[bool, float]] = OrderedDict()
+admin_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
 
 async def is_admin_in_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int | None, user_id: int) -> bool:
     if not chat_id:
         return False
+
+    key = (chat_id, user_id)
+    cached = admin_cache.get(key)
+    if cached and cached[1] > time.monotonic():
+        admin_cache.move_to_end(key)
+        admin_cache_stats["hits"] += 1
+        return cached[0]
+
+    admin_cache_stats["misses"] += 1
     try:
         m = await context.bot.get_chat_member(chat_id, user_id)
-        return m.status in ("administrator", "creator")
     except Exception:
+        # خطأ عابر (شبكة/صلاحيات البوت) → لا نخزّنه
         return False
 
+    is_admin = m.status in ("administrator", "creator")
+    remember_admin_status(chat_id, user_id, is_admin)
+    return is_admin
+
+def remember_admin_status(chat_id: int, user_id: int, is_admin: bool):
+    key = (chat_id, user_id)
+    admin_cache[key] = (is_admin, time.monotonic() + ADMIN_CACHE_TTL)
+    admin_cache.move_to_end(key)
+    while len(admin_cache) > ADMIN_CACHE_MAX:
+        admin_cache.popitem(last=False)
+        admin_cache_stats["evictions"] += 1
+
+def invalidate_admin_cache(chat_id: int, user_id: int | None = None):
+    # user_id=None → نُسقط كل مدخلات هذه المحادثة
+    if user_id is not None:
+        if admin_cache.pop((chat_id, user_id), None) is not None:
+            admin_cache_stats["invalidations"] += 1
+        return
+    for key in [k for k in admin_cache if k[0] == chat_id]:
+        del admin_cache[key]
+        admin_cache_stats["invalidations"] += 1
+
+# قوائم المشرفين لكل قناة/مجموعة: chat_id → [user_id, ...] (بدون البوتات)، الأقدم استخدامًا أولًا
+admin_rosters: OrderedDict[int, list[int]] = OrderedDict()
+# المجدول يُنشأ عند أول استخدام: استيراد APScheduler وحده ~40ms من زمن الإقلاع البارد
+scheduler = None
+
+def get_scheduler():
+    global scheduler
+    if scheduler is None:
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        scheduler = AsyncIOScheduler()
+    return scheduler
+
+async def fetch_admin_roster(bot, chat_id: int) -> list[int]:
+    admins = await bot.get_chat_administrators(chat_id)
+    admin_ids = [m.user.id for m in admins if not m.user.is_bot]
+    # التحديث الدوري لا يغيّر موضع القناة؛ الاستخدام فقط (get_admin_ids) يجعلها الأحدث
+    admin_rosters[chat_id] = admin_ids
+    while len(admin_rosters) > ADMIN_CACHE_MAX:
+        admin_rosters.popitem(last=False)
+    # كل من في القائمة مشرف مؤكد → نغذّي كاش الإشراف مجانًا
+    for aid in admin_ids:
+        remember_admin_status(chat_id, aid, True)
+    return admin_ids
+
+async def get_admin_ids(bot, chat_id: int) -> list[int]:
+    admin_ids = admin_rosters.get(chat_id)
+    if admin_ids is not None:
+        admin_rosters.move_to_end(chat_id)
+        return admin_ids
+    try:
+        return await fetch_admin_roster(bot, chat_id)
+    except Exception as e:
+        logging.error(f"خطأ في جلب قائمة المشرفين ديناميكيًا: {e}")
+        return []
+
+def prefetch_admin_roster(context: ContextTypes.DEFAULT_TYPE, chat_id: int | None):
+    # نجهّز القائمة مسبقًا حتى لا ينتظر إشعار الاستفسار جلبها
+    if chat_id and chat_id not in admin_rosters:
+        context.application.create_task(get_admin_ids(context.bot, chat_id))
+
+async def refresh_admin_rosters():
+    for chat_id in list(admin_rosters):
+        try:
+            await fetch_admin_roster(application.bot, chat_id)
+        except (BadRequest, Forbidden) as e:
+            # البوت أُزيل أو المحادثة حُذفت (بدون my_chat_member يصلنا): لن تنجح لاحقًا، تُجلب من جديد عند الحاجة
+            admin_rosters.pop(chat_id, None)
+            logging.warning(f"[ADMINS] أُسقطت قائمة مشرفي {chat_id}: {e}")
+        except Exception as e:
+            logging.error(f"[ADMINS] فشل تحديث قائمة مشرفي {chat_id}: {e}")
+
+async def handle_chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cmu = update.chat_member or update.my_chat_member
+    if not cmu:
+        return
+
+    admin_statuses = ("administrator", "creator")
+    was_admin = cmu.old_chat_member.status in admin_statuses
+    is_admin = cmu.new_chat_member.status in admin_statuses
+    if was_admin == is_admin:
+        return
+
+    chat_id = cmu.chat.id
+    logging.info(f"[ADMINS] تغيّر إشراف user={cmu.new_chat_member.user.id} chat={chat_id}: {was_admin} → {is_admin}")
+    if update.my_chat_member:
+        # تغيّرت صلاحية البوت نفسه → كل نتائج هذه المحادثة لم تعد موثوقة
+        invalidate_admin_cache(chat_id)
+    else:
+        invalidate_admin_cache(chat_id, cmu.new_chat_member.user.id)
+
+    # قائمة المشرفين تغيّرت → نعيد جلبها في الخلفية
+    if admin_rosters.pop(chat_id, None) is not None:
+        prefetch_admin_roster(context, chat_id)
+
+def binding_of(session: dict | None) -> dict:
+    # ما يبقى من الجلسة بعد النشر/الإلغاء: الوجهة الأساسية + الوجهات الإضافية
+    session = session or {}
+    binding = {"target_channel_id": session.get("target_channel_id")}
+    if session.get("destinations"):
+        binding["destinations"] = session["destinations"]
+    return binding
+
+def destination_ids(session: dict) -> list[int]:
+    ids = [session["target_channel_id"]] if session.get("target_channel_id") else []
+    for dest in session.get("destinations") or []:
+        if dest["id"] not in ids:
+            ids.append(dest["id"])
+    return ids
+
 # =========================
 # ربط قناة/مجموعة الهدف للنشر (بدون /bind_here)
 # عبر إعادة توجيه منشور من القناة/المجموعة للخاص مع البوت
@@ -115,10 +1194,10 @@ async def handle_jop_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # افتح جلسة جديدة
     admin_sessions[user.id] = {
+        **binding_of(sess),
         "text": None,
         "media": None,
         "awaiting_input": True,
-        "target_channel_id": target,
         "controls_msg_id": None,
         "controls_chat_id": None,
     }
@@ -163,6 +1242,7 @@ async def bind_by_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     sess = admin_sessions.setdefault(update.effective_user.id, {})
     sess["target_channel_id"] = chat.id
+    prefetch_admin_roster(context, chat.id)
     await update.message.reply_text(f"✅ تم الربط بهذه الوجهة للنشر.\nID: {chat.id}")
 
 async def bind_from_forward(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -252,8 +1332,388 @@ async def bind_from_forward(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # احفظ الربط
     sess = admin_sessions.setdefault(user.id, {})
     sess["target_channel_id"] = fchat.id
+    prefetch_admin_roster(context, fchat.id)
     await msg.reply_text(f"✅ تم الربط بهذه الوجهة للنشر.\nID: {fchat.id}")
 
+# =========================
+# وجهات نشر إضافية (نفس المنشور لعدة قنوات/مجموعات)
+# =========================
+async def dest_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type != "private":
+        return
+    user_id = update.effective_user.id
+    sess = admin_sessions.get(user_id)
+    if not sess or not sess.get("target_channel_id"):
+        await update.message.reply_text("⚠️ اربط وجهتك الأساسية أولًا بإعادة توجيه منشور منها أو /bind @اسم_القناة")
+        return
+    if not context.args:
+        await update.message.reply_text("اكتب هكذا:\n/dest_add @قناة1 @قناة2")
+        return
+
+    lines = []
+    destinations = list(sess.get("destinations") or [])
+    for ref in context.args:
+        ref = ref.strip()
+        try:
+            chat = await context.bot.get_chat(ref)
+        except Exception:
+            lines.append(f"❌ {ref}: لم أستطع الوصول. تأكد أن البوت مضاف هناك.")
+            continue
+        if not await is_admin_in_chat(context, chat.id, user_id):
+            lines.append(f"❌ {ref}: يجب أن تكون مشرفًا هناك.")
+            continue
+        if chat.id == sess["target_channel_id"] or any(d["id"] == chat.id for d in destinations):
+            lines.append(f"ℹ️ {ref}: مضافة مسبقًا.")
+            continue
+        destinations.append({"id": chat.id, "title": chat.title or ref})
+        prefetch_admin_roster(context, chat.id)
+        lines.append(f"✅ {chat.title or ref} ({chat.id})")
+
+    sess = admin_sessions[user_id]
+    sess["destinations"] = destinations
+    await update.message.reply_text("\n".join(lines) + f"\n\n📡 عدد الوجهات: {len(destination_ids(sess))}")
+
+async def dest_remove(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type != "private":
+        return
+    sess = admin_sessions.get(update.effective_user.id)
+    if not sess or not context.args:
+        await update.message.reply_text("اكتب هكذا:\n/dest_remove -100123456789")
+        return
+    ref = context.args[0].strip()
+    before = sess.get("destinations") or []
+    sess["destinations"] = [d for d in before if str(d["id"]) != ref and d.get("title") != ref]
+    if len(sess["destinations"]) == len(before):
+        await update.message.reply_text("⚠️ هذه الوجهة غير موجودة في قائمتك. استخدم /dests لعرضها.")
+        return
+    await update.message.reply_text("✅ تمت إزالة الوجهة.")
+
+async def dests_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    sess = admin_sessions.get(update.effective_user.id) or {}
+    if not sess.get("target_channel_id"):
+        await update.message.reply_text("لا توجد وجهات مربوطة بعد.")
+        return
+    lines = [f"📌 الأساسية: {sess['target_channel_id']}"]
+    for dest in sess.get("destinations") or []:
+        lines.append(f"➕ {dest.get('title')}: {dest['id']}")
+    lines.append("\nإضافة: /dest_add @قناة — إزالة: /dest_remove <ID>")
+    await update.message.reply_text("\n".join(lines))
+
+# =========================
+# النشر في الوجهات
+# =========================
+async def publish_post(bot, chat_id: int, post: dict):
+    text = post.get("text")
+    media = post.get("media")
+
+    # 👇 نبني الأزرار كاملة من البداية (تفاعل + ملاحظة)
+    base_buttons = []
+    if post.get("use_reactions"):
+        base_buttons.append(INITIAL_REACTIONS_ROW)
+
+    # زر رفع الملاحظة يتطلب chat_id و message_id → نضيفه بعد الإرسال
+    keyboard = InlineKeyboardMarkup(base_buttons) if base_buttons else None
+
+    album = post.get("album")
+    if album:
+        # الألبوم كاملًا في طلب واحد، والأزرار على رسالة مرافقة (الألبومات لا تقبل reply_markup)
+        media_items, companion_text = album_media(album, text)
+        messages = await bot.send_media_group(chat_id=chat_id, media=media_items, rate_limit_args=PRIORITY_HIGH)
+        first = messages[0]
+        deep_link = await get_inquiry_link(bot, first.chat_id, first.message_id)
+        await bot.send_message(
+            chat_id=chat_id,
+            text=companion_text,
+            reply_markup=InlineKeyboardMarkup(base_buttons + [[InlineKeyboardButton("💬 رفع ملاحظة للإدارة", url=deep_link)]]),
+            parse_mode="HTML",
+            reply_to_message_id=first.message_id,
+            rate_limit_args=PRIORITY_HIGH,
+        )
+        return first
+
+    sent_message = None
+    send_args = {"reply_markup": keyboard, "parse_mode": "HTML", "rate_limit_args": PRIORITY_HIGH}
+
+    if media:
+        kind, file_id, caption = media
+        send_args["caption"] = caption or text
+        if kind == "photo":
+            sent_message = await bot.send_photo(chat_id=chat_id, photo=file_id, **send_args)
+        elif kind == "document":
+            sent_message = await bot.send_document(chat_id=chat_id, document=file_id, **send_args)
+        elif kind == "audio":
+            sent_message = await bot.send_audio(chat_id=chat_id, audio=file_id, **send_args)
+        elif kind == "video":
+            sent_message = await bot.send_video(chat_id=chat_id, video=file_id, **send_args)
+        elif kind == "voice":
+            sent_message = await bot.send_voice(chat_id=chat_id, voice=file_id, **send_args)
+    elif text:
+        sent_message = await bot.send_message(chat_id=chat_id, text=text, **send_args)
+
+    # ✨ بعد الإرسال فقط نضيف زر الملاحظة (تعديل واحد) — لكل نسخة رابطها الخاص
+    if sent_message:
+        deep_link = await get_inquiry_link(bot, sent_message.chat_id, sent_message.message_id)
+        final_buttons = base_buttons + [[InlineKeyboardButton("💬 رفع ملاحظة للإدارة", url=deep_link)]]
+        try:
+            await bot.edit_message_reply_markup(
+                chat_id=sent_message.chat_id,
+                message_id=sent_message.message_id,
+                reply_markup=InlineKeyboardMarkup(final_buttons)
+            )
+        except Exception as e:
+            logging.error(f"[PUBLISH] Failed to add note button: {e}")
+
+    return sent_message
+
+ALBUM_INPUT_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+def album_media(album: list, text: str | None):
+    # album: عناصر [message_id, kind, file_id, caption] مرتبة حسب message_id
+    # النص يصبح تعليق العنصر الأول لو لم يكن للألبوم تعليقات، وإلا يذهب للرسالة المرافقة
+    has_captions = any(item[3] for item in album)
+    media_items = []
+    for i, (_, kind, file_id, caption) in enumerate(album[:ALBUM_MAX_ITEMS]):
+        if i == 0 and not has_captions:
+            caption = text
+        media_items.append(ALBUM_INPUT_TYPES[kind](media=file_id, caption=caption, parse_mode="HTML"))
+    companion_text = text if (text and has_captions) else ALBUM_COMPANION_TEXT
+    return media_items, companion_text
+
+def has_post_content(session: dict) -> bool:
+    return bool(session.get("text") or session.get("media") or session.get("album"))
+
+async def resolve_publish_targets(context: ContextTypes.DEFAULT_TYPE, session: dict, user_id: int):
+    # الوجهات الإضافية: نتحقق (من الكاش غالبًا) أن المشرف ما زال مشرفًا هناك
+    destinations, rejected = [], []
+    for chat_id in destination_ids(session):
+        if chat_id == session.get("target_channel_id") or await is_admin_in_chat(context, chat_id, user_id):
+            destinations.append(chat_id)
+        else:
+            rejected.append((chat_id, "لست مشرفًا هناك"))
+    return destinations, rejected
+
+async def publish_to_destinations(bot, destinations: list[int], post: dict) -> list[tuple[int, str | None]]:
+    # كل الوجهات بالتوازي؛ منظّم الإرسال يضبط الحدود. النتيجة: (chat_id, خطأ أو None)
+    async def publish_one(chat_id: int) -> tuple[int, str | None]:
+        try:
+            sent = await publish_post(bot, chat_id, post)
+        except Exception as e:
+            logging.error(f"[PUBLISH] فشل النشر في {chat_id}: {e}")
+            return chat_id, str(e)
+        return chat_id, None if sent else "لا يوجد محتوى"
+
+    return await asyncio.gather(*(publish_one(chat_id) for chat_id in destinations))
+
+def publish_summary(results: list[tuple[int, str | None]], titles: dict[int, str]) -> str:
+    if len(results) == 1 and not results[0][1]:
+        return "✅ تم نشر المنشور بنجاح."
+    ok_count = sum(1 for _, err in results if not err)
+    lines = [f"📡 تم النشر في {ok_count} من {len(results)} وجهة:"]
+    for chat_id, err in results:
+        name = titles.get(chat_id) or chat_id
+        lines.append(f"✅ {name}" if not err else f"❌ {name}: {err}")
+    return "\n".join(lines)
+
+# =========================
+# النشر المجدول (APScheduler + المخزن الدائم)
+# =========================
+# المنشورات المجدولة تُحفظ في المخزن؛ APScheduler يحمل فقط مؤقتات الخانات ويُعاد بناؤها عند التشغيل
+scheduled_posts: MutableMapping[int, dict] = state_store.mapping("scheduled_posts")
+counters: MutableMapping[str, int] = state_store.mapping("counters")
+# مدة حجز المنشور المجدول أثناء نشره: worker آخر يصل لنفس الخانة يتجاوزه
+SCHEDULE_CLAIM_TTL = 600
+SCHEDULE_INTERRUPTED = "انقطع النشر بإعادة تشغيل؛ لم يُعَد الإرسال تفاديًا للتكرار"
+
+SCHEDULE_DELTA_RE = re.compile(r"\+(\d+)\s*([mhd])", flags=re.IGNORECASE)
+SCHEDULE_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+def next_id(name: str) -> int:
+    # ذرّي عبر الـ workers؛ في الوضع المشترك يبدأ العدّاد من آخر قيمة محفوظة محليًا
+    return coordinator.incr(name, initial=counters.get(name, 0))
+
+def parse_schedule_time(text: str, now: datetime) -> datetime | None:
+    text = (text or "").strip()
+    m = SCHEDULE_DELTA_RE.fullmatch(text)
+    if m:
+        return now + timedelta(**{SCHEDULE_UNITS[m.group(2).lower()]: int(m.group(1))})
+    for fmt in ("%Y-%m-%d %H:%M", "%H:%M"):
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if fmt == "%H:%M":
+            when = now.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+            return when if when > now else when + timedelta(days=1)
+        return parsed.replace(tzinfo=SCHEDULE_TZ)
+    return None
+
+def schedule_slot(run_at: float) -> int:
+    # نقرّب للأعلى لحدود الخانة: لا يُنشر منشور قبل وقته أبدًا
+    return -(-int(run_at) // SCHEDULE_SLOT_SECONDS) * SCHEDULE_SLOT_SECONDS
+
+def add_slot_job(slot: int):
+    get_scheduler().add_job(
+        run_publish_slot, "date", run_date=datetime.fromtimestamp(max(slot, time.time()), SCHEDULE_TZ),
+        args=[slot], id=f"publish_slot:{slot}", replace_existing=True, misfire_grace_time=None,
+    )
+
+def format_run_at(run_at: float) -> str:
+    return datetime.fromtimestamp(run_at, SCHEDULE_TZ).strftime("%Y-%m-%d %H:%M")
+
+async def handle_schedule_time(update: Update, context: ContextTypes.DEFAULT_TYPE, session: dict, text: str):
+    user_id = update.effective_user.id
+    when = parse_schedule_time(text, datetime.now(SCHEDULE_TZ))
+    if not when or when.timestamp() <= time.time():
+        await update.message.reply_text("⚠️ وقت غير صالح أو في الماضي. مثال: 21:30 أو +2h")
+        return
+
+    destinations, rejected = await resolve_publish_targets(context, session, user_id)
+    if not destinations:
+        await update.message.reply_text("⚠️ لا توجد وجهة يمكنك النشر فيها.")
+        return
+
+    post_id = next_id("scheduled_posts")
+    run_at = when.timestamp()
+    titles = {d["id"]: d.get("title") for d in session.get("destinations") or []}
+    scheduled_posts[post_id] = {
+        "id": post_id,
+        "admin_id": user_id,
+        "run_at": run_at,
+        "post": {k: session.get(k) for k in ("text", "media", "album", "use_reactions")},
+        "destinations": destinations,
+        "titles": [[chat_id, titles.get(chat_id)] for chat_id in destinations],
+    }
+    add_slot_job(schedule_slot(run_at))
+
+    admin_sessions[user_id] = binding_of(session)
+    note = f"\n⚠️ تم تجاهل {len(rejected)} وجهة لست مشرفًا فيها." if rejected else ""
+    await update.message.reply_text(
+        f"🕒 تمت جدولة المنشور #{post_id} في {format_run_at(run_at)} إلى {len(destinations)} وجهة.{note}\n"
+        "لعرض المجدول: /queue"
+    )
+
+async def run_publish_slot(slot: int):
+    # كل worker يحمل مؤقتات كل الخانات؛ الحجز يضمن أن كل منشور يُنشر مرة واحدة.
+    # الوجهات تُعلَّم started وتُحفظ قبل أي إرسال: إعادة تشغيل وسط الخانة لا تعيد النشر فيما بدأ
+    # (ربما نُشر فعلًا)، بل يُبلَّغ المشرف به
+    async with fresh_state():
+        claimed = [
+            p["id"] for p in scheduled_posts.values()
+            if p["run_at"] <= slot and coordinator.acquire(f"scheduled_post:{p['id']}", SCHEDULE_CLAIM_TTL)
+        ]
+        due = []
+        for post_id in claimed:
+            async with locked_state(scheduled_posts, post_id):
+                post = scheduled_posts.get(post_id)
+                if post is None:
+                    continue
+                started = set(post.get("started") or [])
+                pending = [chat_id for chat_id in post["destinations"] if chat_id not in started]
+                interrupted = [chat_id for chat_id in post["destinations"] if chat_id in started]
+                post["started"] = list(post["destinations"])
+                due.append((post, pending, interrupted))
+        state_store.flush()
+    if not due:
+        return
+    logging.info("[SCHEDULE] slot %s: publishing %d posts", slot, len(due))
+
+    bot = application.bot
+    batch = await asyncio.gather(*(publish_to_destinations(bot, pending, post["post"]) for post, pending, _ in due))
+
+    async with fresh_state():
+        for post, _, _ in due:
+            async with locked_state(scheduled_posts, post["id"]):
+                scheduled_posts.pop(post["id"], None)
+    for (post, _, interrupted), results in zip(due, batch):
+        results = [*results, *((chat_id, SCHEDULE_INTERRUPTED) for chat_id in interrupted)]
+        titles = {chat_id: title for chat_id, title in post.get("titles") or []}
+        try:
+            await bot.send_message(
+                chat_id=post["admin_id"],
+                text=f"🕒 المنشور المجدول #{post['id']}:\n" + publish_summary(list(results), titles),
+            )
+        except Exception as e:
+            logging.error(f"[SCHEDULE] فشل إبلاغ المشرف {post['admin_id']}: {e}")
+
+def restore_scheduled_posts():
+    slots = {schedule_slot(p["run_at"]) for p in scheduled_posts.values()}
+    for slot in slots:
+        add_slot_job(slot)
+    if slots:
+        logging.info("[SCHEDULE] restored %d posts in %d slots", len(scheduled_posts), len(slots))
+
+async def queue_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type != "private":
+        return
+    user_id = update.effective_user.id
+    args = context.args or []
+
+    if len(args) >= 2 and args[0] == "cancel" and args[1].isdigit():
+        post_id = int(args[1])
+        async with locked_state(scheduled_posts, post_id):
+            post = scheduled_posts.get(post_id)
+            if post and post["admin_id"] == user_id:
+                scheduled_posts.pop(post_id, None)
+        if not post or post["admin_id"] != user_id:
+            await update.message.reply_text("⚠️ لا يوجد منشور مجدول بهذا الرقم.")
+            return
+        await update.message.reply_text(f"🗑️ تم إلغاء المنشور المجدول #{post_id}.")
+        return
+
+    if len(args) >= 3 and args[0] == "move" and args[1].isdigit():
+        post_id = int(args[1])
+        when = parse_schedule_time(" ".join(args[2:]), datetime.now(SCHEDULE_TZ))
+        async with locked_state(scheduled_posts, post_id):
+            post = scheduled_posts.get(post_id)
+            if not post or post["admin_id"] != user_id:
+                post = None
+            elif when and when.timestamp() > time.time():
+                # مؤقت الخانة القديمة يبقى؛ عند تشغيله لن يجد المنشور مستحقًا فيتجاوزه
+                post["run_at"] = when.timestamp()
+        if not post:
+            await update.message.reply_text("⚠️ لا يوجد منشور مجدول بهذا الرقم.")
+            return
+        if not when or when.timestamp() <= time.time():
+            await update.message.reply_text("⚠️ وقت غير صالح أو في الماضي. مثال: 21:30 أو +2h")
+            return
+        add_slot_job(schedule_slot(post["run_at"]))
+        await update.message.reply_text(f"🕒 تم نقل المنشور #{post_id} إلى {format_run_at(post['run_at'])}.")
+        return
+
+    mine = sorted((p for p in scheduled_posts.values() if p["admin_id"] == user_id), key=lambda p: p["run_at"])
+    if not mine:
+        await update.message.reply_text("📭 لا توجد منشورات مجدولة.")
+        return
+    lines = ["🗓️ المنشورات المجدولة:"]
+    buttons = []
+    for p in mine:
+        media, album = p["post"].get("media"), p["post"].get("album")
+        preview = (p["post"].get("text") or (album and f"ألبوم ({len(album)})") or (media and (media[2] or media[0])) or "")[:40]
+        lines.append(f"#{p['id']} — {format_run_at(p['run_at'])} — {len(p['destinations'])} وجهة — {preview}")
+        buttons.append([InlineKeyboardButton(f"❌ إلغاء #{p['id']}", callback_data=f"queue_cancel|{p['id']}")])
+    lines.append("\nنقل: /queue move <رقم> <وقت> — إلغاء: /queue cancel <رقم>")
+    await update.message.reply_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(buttons))
+
+async def handle_queue_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    _, raw_id = query.data.split("|", 1)
+    post = None
+    if raw_id.isdigit():
+        async with locked_state(scheduled_posts, int(raw_id)):
+            post = scheduled_posts.get(int(raw_id))
+            if post and post["admin_id"] == query.from_user.id:
+                scheduled_posts.pop(post["id"], None)
+    if not post or post["admin_id"] != query.from_user.id:
+        await query.answer("⚠️ المنشور غير موجود أو نُشر بالفعل.", show_alert=True)
+        return
+    await query.answer(f"🗑️ تم إلغاء #{post['id']}")
+    await query.message.reply_text(f"🗑️ تم إلغاء المنشور المجدول #{post['id']}.")
+
 # =========================
 # تحضير النشر للأدمن (ديناميكي)
 # =========================
@@ -283,10 +1743,10 @@ async def start_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # إنشاء جلسة جديدة مباشرة — مع الاحتفاظ بالربط
     admin_sessions[user.id] = {
+        **binding_of(sess),
         "text": None,
         "media": None,
         "awaiting_input": True,
-        "target_channel_id": target_channel_id,
         "controls_msg_id": None,
         "controls_chat_id": None,
     }
@@ -303,16 +1763,13 @@ async def start_publish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logging.info("▶ Enter handle_text, current_reply=%s", context.bot_data.get("current_reply"))
-
-    # لا نتدخل في جلسة الرد للمستخدم
-    if context.bot_data.get("current_reply"):
-        return
+    # يصل هنا من route_private_message فقط: لا جلسة رد ولا مسودة استفسار لهذا المستخدم
+    logging.info("▶ Enter handle_text")
 
     msg = (update.message.text or "").strip()
 
     # 👇 تشغيل النشر بكتابة jop كنص (بدون /) وفق منطق الجلسة
-    if re.fullmatch(r"\s*jop\s*", msg, flags=re.IGNORECASE):
+    if JOP_RE.fullmatch(msg):
         sess = admin_sessions.get(update.effective_user.id)
         if not sess or not sess.get("awaiting_input"):
             # لا توجد جلسة نشر مفتوحة → ابدأ جلسة نشر (start_publish سيتحقق من الربط أولاً)
@@ -326,12 +1783,10 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_user_admin(update, context):
         return
 
-    # لو الأدمن داخل جلسة استفسار كمستخدم → لا نتدخل
-    inq = admin_inquiries.get(update.effective_user.id)
-    if inq and inq.get("stage") == "awaiting_text_or_media":
-        return
-
     session = admin_sessions.get(update.effective_user.id)
+    if session and session.get("awaiting_schedule"):
+        await handle_schedule_time(update, context, session, msg)
+        return
     if not session or not session.get("awaiting_input"):
         # لا توجد جلسة نشر مفتوحة، تجاهل أي نصوص عادية
         return
@@ -339,7 +1794,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # حفظ/تحديث نص المنشور
     session["text"] = auto_hide_links(msg)
 
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("✅ تم", callback_data="admin_done_input")]])
+    keyboard = DONE_KEYBOARD
     controls_msg_id = session.get("controls_msg_id")
     controls_chat_id = session.get("controls_chat_id")
 
@@ -367,21 +1822,22 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             session["controls_chat_id"] = sent.chat_id
 
 async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logging.info("▶ Enter handle_media, current_reply=%s", context.bot_data.get("current_reply"))
+    # يصل هنا من route_private_message فقط: لا جلسة رد ولا مسودة استفسار لهذا المستخدم
+    logging.info("▶ Enter handle_media")
 
-    if context.bot_data.get("current_reply"):
-        return
     if not await is_user_admin(update, context):
         return
-    inq = admin_inquiries.get(update.effective_user.id)
-    if inq and inq.get("stage") == "awaiting_text_or_media":
-        return
 
     session = admin_sessions.get(update.effective_user.id)
     if not session or not session.get("awaiting_input"):
         return
 
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("✅ تم", callback_data="admin_done_input")]])
+    msg = update.message
+    if msg.media_group_id and (msg.photo or msg.video or msg.document or msg.audio):
+        add_album_item(context, update.effective_user.id, session, msg)
+        return
+    session["album"] = None
+    session["album_group"] = None
 
     updated_label = None
     if update.message.photo:
@@ -403,25 +1859,80 @@ async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not updated_label:
         return
 
-    controls_msg_id = session.get("controls_msg_id")
-    controls_chat_id = session.get("controls_chat_id")
+    await show_input_controls(context.bot, update.effective_user.id, updated_label)
 
-    if not controls_msg_id:
-        sent = await update.message.reply_text(updated_label, reply_markup=keyboard)
-        session["controls_msg_id"] = sent.message_id
-        session["controls_chat_id"] = sent.chat_id
-    else:
+async def show_input_controls(bot, user_id: int, label: str):
+    # رسالة تحكم واحدة لكل جلسة: نعدّلها إن وُجدت وإلا نرسل جديدة
+    session = admin_sessions.get(user_id) or {}
+    controls_msg_id = session.get("controls_msg_id")
+    if controls_msg_id:
         try:
-            await context.bot.edit_message_text(
-                chat_id=controls_chat_id,
+            await bot.edit_message_text(
+                chat_id=session.get("controls_chat_id"),
                 message_id=controls_msg_id,
-                text=updated_label.replace("تم حفظ", "تم تحديث"),
-                reply_markup=keyboard
+                text=label.replace("تم حفظ", "تم تحديث"),
+                reply_markup=DONE_KEYBOARD
             )
+            return
         except Exception:
-            sent = await update.message.reply_text(updated_label, reply_markup=keyboard)
-            session["controls_msg_id"] = sent.message_id
-            session["controls_chat_id"] = sent.chat_id
+            pass
+    sent = await bot.send_message(chat_id=user_id, text=label, reply_markup=DONE_KEYBOARD)
+    # قد تكون الجلسة استُبدلت أثناء الإرسال: نصل إليها من جديد
+    session = admin_sessions.get(user_id)
+    if session is not None:
+        session["controls_msg_id"] = sent.message_id
+        session["controls_chat_id"] = sent.chat_id
+
+# مهام تأكيد الألبوم المعلّقة لكل مشرف
+album_acks: dict[int, asyncio.Task] = {}
+
+def album_item_of(msg) -> tuple[str, str]:
+    if msg.photo:
+        return "photo", msg.photo[-1].file_id
+    if msg.video:
+        return "video", msg.video.file_id
+    if msg.document:
+        return "document", msg.document.file_id
+    return "audio", msg.audio.file_id
+
+def add_album_item(context: ContextTypes.DEFAULT_TYPE, user_id: int, session: dict, msg):
+    if session.get("album_group") != msg.media_group_id:
+        # ألبوم جديد يستبدل المحتوى المرئي السابق
+        session["album_group"] = msg.media_group_id
+        session["album"] = []
+        session["media"] = None
+    album = session["album"]
+    if any(item[0] == msg.message_id for item in album):
+        return
+    kind, file_id = album_item_of(msg)
+    album.append([msg.message_id, kind, file_id, msg.caption])
+    album.sort(key=lambda item: item[0])
+
+    task = album_acks.get(user_id)
+    if task is None or task.done():
+        album_acks[user_id] = context.application.create_task(ack_album(context.bot, user_id))
+
+async def ack_album(bot, user_id: int):
+    # ننتظر حتى يتوقف وصول عناصر الألبوم ثم نرسل تأكيدًا واحدًا بدل تأكيد لكل صورة
+    try:
+        seen = -1
+        while True:
+            session = admin_sessions.get(user_id)
+            album = session.get("album") if session else None
+            if not album:
+                return
+            if len(album) == seen:
+                break
+            seen = len(album)
+            await asyncio.sleep(ALBUM_COLLECT_WINDOW)
+        note = f" (يُنشر أول {ALBUM_MAX_ITEMS} فقط)" if seen > ALBUM_MAX_ITEMS else ""
+        await show_input_controls(
+            bot, user_id, f"🖼️ تم حفظ ألبوم من {seen} عناصر{note}. يمكنك إضافة نص أو الضغط على ✅ تم"
+        )
+    except Exception as e:
+        logging.error(f"[ALBUM] فشل تأكيد الألبوم للمشرف {user_id}: {e}")
+    finally:
+        album_acks.pop(user_id, None)
 
 async def handle_admin_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -440,46 +1951,33 @@ async def handle_admin_buttons(update: Update, context: ContextTypes.DEFAULT_TYP
     if data == "admin_done_input":
         session["awaiting_input"] = False
         session["use_reactions"] = None
-        keyboard = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ نعم", callback_data="set_reactions_yes"),
-                InlineKeyboardButton("❌ لا", callback_data="set_reactions_no")
-            ]
-        ])
         await query.message.reply_text(
             "❓ هل ترغب في إضافة أزرار التفاعل (إعجاب / لا يعجبني)؟",
-            reply_markup=keyboard
+            reply_markup=REACTIONS_CHOICE_KEYBOARD
         )
         await query.answer()
 
     elif data in ("set_reactions_yes", "set_reactions_no"):
         session["use_reactions"] = (data == "set_reactions_yes")
-        preview_button = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ المعاينة", callback_data="preview_post")]
-        ])
         msg = "😍 سيتم عرض أزرار التفاعل مع المنشور." if session["use_reactions"] else "✅ لن يتم عرض أزرار التفاعل."
-        await query.message.reply_text(f"{msg}\nاضغط المعاينة للمتابعة:", reply_markup=preview_button)
+        await query.message.reply_text(f"{msg}\nاضغط المعاينة للمتابعة:", reply_markup=PREVIEW_KEYBOARD)
         await query.answer()
 
     elif data == "preview_post":
         text = session.get("text")
         media = session.get("media")
+        album = session.get("album")
         use_reactions = session.get("use_reactions")
 
-        buttons = [
-            [
-                InlineKeyboardButton("✅ نشر", callback_data="confirm_publish"),
-                InlineKeyboardButton("❌ إلغاء", callback_data="cancel_publish")
-            ]
-        ]
-        if use_reactions:
-            buttons.insert(0, [
-                InlineKeyboardButton("😍 إعجاب", callback_data="none"),
-                InlineKeyboardButton("😐 لا يعجبني", callback_data="none")
-            ])
-        keyboard = InlineKeyboardMarkup(buttons)
+        keyboard = PUBLISH_WITH_REACTIONS_KEYBOARD if use_reactions else PUBLISH_KEYBOARD
 
-        if media:
+        if album:
+            media_items, companion_text = album_media(album, text)
+            await context.bot.send_media_group(chat_id=user_id, media=media_items)
+            await context.bot.send_message(
+                chat_id=user_id, text=companion_text, reply_markup=keyboard, parse_mode="HTML"
+            )
+        elif media:
             kind, file_id, caption = media
             send_args = {"reply_markup": keyboard, "parse_mode": "HTML", "caption": caption or text}
             if kind == "photo":
@@ -504,87 +2002,270 @@ async def handle_admin_buttons(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.answer()
 
     elif data == "confirm_publish":
-        text = session.get("text")
-        media = session.get("media")
-        use_reactions = session.get("use_reactions")
         target_channel_id = session.get("target_channel_id")
 
         if not target_channel_id:
             await query.answer("⚠️ اربط قناتك/مجموعتك بإعادة توجيه منشور منها للخاص أولًا.", show_alert=True)
             return
 
-        # 👇 نبني الأزرار كاملة من البداية (تفاعل + ملاحظة)
-        base_buttons = []
-        if use_reactions:
-            base_buttons.append([
-                InlineKeyboardButton("😍 0", callback_data="like"),
-                InlineKeyboardButton("😐  0", callback_data="dislike")
-            ])
-
-        # زر رفع الملاحظة يتطلب chat_id و message_id → نضيفه بعد الإرسال
-        keyboard = InlineKeyboardMarkup(base_buttons) if base_buttons else None
-
-        sent_message = None
-        send_args = {"reply_markup": keyboard, "parse_mode": "HTML"}
+        await query.answer()
 
-        if media:
-            kind, file_id, caption = media
-            send_args["caption"] = caption or text
-            if kind == "photo":
-                sent_message = await context.bot.send_photo(chat_id=target_channel_id, photo=file_id, **send_args)
-            elif kind == "document":
-                sent_message = await context.bot.send_document(chat_id=target_channel_id, document=file_id, **send_args)
-            elif kind == "audio":
-                sent_message = await context.bot.send_audio(chat_id=target_channel_id, audio=file_id, **send_args)
-            elif kind == "video":
-                sent_message = await context.bot.send_video(chat_id=target_channel_id, video=file_id, **send_args)
-            elif kind == "voice":
-                sent_message = await context.bot.send_voice(chat_id=target_channel_id, voice=file_id, **send_args)
-        elif text:
-            sent_message = await context.bot.send_message(
-                chat_id=target_channel_id,
-                text=text,
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
+        destinations, results = await resolve_publish_targets(context, session, user_id)
+        results = list(await publish_to_destinations(context.bot, destinations, session)) + results
 
-        # ✨ بعد الإرسال فقط نضيف زر الملاحظة (تعديل واحد)
-        if sent_message:
-            bot_username = await get_bot_username(context)
-            deep_link = f"https://t.me/{bot_username}?start=inq_{sent_message.chat_id}_{sent_message.message_id}"
-            final_buttons = base_buttons + [[InlineKeyboardButton("💬 رفع ملاحظة للإدارة", url=deep_link)]]
-            try:
-                await context.bot.edit_message_reply_markup(
-                    chat_id=sent_message.chat_id,
-                    message_id=sent_message.message_id,
-                    reply_markup=InlineKeyboardMarkup(final_buttons)
-                )
-            except Exception as e:
-                logging.error(f"[PUBLISH] Failed to add note button: {e}")
+        titles = {d["id"]: d.get("title") for d in session.get("destinations") or []}
 
         # ✅ نحافظ على الربط ولا نمسحه — فقط نفرّغ حالة الجلسة
-        binding = session.get("target_channel_id")
-        admin_sessions[user_id] = {"target_channel_id": binding}
+        admin_sessions[user_id] = binding_of(session)
+
+        await query.message.reply_text(publish_summary(results, titles))
 
-        await query.message.reply_text("✅ تم نشر المنشور بنجاح.")
+    elif data == "schedule_publish":
+        if not has_post_content(session):
+            await query.answer("⚠️ لم يتم إدخال أي محتوى.", show_alert=True)
+            return
+        session["awaiting_schedule"] = True
+        await query.message.reply_text(
+            "🕒 أرسل وقت النشر بإحدى الصيغ:\n"
+            "- `21:30` (اليوم أو غدًا)\n"
+            "- `2025-01-31 09:00`\n"
+            "- `+45m` أو `+2h` أو `+1d`",
+            parse_mode=ParseMode.MARKDOWN
+        )
         await query.answer()
 
     elif data == "cancel_publish":
         # إلغاء مع الحفاظ على الربط
-        binding = session.get("target_channel_id")
-        admin_sessions[user_id] = {"target_channel_id": binding}
+        admin_sessions[user_id] = binding_of(session)
         await query.message.reply_text("❌ تم إلغاء عملية النشر.")
         await query.answer()
 
 # =========================
 # تفاعلات القناة (ديناميكية)
 # =========================
-async def handle_reactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    data = query.data
+class PostVoters:
+    # متفاعلو منشور واحد: مصفوفة مرتبة من int64 (8 بايت للمستخدم بدل ~60 في set)،
+    # أو Bloom filter ثابت الحجم للمنشورات الضخمة إن فُعّل REACTION_BLOOM_THRESHOLD.
+    __slots__ = ("users", "bloom", "count", "last_seen", "dirty")
+    BLOOM_HASHES = 7
+
+    def __init__(self):
+        self.users = array("q")
+        self.bloom: bytearray | None = None
+        self.count = 0
+        self.last_seen = time.time()
+        self.dirty = False
+
+    def _bloom_positions(self, user_id: int) -> list[int]:
+        digest = hashlib.blake2b(user_id.to_bytes(8, "little", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = len(self.bloom) * 8
+        return [(h1 + i * h2) % bits for i in range(self.BLOOM_HASHES)]
+
+    def _to_bloom(self):
+        # ~10 بت لكل عنصر متوقع (حتى 4× العتبة) → نسبة خطأ قرابة 1%
+        self.bloom = bytearray(max(1024, REACTION_BLOOM_THRESHOLD * 5))
+        for uid in self.users:
+            for p in self._bloom_positions(uid):
+                self.bloom[p >> 3] |= 1 << (p & 7)
+        self.users = array("q")
+
+    def add(self, user_id: int) -> bool:
+        # True لو التفاعل جديد، False لو سبق لهذا المستخدم التفاعل
+        self.last_seen = time.time()
+        if self.bloom is not None:
+            positions = self._bloom_positions(user_id)
+            if all(self.bloom[p >> 3] & (1 << (p & 7)) for p in positions):
+                return False
+            for p in positions:
+                self.bloom[p >> 3] |= 1 << (p & 7)
+        else:
+            i = bisect_left(self.users, user_id)
+            if i < len(self.users) and self.users[i] == user_id:
+                return False
+            self.users.insert(i, user_id)
+            if REACTION_BLOOM_THRESHOLD and len(self.users) > REACTION_BLOOM_THRESHOLD:
+                self._to_bloom()
+        self.count += 1
+        self.dirty = True
+        return True
+
+    def to_json(self) -> str:
+        data = {"t": self.last_seen, "n": self.count}
+        if self.bloom is not None:
+            data["b"] = base64.b64encode(self.bloom).decode()
+        else:
+            data["u"] = base64.b64encode(self.users.tobytes()).decode()
+        return json.dumps(data, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "PostVoters":
+        data = json.loads(raw)
+        voters = cls()
+        voters.last_seen = data.get("t", voters.last_seen)
+        voters.count = data.get("n", 0)
+        if "b" in data:
+            voters.bloom = bytearray(base64.b64decode(data["b"]))
+        else:
+            voters.users.frombytes(base64.b64decode(data.get("u", "")))
+        return voters
+
+
+class ReactionDedup:
+    # طبقة ساخنة في الذاكرة للمنشورات النشطة + طبقة باردة في المخزن للخاملة.
+    # تُحفظ الطبقة الساخنة كل REACTION_SWEEP_INTERVAL؛ انهيار مفاجئ يفقد آخر نافذة فقط.
+    NS = "reaction_dedup"
+
+    def __init__(self, store):
+        self.store = store
+        self.hot: dict[str, PostVoters] = {}
+        self.stats = {"cold_loads": 0, "rolled_cold": 0, "evicted": 0}
+
+    def _get(self, key: str) -> PostVoters:
+        voters = self.hot.get(key)
+        if voters is None:
+            raw = self.store.blob_get(self.NS, key)
+            if raw:
+                voters = PostVoters.from_json(raw)
+                self.stats["cold_loads"] += 1
+            else:
+                voters = PostVoters()
+                # ترحيل من الشكل القديم: set كامل داخل reacted_users
+                legacy = self.store.blob_get("reacted_users", key)
+                if legacy:
+                    for uid in sorted(decode_state(legacy)):
+                        voters.add(uid)
+            self.hot[key] = voters
+        return voters
+
+    def add(self, key: str, user_id: int) -> bool:
+        return self._get(key).add(user_id)
+
+    def checkpoint(self):
+        dirty = [(key, v) for key, v in self.hot.items() if v.dirty]
+        if not dirty:
+            return
+        self.store.blob_put_many(self.NS, [(key, v.to_json()) for key, v in dirty])
+        for _, v in dirty:
+            v.dirty = False
+
+    def sweep(self):
+        now = time.time()
+        self.checkpoint()
+
+        # الخاملة → الطبقة الباردة (محفوظة للتو) ونحررها من الذاكرة مع عدّاداتها
+        idle = [key for key, v in self.hot.items() if now - v.last_seen > REACTION_HOT_SECONDS]
+        for key in idle:
+            del self.hot[key]
+            if isinstance(reaction_counts, PersistentMapping):
+                reaction_counts.forget(key)
+        self.stats["rolled_cold"] += len(idle)
+
+        # الأقدم من الحد الأقصى تُحذف نهائيًا (العدّاد يُستعاد من نص الزر لو تفاعل أحد لاحقًا)
+        if REACTION_DEDUP_MAX_AGE:
+            for key in self.store.blob_prune(self.NS, now - REACTION_DEDUP_MAX_AGE):
+                reaction_counts.pop(key, None)
+                self.stats["evicted"] += 1
+
+        if idle:
+            logging.info("[REACTIONS] sweep: hot=%d rolled_cold=%d", len(self.hot), len(idle))
+
+
+reaction_dedup = ReactionDedup(state_store)
+
+# عدّادات التفاعل يملكها السيرفر: "chat_msg" → [likes, dislikes]
+reaction_counts: MutableMapping[str, list[int]] = state_store.mapping("reaction_counts")
+# تعديل أزرار مؤجل واحد لكل منشور: كل الضغطات خلال النافذة تُدمج في تعديل واحد
+pending_reaction_edits: dict[str, asyncio.Task] = {}
+reaction_edit_stats = {"clicks": 0, "edits": 0}
+
+def counts_from_markup(markup) -> list[int]:
+    # للمنشورات الأقدم من العدّادات: نبدأ من الأرقام المكتوبة على الأزرار
+    try:
+        row = markup.inline_keyboard[0]
+        like_match = REACTION_COUNT_RE.search(row[0].text or "")
+        dislike_match = REACTION_COUNT_RE.search(row[1].text or "")
+        return [
+            int(like_match.group(1)) if like_match else 0,
+            int(dislike_match.group(1)) if dislike_match else 0,
+        ]
+    except Exception as e:
+        logging.error(f"[REACTIONS] فشل قراءة الأرقام من الأزرار: {e}")
+        return [0, 0]
 
-    # نتأكد أن الضغط فقط على like / dislike
-    if data not in ("like", "dislike"):
+def reactions_keyboard(like_count: int, dislike_count: int, deep_link: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"😍 {like_count}", callback_data="like"),
+            InlineKeyboardButton(f"😐  {dislike_count}", callback_data="dislike"),
+        ],
+        [
+            InlineKeyboardButton("💬 رفع ملاحظة للإدارة", url=deep_link),
+        ],
+    ])
+
+def record_reaction(key: str, user_id: int) -> bool:
+    # الوضع المشترك: سجل واحد في ملف التنسيق بدل الطبقة الساخنة الخاصة بكل عملية
+    if coordinator.shared:
+        return coordinator.add_once(f"reaction:{key}", user_id)
+    return reaction_dedup.add(key, user_id)
+
+def bump_reaction_count(key: str, index: int, markup) -> list[int]:
+    if coordinator.shared:
+        # زيادة ذرّية؛ الأرقام المكتوبة على الأزرار بداية العدّاد لو لم يوجد
+        seed = counts_from_markup(markup)
+        return [coordinator.incr(f"reaction:{key}:{i}", int(i == index), seed[i]) for i in (0, 1)]
+    counts = reaction_counts.get(key) or counts_from_markup(markup)
+    counts[index] += 1
+    reaction_counts[key] = counts
+    return counts
+
+def current_reaction_counts(key: str) -> list[int]:
+    if coordinator.shared:
+        return [coordinator.counter(f"reaction:{key}:{i}") or 0 for i in (0, 1)]
+    return reaction_counts.get(key, [0, 0])
+
+def markup_deep_link(markup) -> str | None:
+    # رابط "رفع ملاحظة" كما نُشر: في الألبوم يشير لأول رسالة فيه لا لرسالة الأزرار المرافقة
+    for row in markup.inline_keyboard:
+        for button in row:
+            if button.url:
+                return button.url
+    return None
+
+async def flush_reaction_edit(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int,
+                              deep_link: str | None = None):
+    key = f"{chat_id}_{message_id}"
+    try:
+        await asyncio.sleep(REACTION_EDIT_WINDOW)
+    finally:
+        # نحرر الخانة قبل القراءة: أي ضغطة أثناء التعديل تجدول تعديلًا جديدًا ولا تضيع
+        pending_reaction_edits.pop(key, None)
+
+    # نقرأ عند التعديل لا عند الضغط: في الوضع المشترك آخر تعديل يحمل آخر الأرقام من كل الـ workers
+    like_count, dislike_count = current_reaction_counts(key)
+    if not deep_link:
+        deep_link = await get_inquiry_link(context.bot, chat_id, message_id)
+    markup = reactions_keyboard(like_count, dislike_count, deep_link)
+
+    # RetryAfter يعالجه منظّم الإرسال (انتظار ثم إعادة المحاولة)
+    try:
+        await context.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=markup)
+        reaction_edit_stats["edits"] += 1
+        logging.info(f"[REACTIONS] تم تحديث الأزرار بنجاح: like={like_count}, dislike={dislike_count}")
+    except BadRequest as e:
+        # "message is not modified" وما شابه: لا شيء لنفعله
+        logging.info(f"[REACTIONS] لم يتم التعديل: {e}")
+    except Exception as e:
+        logging.error(f"[REACTIONS] Failed to edit message markup: {e}")
+
+async def handle_reactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    data = query.data
+
+    # نتأكد أن الضغط فقط على like / dislike
+    if data not in ("like", "dislike"):
         await query.answer()
         return
 
@@ -601,68 +2282,28 @@ async def handle_reactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("⚠️ لا يوجد أزرار تفاعل.", show_alert=True)
         return
 
-    keyboard = markup.inline_keyboard
-
-    # نفترض أول صف فيه الأزرار:
-    # [ "😍 رقم", "😐 رقم" ]
-    try:
-        like_btn = keyboard[0][0]
-        dislike_btn = keyboard[0][1]
-
-        # نقرأ الأرقام من نهاية النص
-        like_match = re.search(r"(\d+)\s*$", like_btn.text or "")
-        dislike_match = re.search(r"(\d+)\s*$", dislike_btn.text or "")
-
-        like_count = int(like_match.group(1)) if like_match else 0
-        dislike_count = int(dislike_match.group(1)) if dislike_match else 0
-    except Exception as e:
-        logging.error(f"[REACTIONS] فشل قراءة الأرقام من الأزرار: {e}")
-        like_count = 0
-        dislike_count = 0
-
-    # منع التصويت المكرر داخل نفس تشغيل السيرفر (اختياري)
+    # منع التصويت المكرر (سجل مضغوط ومحدود الحجم)
     key = f"{chat_id}_{message_id}"
-    reacted_map = context.bot_data.setdefault("reacted_users", {})
-    reacted_set = reacted_map.setdefault(key, set())
-
-    if user_id in reacted_set:
+    if not record_reaction(key, user_id):
         logging.info(f"[REACTIONS] user={user_id} سبق وتفاعل مع هذه الرسالة")
         await query.answer("لقد تفاعلت مسبقًا.", show_alert=True)
         return
 
-    reacted_set.add(user_id)
-
-    # نزيد العدّاد حسب نوع التفاعل
+    # العدّاد في السيرفر لا في نص الزر: لا سباق بين ضغطتين متزامنتين
     if data == "like":
-        like_count += 1
+        bump_reaction_count(key, 0, markup)
         msg = "تم تسجيل إعجابك 😍"
     else:
-        dislike_count += 1
+        bump_reaction_count(key, 1, markup)
         msg = "تم تسجيل عدم إعجابك 😐 "
+    reaction_edit_stats["clicks"] += 1
 
-    bot_username = await get_bot_username(context)
-    deep_link = f"https://t.me/{bot_username}?start=inq_{chat_id}_{message_id}"
-
-    # نعيد بناء الأزرار بالأرقام الجديدة
-    new_buttons = [
-        [
-            InlineKeyboardButton(f"😍 {like_count}", callback_data="like"),
-            InlineKeyboardButton(f"😐  {dislike_count}", callback_data="dislike"),
-        ],
-        [
-            InlineKeyboardButton("💬 رفع ملاحظة للإدارة", url=deep_link),
-        ],
-    ]
-
-    try:
-        await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(new_buttons))
-        logging.info(f"[REACTIONS] تم تحديث الأزرار بنجاح: like={like_count}, dislike={dislike_count}")
-    except Exception as e:
-        logging.error(f"[REACTIONS] Failed to edit message markup: {e}")
-        await query.answer("⚠️ لا يمكن تعديل التفاعل في هذا المنشور.", show_alert=True)
-        return
-
+    # الرد فوري، أما تعديل الأزرار فيُدمج مع بقية ضغطات النافذة
     await query.answer(msg)
+    if key not in pending_reaction_edits:
+        pending_reaction_edits[key] = context.application.create_task(
+            flush_reaction_edit(context, chat_id, message_id, markup_deep_link(markup))
+        )
 
 # =========================
 # بدء محادثة المستخدم (/start) — التقاط الاستفسارات
@@ -688,9 +2329,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # منع التكرار لنفس المنشور
-        user_records = context.bot_data.setdefault("inquiry_records", {})
-        key = f"{user.id}_{post_message_id}"
-        if post_message_id is not None and key in user_records:
+        if inquiry_store.exists_for_post(user.id, source_chat_id, post_message_id):
             await update.message.reply_text(
                 text=(
                     f"🧑‍💼 `{full_name}`\n\n"
@@ -701,6 +2340,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
+        prefetch_admin_roster(context, source_chat_id)
+
         # ابدأ جلسة كتابة
         admin_inquiries[user.id] = {
             "stage": "awaiting_text_or_media",
@@ -751,10 +2392,7 @@ async def handle_inquiry_input(update: Update, context: ContextTypes.DEFAULT_TYP
 
     text = update.message.text
     caption = update.message.caption
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📤 إرسال", callback_data="send_inquiry")],
-        [InlineKeyboardButton("❌ إلغاء", callback_data="cancel_inquiry")]
-    ])
+    keyboard = INQUIRY_SEND_KEYBOARD
 
     if text:
         session["text"] = auto_hide_links(text)
@@ -796,10 +2434,7 @@ async def handle_inquiry_buttons(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     post_message_id = session.get("message_id")
-    lock_key = f"inq_send_lock:{user_id}:{post_message_id if post_message_id is not None else 'none'}"
-    if context.bot_data.get(lock_key):
-        await query.answer("جاري المعالجة…", show_alert=False)
-        return
+    lock_key = f"inq_send:{user_id}:{post_message_id if post_message_id is not None else 'none'}"
 
     async def _cleanup_ui():
         cmid = session.get("controls_msg_id")
@@ -835,46 +2470,39 @@ async def handle_inquiry_buttons(update: Update, context: ContextTypes.DEFAULT_T
             await query.answer("⚠️ لم يتم إدخال استفسار بعد.", show_alert=True)
             return
 
-        if post_message_id is not None:
-            records = context.bot_data.setdefault("inquiry_records", {})
-            dup_key = f"{uid}_{post_message_id}"
-            if records.get(dup_key):
-                await query.answer("🚫 سبق وأرسلت استفسارًا لهذا المنشور.", show_alert=True)
-                return
-
+        # قفل مشترك بين الـ workers: ضغطتان متتاليتان على "إرسال" تنتجان استفسارًا واحدًا
+        lock_token = coordinator.acquire(lock_key, COORDINATION_LOCK_TTL)
+        if lock_token is None:
+            await query.answer("جاري المعالجة…", show_alert=False)
+            return
         try:
-            context.bot_data[lock_key] = True
-
-            inquiries = context.bot_data.setdefault("inquiries", {})
-            inquiries[uid] = {
+            inq_id = inquiry_store.add({
                 "user_id": uid,
                 "user_name": name,
                 "text": text or None,
                 "media_list": media_list,
-                "status": "pending_send",
+                "status": INQUIRY_PENDING,
                 "sent_at": datetime.now().isoformat(),
                 "post_message_id": post_message_id,
                 "source_chat_id": session.get("source_chat_id"),
-            }
-
-            await notify_admin_of_inquiry(context, uid)
-
-            if post_message_id is not None:
-                records = context.bot_data.setdefault("inquiry_records", {})
-                records[f"{uid}_{post_message_id}"] = True
-
-            inquiries[uid]["status"] = "sent"
+            })
+            if inq_id is None:
+                await query.answer("🚫 سبق وأرسلت استفسارًا لهذا المنشور.", show_alert=True)
+                return
 
-            await _cleanup_ui()
-            admin_inquiries.pop(user_id, None)
+            # إشعار المشرفين يجري في الخلفية؛ تأكيد المستخدم لا ينتظره
+            context.application.create_task(notify_admin_of_inquiry(context, inq_id))
 
+            await query.answer()
             await query.message.reply_text(
                 "✅ تم إرسال ملاحظتك إلى ادارة القناة.\n📬 سيتم الرد عليك قريبًا.\n\n🤝 شكرًا لتواصلك معنا."
             )
-            await query.answer()
+
+            await _cleanup_ui()
+            admin_inquiries.pop(user_id, None)
 
         finally:
-            context.bot_data.pop(lock_key, None)
+            coordinator.release(lock_key, lock_token)
 
     elif data == "cancel_inquiry":
         await _cleanup_ui()
@@ -885,15 +2513,35 @@ async def handle_inquiry_buttons(update: Update, context: ContextTypes.DEFAULT_T
 # =========================
 # إشعار المشرفين (رسالة واحدة + زرّين)
 # =========================
-async def notify_admin_of_inquiry(context: ContextTypes.DEFAULT_TYPE, uid: int):
-    inquiries = context.bot_data.setdefault("inquiries", {})
-    record = inquiries.get(uid)
+async def fan_out(recipients: list[int], send_one) -> dict[str, list[int]]:
+    # إرسال متوازٍ بحد أقصى FANOUT_CONCURRENCY؛ فشل مستلم لا يوقف البقية
+    report = {"delivered": [], "failed": [], "blocked": []}
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+    async def deliver(chat_id: int):
+        async with semaphore:
+            try:
+                await send_one(chat_id)
+            except Forbidden:
+                # المشرف حظر البوت أو لم يبدأ محادثة معه
+                report["blocked"].append(chat_id)
+            except Exception as e:
+                logging.error(f"[FANOUT] فشل الإرسال إلى {chat_id}: {e}")
+                report["failed"].append(chat_id)
+            else:
+                report["delivered"].append(chat_id)
+
+    await asyncio.gather(*(deliver(chat_id) for chat_id in recipients))
+    return report
+
+async def notify_admin_of_inquiry(context: ContextTypes.DEFAULT_TYPE, inq_id: int) -> dict | None:
+    record = inquiry_store.get(inq_id)
     if not record:
-        logging.error(f"[inq] notify_admin_of_inquiry: no record for uid={uid}")
+        logging.error(f"[inq] notify_admin_of_inquiry: no record for id={inq_id}")
         return
 
     user_name      = record.get("user_name") or "غير معروف"
-    user_id        = record.get("user_id") or uid
+    user_id        = record.get("user_id")
     source_chat_id = record.get("source_chat_id")
     text           = (record.get("text") or "").strip()
     media_list     = record.get("media_list") or []
@@ -902,21 +2550,15 @@ async def notify_admin_of_inquiry(context: ContextTypes.DEFAULT_TYPE, uid: int):
         logging.error("[inq] notify_admin_of_inquiry: لا يوجد source_chat_id.")
         return
 
-    admin_ids = []
-    try:
-        admins = await context.bot.get_chat_administrators(source_chat_id)
-        admin_ids = [m.user.id for m in admins if not m.user.is_bot]
-    except Exception as e:
-        logging.error(f"خطأ في جلب قائمة المشرفين ديناميكيًا: {e}")
-
+    admin_ids = await get_admin_ids(context.bot, source_chat_id)
     if not admin_ids:
         logging.error("[inq] notify_admin_of_inquiry: لا يوجد مشرفون.")
         return
 
-    def keyboard(for_user_id: int) -> InlineKeyboardMarkup:
+    def keyboard(ref: str) -> InlineKeyboardMarkup:
         return InlineKeyboardMarkup([
-            [InlineKeyboardButton("💬 رد جاهز", callback_data=f"quick_reply|{for_user_id}")],
-            [InlineKeyboardButton("✍️ رد مخصص", callback_data=f"custom_reply|{for_user_id}")]
+            [InlineKeyboardButton("💬 رد جاهز", callback_data=f"quick_reply|{ref}")],
+            [InlineKeyboardButton("✍️ رد مخصص", callback_data=f"custom_reply|{ref}")]
         ])
 
     def safe_html(s: str | None) -> str:
@@ -926,7 +2568,7 @@ async def notify_admin_of_inquiry(context: ContextTypes.DEFAULT_TYPE, uid: int):
     extra_note = f"\n\n(+{extra_count} وسائط إضافية)" if extra_count > 0 else ""
 
     caption_html = (
-        "<b>📥 ورد استفسار جديد</b>\n"
+        f"<b>📥 ورد استفسار جديد</b> #{inq_id}\n"
         f"👤 <b>المستخدم:</b> <code>{user_name}</code>\n"
         f"🆔 <b>المعرف:</b> <code>{user_id}</code>\n\n"
     )
@@ -936,203 +2578,530 @@ async def notify_admin_of_inquiry(context: ContextTypes.DEFAULT_TYPE, uid: int):
         caption_html += "📝 <b>المحتوى:</b> <i>بدون نص</i>"
     caption_html += extra_note
 
-    for aid in admin_ids:
-        try:
-            if media_list:
-                kind, file_id, _ = media_list[0]  # وسيط واحد فقط لربط الأزرار بالرسالة
-                if kind == "photo":
-                    await context.bot.send_photo(
-                        chat_id=aid, photo=file_id, caption=caption_html,
-                        parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
-                    )
-                elif kind == "video":
-                    await context.bot.send_video(
-                        chat_id=aid, video=file_id, caption=caption_html,
-                        parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
-                    )
-                elif kind == "document":
-                    await context.bot.send_document(
-                        chat_id=aid, document=file_id, caption=caption_html,
-                        parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
-                    )
-                elif kind == "audio":
-                    await context.bot.send_audio(
-                        chat_id=aid, audio=file_id, caption=caption_html,
-                        parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
-                    )
-                elif kind == "voice":
-                    await context.bot.send_voice(
-                        chat_id=aid, voice=file_id, caption=caption_html,
-                        parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
-                    )
-                else:
-                    await context.bot.send_message(
-                        chat_id=aid, text=caption_html + "\n\n⚠️ نوع الوسائط غير مدعوم.",
-                        parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
-                    )
+    admin_keyboard = keyboard(inquiry_ref(inq_id))
+
+    async def send_one(aid: int):
+        if media_list:
+            kind, file_id, _ = media_list[0]  # وسيط واحد فقط لربط الأزرار بالرسالة
+            if kind == "photo":
+                await context.bot.send_photo(
+                    chat_id=aid, photo=file_id, caption=caption_html,
+                    parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
+                )
+            elif kind == "video":
+                await context.bot.send_video(
+                    chat_id=aid, video=file_id, caption=caption_html,
+                    parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
+                )
+            elif kind == "document":
+                await context.bot.send_document(
+                    chat_id=aid, document=file_id, caption=caption_html,
+                    parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
+                )
+            elif kind == "audio":
+                await context.bot.send_audio(
+                    chat_id=aid, audio=file_id, caption=caption_html,
+                    parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
+                )
+            elif kind == "voice":
+                await context.bot.send_voice(
+                    chat_id=aid, voice=file_id, caption=caption_html,
+                    parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
+                )
             else:
                 await context.bot.send_message(
-                    chat_id=aid, text=caption_html,
-                    parse_mode=ParseMode.HTML, reply_markup=keyboard(user_id)
+                    chat_id=aid, text=caption_html + "\n\n⚠️ نوع الوسائط غير مدعوم.",
+                    parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
                 )
-        except Exception as e:
-            logging.error(f"فشل إرسال الاستفسار للمشرف {aid}: {e}")
+        else:
+            await context.bot.send_message(
+                chat_id=aid, text=caption_html,
+                parse_mode=ParseMode.HTML, reply_markup=admin_keyboard, rate_limit_args=PRIORITY_LOW
+            )
+
+    report = await fan_out(admin_ids, send_one)
+    logging.info(
+        f"[inq] fan-out id={inq_id}: delivered={len(report['delivered'])} "
+        f"failed={len(report['failed'])} blocked={len(report['blocked'])}"
+    )
+    inquiry_store.update(inq_id, delivery={k: len(v) for k, v in report.items()})
+    return report
 
 # =========================
 # ردود المشرفين (جاهز/مخصص) + حماية ديناميكية
 # =========================
+QUICK_REPLIES = (
+    "📬 شكرًا لملاحظتك، تم إحالتها للفريق المختص للمراجعة.",
+    "📌 تم استلام اقتراحك، وسيتم دراسته بعناية من قبل الإدارة.",
+    "🤝 نقدر تواصلك، وتم رفع الملاحظة للجهة المعنية.",
+    "📝 الملاحظة وصلت بوضوح، ونشكر اهتمامك.",
+    "🧾 تم استلام استفسارك، وسيتم الرد بأقرب وقت من خلال القناة.",
+    "✅ شكراً لاستفسارك، تمت معالجته وفق سياسة النشر المتبعة لدينا.",
+    "🗂️ استفسارك مهم، وتم رفعه للمتابعة مع القسم المسؤول.",
+    "🌟 شكراً لك على دعمك الجميل، هذا يُحفزنا لتقديم الأفضل.",
+    "💙 نعتز بثقتك، ونأمل أن نكون دائمًا عند حسن الظن.",
+    "📌 المعلومات المتعلقة بالوظائف والدورات تُنشر بشكل دوري في القناة فقط."
+)
+
+
+class QuickReplyRegistry:
+    # قوالب الردود لكل قناة في مخزن الحالة (القناة بلا قوالب خاصة تستخدم QUICK_REPLIES).
+    # كل تعديل يرفع رقم النسخة؛ لوحات الاختيار تُبنى مرة لكل (قناة، صفحة، نسخة) وتُشارك بين كل الضغطات،
+    # والنسخة داخل callback_data ترفض ضغطة على قائمة قديمة بدل إرسال قالب آخر في نفس الموضع.
+    def __init__(self, store: MutableMapping):
+        self._store = store  # chat_id → {"version": n, "items": [...]}
+        self._keyboards: dict[tuple[int, int], tuple[int, InlineKeyboardMarkup]] = {}
+
+    def templates(self, chat_id: int) -> tuple[int, list[str]]:
+        entry = self._store.get(chat_id)
+        if entry is None:
+            return 0, list(QUICK_REPLIES)
+        return entry["version"], entry["items"]
+
+    def locked(self, chat_id: int):
+        # عدة مشرفين لنفس القناة على workers مختلفة: القراءة والتحقق والتعديل كلها داخل قفل القناة
+        return locked_state(self._store, chat_id)
+
+    def _save(self, chat_id: int, version: int, items: list[str]) -> int:
+        self._store[chat_id] = {"version": version + 1, "items": items}
+        return version + 1
+
+    def add(self, chat_id: int, text: str) -> int:
+        version, items = self.templates(chat_id)
+        self._save(chat_id, version, [*items, text])
+        return len(items) + 1
+
+    def edit(self, chat_id: int, index: int, text: str):
+        version, items = self.templates(chat_id)
+        items = list(items)
+        items[index] = text
+        self._save(chat_id, version, items)
+
+    def move(self, chat_id: int, index: int, to: int):
+        version, items = self.templates(chat_id)
+        items = list(items)
+        items.insert(to, items.pop(index))
+        self._save(chat_id, version, items)
+
+    def delete(self, chat_id: int, index: int) -> str:
+        version, items = self.templates(chat_id)
+        items = list(items)
+        removed = items.pop(index)
+        self._save(chat_id, version, items)
+        return removed
+
+    def pages(self, chat_id: int) -> int:
+        return max(1, -(-len(self.templates(chat_id)[1]) // QUICK_REPLY_PAGE_SIZE))
+
+    def picker(self, chat_id: int, page: int = 0) -> InlineKeyboardMarkup:
+        version, items = self.templates(chat_id)
+        page = min(max(page, 0), self.pages(chat_id) - 1)
+        cached = self._keyboards.get((chat_id, page))
+        if cached and cached[0] == version:
+            return cached[1]
+        if len(self._keyboards) > 2000:
+            self._keyboards.clear()
+        keyboard = self._build(version, items, page)
+        self._keyboards[(chat_id, page)] = (version, keyboard)
+        return keyboard
+
+    @staticmethod
+    def _build(version: int, items: list[str], page: int) -> InlineKeyboardMarkup:
+        start = page * QUICK_REPLY_PAGE_SIZE
+        buttons = [
+            [InlineKeyboardButton(text if len(text) <= 60 else text[:59] + "…", callback_data=f"qr|{version}|{i}")]
+            for i, text in enumerate(items[start:start + QUICK_REPLY_PAGE_SIZE], start)
+        ]
+        total = max(1, -(-len(items) // QUICK_REPLY_PAGE_SIZE))
+        if total > 1:
+            nav = []
+            if page > 0:
+                nav.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"qr_page|{version}|{page - 1}"))
+            nav.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data=f"qr_page|{version}|{page}"))
+            if page < total - 1:
+                nav.append(InlineKeyboardButton("التالي ➡️", callback_data=f"qr_page|{version}|{page + 1}"))
+            buttons.append(nav)
+        buttons.append([InlineKeyboardButton("❌ إلغاء", callback_data="cancel_reply")])
+        return InlineKeyboardMarkup(buttons)
+
+
+quick_replies = QuickReplyRegistry(state_store.mapping("quick_reply_templates"))
+
+def picker_key(chat_id: int, message_id: int) -> str:
+    return f"{chat_id}:{message_id}"
+
+async def authorize_inquiry(query, context: ContextTypes.DEFAULT_TYPE, ref: str) -> dict | None:
+    # الاستفسار من مرجع الزر + تحقق أن الضاغط مشرف في قناة/مجموعة الاستفسار
+    record = resolve_inquiry(ref)
+    if not record:
+        await query.answer("⚠️ لم يتم العثور على الاستفسار!", show_alert=True)
+        return None
+    if not await is_admin_in_chat(context, record.get("source_chat_id"), query.from_user.id):
+        await query.answer("غير مخوّل لهذا الاستفسار.", show_alert=True)
+        return None
+    return record
+
 async def handle_quick_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    data_parts = query.data.split("|")
-
-    if len(data_parts) < 2 or not data_parts[1].isdigit():
-        await query.answer("⚠️ لا يمكن تحديد المستخدم!", show_alert=True)
+    record = await authorize_inquiry(query, context, query.data.split("|", 1)[1])
+    if not record:
         return
 
-    user_id = int(data_parts[1])
-
-    # تحقق من أن الضاغط أدمن في نفس القناة/المجموعة الخاصة بالاستفسار
-    rec = context.bot_data.setdefault("inquiries", {}).get(user_id)
-    src = rec.get("source_chat_id") if rec else None
-    if not await is_admin_in_chat(context, src, query.from_user.id):
-        await query.answer("غير مخوّل لهذا الاستفسار.", show_alert=True)
+    chat_id = record.get("source_chat_id")
+    if not quick_replies.templates(chat_id)[1]:
+        await query.answer("لا توجد ردود جاهزة لهذه القناة. أضفها بـ /tpl_add", show_alert=True)
         return
+    # اللوحة مشتركة بين كل الاستفسارات؛ الاستفسار يُعرف من رسالة القائمة نفسها
+    sent = await query.message.reply_text(
+        f"🗂️ اختر الرد الجاهز لإرساله (#{record['id']}):",
+        reply_markup=quick_replies.picker(chat_id)
+    )
+    quick_reply_pickers[picker_key(sent.chat_id, sent.message_id)] = {
+        "inquiry_id": record["id"],
+        "expires_at": time.time() + SESSION_IDLE_TTL,
+    }
+    await query.answer()
 
-    quick_replies = [
-        "📬 شكرًا لملاحظتك، تم إحالتها للفريق المختص للمراجعة.",
-        "📌 تم استلام اقتراحك، وسيتم دراسته بعناية من قبل الإدارة.",
-        "🤝 نقدر تواصلك، وتم رفع الملاحظة للجهة المعنية.",
-        "📝 الملاحظة وصلت بوضوح، ونشكر اهتمامك.",
-        "🧾 تم استلام استفسارك، وسيتم الرد بأقرب وقت من خلال القناة.",
-        "✅ شكراً لاستفسارك، تمت معالجته وفق سياسة النشر المتبعة لدينا.",
-        "🗂️ استفسارك مهم، وتم رفعه للمتابعة مع القسم المسؤول.",
-        "🌟 شكراً لك على دعمك الجميل، هذا يُحفزنا لتقديم الأفضل.",
-        "💙 نعتز بثقتك، ونأمل أن نكون دائمًا عند حسن الظن.",
-        "📌 المعلومات المتعلقة بالوظائف والدورات تُنشر بشكل دوري في القناة فقط."
-    ]
+async def picker_inquiry(query, context: ContextTypes.DEFAULT_TYPE) -> dict | None:
+    picker = quick_reply_pickers.get(picker_key(query.message.chat_id, query.message.message_id))
+    if not picker:
+        await query.answer("⌛ انتهت صلاحية هذه القائمة، افتحها من جديد.", show_alert=True)
+        return None
+    return await authorize_inquiry(query, context, inquiry_ref(picker["inquiry_id"]))
 
-    context.bot_data["quick_reply_map"] = {
-        f"{user_id}_{i}": {"target_user_id": user_id, "text": reply}
-        for i, reply in enumerate(quick_replies)
-    }
+async def handle_pick_quick_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    try:
+        _, version, index = query.data.split("|")
+        version, index = int(version), int(index)
+    except ValueError:
+        await query.answer("⚠️ تنسيق غير صالح!", show_alert=True)
+        return
+    record = await picker_inquiry(query, context)
+    if not record:
+        return
+    chat_id = record.get("source_chat_id")
+    current, items = quick_replies.templates(chat_id)
+    if version != current or index >= len(items):
+        # القوالب عُدّلت بعد فتح القائمة: نعرض الحالية بدل إرسال قالب غير المقصود
+        try:
+            await query.edit_message_reply_markup(reply_markup=quick_replies.picker(chat_id))
+        except BadRequest:
+            pass
+        await query.answer("🔄 تغيّرت الردود الجاهزة، اختر من القائمة المحدّثة.", show_alert=True)
+        return
+    await start_quick_reply(query, record, items[index])
 
-    buttons = [
-        [InlineKeyboardButton(reply, callback_data=f"send_quick_reply|{user_id}_{i}")]
-        for i, reply in enumerate(quick_replies)
-    ]
-    buttons.append([InlineKeyboardButton("❌ إلغاء", callback_data="cancel_reply")])
+async def handle_quick_reply_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    try:
+        page = int(query.data.rsplit("|", 1)[1])
+    except ValueError:
+        await query.answer("⚠️ تنسيق غير صالح!", show_alert=True)
+        return
+    record = await picker_inquiry(query, context)
+    if not record:
+        return
+    try:
+        await query.edit_message_reply_markup(reply_markup=quick_replies.picker(record.get("source_chat_id"), page))
+    except BadRequest:
+        pass  # نفس الصفحة (زر رقم الصفحة)
+    await query.answer()
 
+async def start_quick_reply(query, record: dict, reply_text: str):
+    open_reply_session(query.from_user.id, record, text=reply_text.strip())
     await query.message.reply_text(
-        "🗂️ اختر الرد الجاهز لإرساله:",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        f"📝 الرد المختار:\n\n{reply_text.strip()}\n\n✍️ يمكنك تعديله أو إرسال وسائط الآن، ثم اضغط 📤 للإرسال.",
+        reply_markup=REPLY_SEND_KEYBOARD
     )
     await query.answer()
 
 async def handle_send_quick_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # أزرار القوائم القديمة (قبل قوالب القنوات): الفهرس يشير إلى QUICK_REPLIES
     query = update.callback_query
 
     try:
-        parts = query.data.split("|", 1)
-        if len(parts) != 2:
+        parts = query.data.split("|")
+        if len(parts) == 2 and "_" in parts[1]:
+            # الشكل القديم: send_quick_reply|<user_id>_<index>
+            parts = [parts[0], *parts[1].rsplit("_", 1)]
+        if len(parts) != 3 or not parts[2].isdigit() or int(parts[2]) >= len(QUICK_REPLIES):
             await query.answer("⚠️ تنسيق غير صالح!", show_alert=True)
             return
 
-        key = parts[1]
-        quick_map = context.bot_data.get("quick_reply_map", {})
-        record = quick_map.get(key)
-
+        record = await authorize_inquiry(query, context, parts[1])
         if not record:
-            await query.answer("⚠️ لم يتم العثور على الرد!", show_alert=True)
             return
 
-        user_id = record["target_user_id"]
+        await start_quick_reply(query, record, QUICK_REPLIES[int(parts[2])])
 
-        # تحقق صلاحية المشرف
-        rec = context.bot_data.setdefault("inquiries", {}).get(user_id)
-        src = rec.get("source_chat_id") if rec else None
-        if not await is_admin_in_chat(context, src, query.from_user.id):
-            await query.answer("غير مخوّل لهذا الاستفسار.", show_alert=True)
-            return
+    except Exception as e:
+        logging.error(f"❌ خطأ أثناء تجهيز الرد الجاهز: {e}")
+        await query.answer("حدث خطأ أثناء المعالجة", show_alert=True)
 
-        reply_text = record["text"]
-        context.bot_data["reply_payload"] = {"target_id": user_id, "text": reply_text.strip(), "media": None}
-        context.bot_data["current_reply"] = {"admin_id": query.from_user.id, "target_user_id": user_id}
+# =========================
+# إدارة القوالب: /templates /tpl_add /tpl_edit /tpl_move /tpl_del (على القناة المربوطة)
+# =========================
+async def template_channel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int | None:
+    if update.effective_chat.type != "private":
+        return None
+    user_id = update.effective_user.id
+    chat_id = (admin_sessions.get(user_id) or {}).get("target_channel_id")
+    if not chat_id:
+        await update.message.reply_text("⚠️ اربط قناتك أولًا بإعادة توجيه منشور منها أو /bind @اسم_القناة")
+        return None
+    if not await is_admin_in_chat(context, chat_id, user_id):
+        await update.message.reply_text("⚠️ يجب أن تكون مشرفًا في هذه القناة/المجموعة.")
+        return None
+    return chat_id
+
+def template_number(raw: str, count: int) -> int | None:
+    # الأرقام للمشرف تبدأ من 1
+    return int(raw) - 1 if raw.isdigit() and 1 <= int(raw) <= count else None
+
+def template_text(text: str) -> str | None:
+    text = text.strip()
+    return text if text and len(text) <= QUICK_REPLY_MAX_CHARS else None
+
+async def templates_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = await template_channel(update, context)
+    if not chat_id:
+        return
+    version, items = quick_replies.templates(chat_id)
+    if not items:
+        await update.message.reply_text("📭 لا توجد ردود جاهزة. أضف بـ /tpl_add <النص>")
+        return
+    origin = "افتراضية" if version == 0 else f"نسخة {version}"
+    lines = [f"🗂️ الردود الجاهزة ({chat_id}, {origin}):"]
+    lines += [f"{i}. {text}" for i, text in enumerate(items, 1)]
+    lines.append("\n/tpl_add <النص> • /tpl_edit <رقم> <النص> • /tpl_move <من> <إلى> • /tpl_del <رقم>")
+    await update.message.reply_text("\n".join(lines))
+
+async def tpl_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = await template_channel(update, context)
+    if not chat_id:
+        return
+    parts = update.message.text.split(maxsplit=1)
+    text = template_text(parts[1]) if len(parts) == 2 else None
+    if not text:
+        await update.message.reply_text(f"اكتب هكذا:\n/tpl_add نص الرد (حتى {QUICK_REPLY_MAX_CHARS} حرف)")
+        return
+    async with quick_replies.locked(chat_id):
+        full = len(quick_replies.templates(chat_id)[1]) >= QUICK_REPLY_MAX_TEMPLATES
+        if not full:
+            number = quick_replies.add(chat_id, text)
+    if full:
+        await update.message.reply_text(f"⚠️ الحد الأقصى {QUICK_REPLY_MAX_TEMPLATES} ردًا لكل قناة.")
+        return
+    await update.message.reply_text(f"✅ أُضيف الرد رقم {number}.")
 
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📤 إرسال الرد", callback_data="send_custom_reply")],
-            [InlineKeyboardButton("❌ إلغاء", callback_data="cancel_reply")]
-        ])
+async def tpl_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = await template_channel(update, context)
+    if not chat_id:
+        return
+    parts = update.message.text.split(maxsplit=2)
+    text = template_text(parts[2]) if len(parts) == 3 else None
+    async with quick_replies.locked(chat_id):
+        index = template_number(parts[1], len(quick_replies.templates(chat_id)[1])) if len(parts) == 3 else None
+        if index is not None and text:
+            quick_replies.edit(chat_id, index, text)
+    if index is None or not text:
+        await update.message.reply_text("اكتب هكذا:\n/tpl_edit 3 النص الجديد")
+        return
+    await update.message.reply_text(f"✅ عُدّل الرد رقم {index + 1}.")
 
-        await query.message.reply_text(
-            f"📝 الرد المختار:\n\n{reply_text.strip()}\n\n✍️ يمكنك تعديله أو إرسال وسائط الآن، ثم اضغط 📤 للإرسال.",
-            reply_markup=keyboard
-        )
-        await query.answer()
+async def tpl_move(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = await template_channel(update, context)
+    if not chat_id:
+        return
+    args = context.args or []
+    async with quick_replies.locked(chat_id):
+        count = len(quick_replies.templates(chat_id)[1])
+        index = template_number(args[0], count) if len(args) == 2 else None
+        to = template_number(args[1], count) if len(args) == 2 else None
+        if index is not None and to is not None:
+            quick_replies.move(chat_id, index, to)
+    if index is None or to is None:
+        await update.message.reply_text("اكتب هكذا:\n/tpl_move 5 1  (ينقل الرد 5 إلى الموضع 1)")
+        return
+    await update.message.reply_text(f"✅ نُقل الرد {index + 1} إلى الموضع {to + 1}.")
 
-    except Exception as e:
-        logging.error(f"❌ خطأ أثناء تجهيز الرد الجاهز: {e}")
-        await query.answer("حدث خطأ أثناء المعالجة", show_alert=True)
+async def tpl_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = await template_channel(update, context)
+    if not chat_id:
+        return
+    args = context.args or []
+    async with quick_replies.locked(chat_id):
+        index = template_number(args[0], len(quick_replies.templates(chat_id)[1])) if len(args) == 1 else None
+        if index is not None:
+            removed = quick_replies.delete(chat_id, index)
+    if index is None:
+        await update.message.reply_text("اكتب هكذا:\n/tpl_del 3")
+        return
+    await update.message.reply_text(f"🗑️ حُذف الرد {index + 1}:\n{removed}")
 
 async def handle_custom_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     data_parts = query.data.split("|")
 
-    if len(data_parts) < 2 or not data_parts[1].isdigit():
+    if len(data_parts) < 2:
         await query.answer("⚠️ لا يمكن تحديد المستخدم!", show_alert=True)
         return
 
-    target_user_id = int(data_parts[1])
-
-    # تحقق صلاحية المشرف
-    rec = context.bot_data.setdefault("inquiries", {}).get(target_user_id)
-    src = rec.get("source_chat_id") if rec else None
-    if not await is_admin_in_chat(context, src, query.from_user.id):
-        await query.answer("غير مخوّل لهذا الاستفسار.", show_alert=True)
+    record = await authorize_inquiry(query, context, data_parts[1])
+    if not record:
         return
 
-    context.bot_data["current_reply"] = {
-        "admin_id": query.from_user.id,
-        "target_user_id": target_user_id
-    }
+    open_reply_session(query.from_user.id, record)
 
     await query.message.reply_text("✍️ الرجاء كتابة الرد المخصص الآن...")
     await query.answer()
 
-async def handle_admin_reply_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print("▶ Entered handle_admin_reply_content, current_reply =", context.bot_data.get("current_reply"))
+def open_reply_session(admin_id: int, record: dict, text: str | None = None):
+    # جلسة رد مستقلة لكل مشرف: فتح رد جديد يستبدل مسودة نفس المشرف فقط
+    reply_sessions[admin_id] = {
+        "inquiry_id": record["id"],
+        "target_id": record["user_id"],
+        "user_name": record.get("user_name"),
+        "text": text,
+        "media": None,
+        "expires_at": time.time() + REPLY_SESSION_TTL,
+    }
 
-    # الحدث بدون رسالة
-    if not getattr(update, "message", None):
-        return
+def get_reply_session(admin_id: int) -> dict | None:
+    session = reply_sessions.get(admin_id)
+    if session and session.get("expires_at", 0) <= time.time():
+        reply_sessions.pop(admin_id, None)
+        return None
+    return session
+
+def reply_inquiry(reply: dict) -> dict | None:
+    if reply.get("inquiry_id"):
+        return inquiry_store.get(reply["inquiry_id"])
+    return inquiry_store.latest_for_user(reply["target_id"])
+
+async def sweep_reply_sessions():
+    now = time.time()
+    async with fresh_state():
+        expired = [aid for aid, s in reply_sessions.items() if s.get("expires_at", 0) <= now]
+        for aid in expired:
+            reply_sessions.pop(aid, None)
+        for key in [k for k, p in quick_reply_pickers.items() if p.get("expires_at", 0) <= now]:
+            quick_reply_pickers.pop(key, None)
+    if expired:
+        logging.info("[REPLY] expired %d draft replies", len(expired))
 
-    admin_id = update.effective_user.id
+# =========================
+# انتهاء الجلسات المتروكة (مسودات النشر والاستفسارات)
+# =========================
+# عدد الجلسات الحية في آخر دورة تنظيف (len() على المخزن تُحمّل النطاق كاملًا من القرص)
+session_live_counts: dict[str, int] = {}
+
+# ما يبقى في جلسة المشرف بعد النشر أو الإلغاء؛ أي مفتاح آخر يعني مسودة مفتوحة
+BINDING_KEYS = frozenset({"target_channel_id", "destinations", "touched_at"})
+
+def publish_draft_open(session: dict) -> bool:
+    return any(key not in BINDING_KEYS for key in session)
+
+def touch_sessions(user_id: int):
+    # بعد كل تحديث من الخاص: آخر نشاط هو ما يحدد الانتهاء وترتيب الإخلاء
+    now = time.time()
+    for sessions in (admin_sessions, admin_inquiries):
+        session = sessions.get(user_id)
+        if session and now - session.get("touched_at", 0) >= SESSION_TOUCH_INTERVAL:
+            session["touched_at"] = now
+
+def draft_controls(session: dict) -> list[tuple[int, int]]:
+    # رسائل الأزرار المرتبطة بالمسودة: لوحة التحكم، المعاينة، التأكيد
+    return [
+        (session[f"{kind}_chat_id"], session[f"{kind}_msg_id"])
+        for kind in ("controls", "preview", "confirm")
+        if session.get(f"{kind}_chat_id") and session.get(f"{kind}_msg_id")
+    ]
 
-    # لو المشرف داخل جلسة استفسار كمستخدم
-    inq = admin_inquiries.get(admin_id)
-    if inq and inq.get("stage") == "awaiting_text_or_media":
+def expire_publish_draft(user_id: int, session: dict):
+    # الربط بالقناة يبقى؛ تُحذف المسودة فقط (مثل /reset_publish)
+    admin_sessions[user_id] = binding_of(session) if session.get("target_channel_id") else {}
+
+def expire_inquiry(user_id: int, session: dict):
+    admin_inquiries.pop(user_id, None)
+
+def evict_idle_sessions(name: str, sessions, is_live, expire, now: float) -> tuple[int, list[tuple[int, int]]]:
+    # يرجع عدد الجلسات المحذوفة ورسائل الأزرار التي تخصها
+    live = []
+    for user_id in list(sessions):
+        session = sessions.get(user_id)
+        if not session or not is_live(session):
+            continue
+        if "touched_at" not in session:
+            # جلسة أقدم من تتبع النشاط: نبدأ العد من الآن
+            session["touched_at"] = now
+        live.append((session["touched_at"], user_id))
+    live.sort()
+    over = max(0, len(live) - SESSION_MAX_ENTRIES) if SESSION_MAX_ENTRIES else 0
+    controls = []
+    evicted = 0
+    for i, (touched_at, user_id) in enumerate(live):
+        if touched_at <= now - SESSION_IDLE_TTL:
+            reason = "ttl"
+        elif i < over:
+            reason = "cap"
+        else:
+            break  # مرتبة بالأقدم: ما بعدها حديث وضمن الحد
+        session = sessions[user_id]
+        controls += draft_controls(session)
+        expire(user_id, session)
+        SESSIONS_EVICTED.inc(name, reason)
+        evicted += 1
+    session_live_counts[name] = len(live) - evicted
+    return evicted, controls
+
+async def strip_draft_controls(bot, controls: list[tuple[int, int]]):
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+    async def strip(chat_id: int, message_id: int):
+        async with semaphore:
+            try:
+                await bot.edit_message_reply_markup(
+                    chat_id=chat_id, message_id=message_id, reply_markup=None, rate_limit_args=PRIORITY_LOW
+                )
+            except Exception:
+                pass  # الرسالة حُذفت أو عُدّلت مسبقًا
+
+    await asyncio.gather(*(strip(chat_id, message_id) for chat_id, message_id in controls))
+
+async def sweep_idle_sessions():
+    # الوضع المشترك: worker واحد يكفي لكل دورة (القفل لا يُحرَّر فينتهي مع الدورة)
+    if coordinator.acquire("session_sweep", SESSION_SWEEP_INTERVAL / 2) is None:
         return
+    now = time.time()
+    async with fresh_state():
+        drafts, controls = evict_idle_sessions(
+            "admin_sessions", admin_sessions, publish_draft_open, expire_publish_draft, now)
+        inquiries, inquiry_controls = evict_idle_sessions(
+            "admin_inquiries", admin_inquiries, lambda session: True, expire_inquiry, now)
+    purged = coordinator.purge_locks()
+    controls += inquiry_controls
+    if controls and SESSION_STRIP_CONTROLS and application is not None:
+        await strip_draft_controls(application.bot, controls)
+    if drafts or inquiries or purged:
+        logging.info("[SESSIONS] evicted %d publish drafts and %d inquiries, purged %d stale locks",
+                     drafts, inquiries, purged)
 
-    current_reply = context.bot_data.get("current_reply")
+async def handle_admin_reply_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logging.info("▶ Enter handle_admin_reply_content")
 
-    # لا توجد جلسة رد → قد تكون جلسة نشر
-    if not current_reply:
-        pub = admin_sessions.get(admin_id)
-        if pub and pub.get("awaiting_input"):
-            if update.message.text:
-                await handle_text(update, context)
-            elif any([update.message.photo, update.message.video, update.message.document, update.message.audio, update.message.voice]):
-                await handle_media(update, context)
+    admin_id = update.effective_user.id
+    reply = get_reply_session(admin_id)
+    if not reply:
         return
 
-    # استخراج target_id
-    target_id = None
-    if isinstance(current_reply, dict):
-        target_id = (current_reply.get("target_user_id") or current_reply.get("target") or current_reply.get("user_id"))
+    target_id = reply.get("target_id")
     if not target_id:
         return
 
     # تحقق صلاحية المشرف قبل حفظ الرد
-    rec = context.bot_data.setdefault("inquiries", {}).get(target_id)
+    rec = reply_inquiry(reply)
     src = rec.get("source_chat_id") if rec else None
     if not await is_admin_in_chat(context, src, admin_id):
         return
@@ -1141,18 +3110,15 @@ async def handle_admin_reply_content(update: Update, context: ContextTypes.DEFAU
     caption = update.message.caption
     media = None
 
-    previous = context.bot_data.get("reply_payload", {})
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📤 إرسال الرد", callback_data="send_custom_reply")],
-        [InlineKeyboardButton("❌ إلغاء", callback_data="cancel_reply")]
-    ])
+    # قد تكون الجلسة تغيّرت أثناء التحقق من الصلاحية: نصل إليها من جديد
+    reply = reply_sessions.get(admin_id)
+    if not reply or reply.get("target_id") != target_id:
+        return
+    reply["expires_at"] = time.time() + REPLY_SESSION_TTL
+    keyboard = REPLY_SEND_KEYBOARD
 
     if text:
-        context.bot_data["reply_payload"] = {
-            "target_id": target_id,
-            "text": auto_hide_links(text),
-            "media": previous.get("media")
-        }
+        reply["text"] = auto_hide_links(text)
         await update.message.reply_text(
             "✍️ تم حفظ النص. أضف وسائط الآن أو اضغط 📤 للإرسال.",
             reply_markup=keyboard
@@ -1176,24 +3142,25 @@ async def handle_admin_reply_content(update: Update, context: ContextTypes.DEFAU
         await update.message.reply_text("🎙️ تم حفظ الرسالة الصوتية. اكتب نصًا أو اضغط 📤 للإرسال.", reply_markup=keyboard)
 
     if media:
-        context.bot_data["reply_payload"] = {
-            "target_id": target_id,
-            "text": previous.get("text", caption if caption else ""),
-            "media": media
-        }
+        reply = reply_sessions.get(admin_id)
+        if reply is not None:
+            reply["media"] = media
+            if reply.get("text") is None:
+                reply["text"] = caption or ""
 
 async def send_custom_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    payload = context.bot_data.pop("reply_payload", {})
+    payload = get_reply_session(query.from_user.id) or {}
     target_id = payload.get("target_id")
 
     if not target_id:
-        await query.answer("لا توجد جلسة رد", show_alert=True)
+        await query.answer("لا توجد جلسة رد أو انتهت صلاحيتها", show_alert=True)
         return
+    reply_sessions.pop(query.from_user.id, None)
 
     # تحقق صلاحية المشرف
-    rec = context.bot_data.setdefault("inquiries", {}).get(target_id)
-    src = rec.get("source_chat_id") if rec else None
+    record = reply_inquiry(payload) or {}
+    src = record.get("source_chat_id")
     if not await is_admin_in_chat(context, src, query.from_user.id):
         await query.answer("غير مخوّل لهذا الاستفسار.", show_alert=True)
         return
@@ -1206,8 +3173,6 @@ async def send_custom_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     intro_text = "📩 رد على مداخلتك من قبل إدارة القناة\n\n"
     outro_text = "\n\n🤝 شكرًا لتواصلك معنا."
 
-    inquiries = context.bot_data.setdefault("inquiries", {})
-    record = inquiries.get(target_id, {})
     handled_by = record.get("handled_by")
     handled_by_id = record.get("handled_by_id")
 
@@ -1227,24 +3192,25 @@ async def send_custom_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
             caption = f"{intro_text}{caption or text or ''}{outro_text}"
 
             if kind == "photo":
-                await context.bot.send_photo(chat_id=target_id, photo=file_id, caption=caption)
+                await context.bot.send_photo(chat_id=target_id, photo=file_id, caption=caption, rate_limit_args=PRIORITY_HIGH)
             elif kind == "video":
-                await context.bot.send_video(chat_id=target_id, video=file_id, caption=caption)
+                await context.bot.send_video(chat_id=target_id, video=file_id, caption=caption, rate_limit_args=PRIORITY_HIGH)
             elif kind == "document":
-                await context.bot.send_document(chat_id=target_id, document=file_id, caption=caption)
+                await context.bot.send_document(chat_id=target_id, document=file_id, caption=caption, rate_limit_args=PRIORITY_HIGH)
             elif kind == "audio":
-                await context.bot.send_audio(chat_id=target_id, audio=file_id, caption=caption)
+                await context.bot.send_audio(chat_id=target_id, audio=file_id, caption=caption, rate_limit_args=PRIORITY_HIGH)
             elif kind == "voice":
-                await context.bot.send_voice(chat_id=target_id, voice=file_id, caption=caption)
+                await context.bot.send_voice(chat_id=target_id, voice=file_id, caption=caption, rate_limit_args=PRIORITY_HIGH)
         else:
             caption = f"{intro_text}{text or ''}{outro_text}"
-            await context.bot.send_message(chat_id=target_id, text=caption)
+            await context.bot.send_message(chat_id=target_id, text=caption, rate_limit_args=PRIORITY_HIGH)
 
         # علّم الاستفسار كمُعالج (اسم المشرف محفوظ)
-        record["handled_by"] = admin_name
-        record["handled_by_id"] = admin_id
-        record["handled_at"] = datetime.now().isoformat()
-        inquiries[target_id] = record
+        if record.get("id"):
+            inquiry_store.update(
+                record["id"], status=INQUIRY_ANSWERED,
+                handled_by=admin_name, handled_by_id=admin_id, handled_at=datetime.now().isoformat(),
+            )
 
         # إشعار مشرفي نفس القناة/المجموعة (ديناميكي)
         user_name = record.get("user_name", "غير معروف")
@@ -1259,20 +3225,14 @@ async def send_custom_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         src_chat = record.get("source_chat_id")
-        if src_chat:
-            try:
-                admins = await context.bot.get_chat_administrators(src_chat)
-                admin_ids = [m.user.id for m in admins if not m.user.is_bot]
-            except Exception:
-                admin_ids = []
-        else:
-            admin_ids = []
+        admin_ids = await get_admin_ids(context.bot, src_chat) if src_chat else []
 
-        for aid in admin_ids:
-            try:
-                await context.bot.send_message(chat_id=aid, text=notify_msg, parse_mode=ParseMode.MARKDOWN)
-            except Exception as e:
-                logging.error(f"فشل إشعار المشرف {aid} بنتيجة الرد: {e}")
+        async def notify_one(aid: int):
+            await context.bot.send_message(
+                chat_id=aid, text=notify_msg, parse_mode=ParseMode.MARKDOWN, rate_limit_args=PRIORITY_LOW
+            )
+
+        context.application.create_task(fan_out(admin_ids, notify_one))
 
         try:
             await query.message.edit_reply_markup(reply_markup=None)
@@ -1280,7 +3240,6 @@ async def send_custom_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
 
         await query.answer()
-        context.bot_data.pop("current_reply", None)
 
     except Exception as e:
         logging.error(f"❌ خطأ أثناء إرسال الرد: {e}")
@@ -1291,16 +3250,11 @@ async def handle_reply_button(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     if not query.data.startswith("reply_"):
         return
-    target_id = int(query.data.split("_", 1)[1])
-
-    # تحقق صلاحية المشرف
-    rec = context.bot_data.setdefault("inquiries", {}).get(target_id)
-    src = rec.get("source_chat_id") if rec else None
-    if not await is_admin_in_chat(context, src, query.from_user.id):
-        await query.answer("غير مخوّل لهذا الاستفسار.", show_alert=True)
+    record = await authorize_inquiry(query, context, query.data.split("_", 1)[1])
+    if not record:
         return
 
-    context.bot_data["current_reply"] = {"target": target_id}
+    open_reply_session(query.from_user.id, record)
     await query.message.reply_text("✍️ الرجاء الآن كتابة الرد:")
     await query.answer()
 
@@ -1309,13 +3263,8 @@ async def cancel_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     admin_name = query.from_user.full_name
 
-    current_reply = context.bot_data.pop("current_reply", None)
-    if isinstance(current_reply, dict):
-        user_id = current_reply.get("target")
-        user_name = current_reply.get("user_name", "مستخدم غير معروف")
-    else:
-        user_id = current_reply
-        user_name = "مستخدم غير معروف"
+    reply = reply_sessions.pop(query.from_user.id, None) or {}
+    user_name = reply.get("user_name") or "مستخدم غير معروف"
 
     await query.message.reply_text(
         text=(
@@ -1329,64 +3278,1072 @@ async def cancel_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
 # =========================
-# بناء تطبيق تيليجرام وتسجيل الهاندلرات (عالميًا)
+# صندوق الاستفسارات المعلّقة (/inbox)
+# =========================
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+def render_inbox(chat_id: int, before: int | None = None, after: int | None = None):
+    # نطلب عنصرًا زائدًا فقط لنعرف هل توجد صفحة أخرى في نفس الاتجاه
+    rows = inquiry_store.page(chat_id, INQUIRY_PENDING, before=before, after=after, limit=INBOX_PAGE_SIZE + 1)
+    if after is not None:
+        has_newer, has_older = len(rows) > INBOX_PAGE_SIZE, True
+        rows = rows[-INBOX_PAGE_SIZE:]
+    else:
+        has_newer, has_older = before is not None, len(rows) > INBOX_PAGE_SIZE
+        rows = rows[:INBOX_PAGE_SIZE]
+
+    if not rows:
+        return "📭 لا توجد استفسارات معلّقة هنا.", None
+
+    lines = [f"📥 الاستفسارات المعلّقة ({chat_id}):"]
+    buttons = []
+    for r in rows:
+        preview = HTML_TAG_RE.sub("", r.get("text") or "📎 وسائط فقط")[:80]
+        sent_at = (r.get("sent_at") or "")[:16].replace("T", " ")
+        lines.append(f"\n#{r['id']} • {r.get('user_name') or 'غير معروف'} • {sent_at}\n{preview}")
+        ref = inquiry_ref(r["id"])
+        buttons.append([
+            InlineKeyboardButton(f"💬 رد جاهز #{r['id']}", callback_data=f"quick_reply|{ref}"),
+            InlineKeyboardButton(f"✍️ رد مخصص #{r['id']}", callback_data=f"custom_reply|{ref}"),
+        ])
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton("⬅️ الأحدث", callback_data=f"inbox|{chat_id}|>{rows[0]['id']}"))
+    if has_older:
+        nav.append(InlineKeyboardButton("الأقدم ➡️", callback_data=f"inbox|{chat_id}|<{rows[-1]['id']}"))
+    if nav:
+        buttons.append(nav)
+    return "\n".join(lines), InlineKeyboardMarkup(buttons)
+
+async def inbox_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type != "private":
+        return
+    user_id = update.effective_user.id
+    args = context.args or []
+    if args and args[0].lstrip("-").isdigit():
+        chat_id = int(args[0])
+    else:
+        chat_id = (admin_sessions.get(user_id) or {}).get("target_channel_id")
+    if not chat_id:
+        await update.message.reply_text("⚠️ اربط قناتك أولًا بإعادة توجيه منشور منها، أو استخدم: /inbox <chat_id>")
+        return
+    if not await is_admin_in_chat(context, chat_id, user_id):
+        await update.message.reply_text("⚠️ يجب أن تكون مشرفًا في هذه القناة/المجموعة.")
+        return
+    text, keyboard = render_inbox(chat_id)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+async def handle_inbox_nav(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    try:
+        _, raw_chat, cursor = query.data.split("|", 2)
+        chat_id, cursor_id = int(raw_chat), int(cursor[1:])
+    except ValueError:
+        await query.answer("⚠️ تنسيق غير صالح!", show_alert=True)
+        return
+    if not await is_admin_in_chat(context, chat_id, query.from_user.id):
+        await query.answer("غير مخوّل لهذا الصندوق.", show_alert=True)
+        return
+    if cursor.startswith(">"):
+        text, keyboard = render_inbox(chat_id, after=cursor_id)
+    else:
+        text, keyboard = render_inbox(chat_id, before=cursor_id)
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard)
+    except BadRequest:
+        pass
+    await query.answer()
+
+# =========================
+# مقاييس Prometheus (سجل داخلي بصيغة النص بدون مكتبات إضافية)
+# =========================
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help_text, labelnames, buckets
+        self.values: dict[tuple, list] = {}  # labels → [عدّاد لكل bucket..., sum, count]
+
+    def observe(self, value: float, *labels):
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def samples(self):
+        for labels, row in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {row[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {row[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {row[-1]}"
+
+
+class Gauge:
+    # القيمة تُحسب لحظة القراءة من دالة ترجع {labels: value}
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, collect):
+        self.name, self.help, self.labelnames, self.collect = name, help_text, labelnames, collect
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                logging.error(f"[METRICS] فشل جمع {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+UPDATES_TOTAL = metrics.register(Counter(
+    "bot_updates_total", "Updates received, by update type.", ("type",)))
+UPDATES_IGNORED = metrics.register(Counter(
+    "bot_updates_ignored_total", "Updates dropped before deserialization because no handler wants them.", ("type",)))
+UPDATES_DUPLICATE = metrics.register(Counter(
+    "bot_updates_duplicate_total", "Redelivered updates dropped before processing, by reason.", ("reason",)))
+HANDLER_SECONDS = metrics.register(Histogram(
+    "bot_handler_duration_seconds", "Handler latency.", ("handler",)))
+HANDLER_ERRORS = metrics.register(Counter(
+    "bot_handler_errors_total", "Handler exceptions.", ("handler",)))
+API_REQUESTS = metrics.register(Counter(
+    "bot_api_requests_total", "Bot API calls, by method.", ("method",)))
+API_SECONDS = metrics.register(Histogram(
+    "bot_api_request_duration_seconds", "Bot API call latency (excluding rate-limit wait).", ("method",)))
+API_ERRORS = metrics.register(Counter(
+    "bot_api_errors_total", "Failed Bot API calls, by method and error.", ("method", "error")))
+API_RETRY_AFTER = metrics.register(Counter(
+    "bot_api_retry_after_total", "429 RetryAfter responses, by method.", ("method",)))
+UPDATE_SECONDS = metrics.register(Histogram(
+    "bot_update_duration_seconds", "End-to-end processing time per update, by type.", ("type",)))
+LOCK_WAIT_SECONDS = metrics.register(Histogram(
+    "bot_lock_wait_seconds", "Time spent waiting for a coordination lock, by scope.", ("scope",)))
+LOCK_TIMEOUTS = metrics.register(Counter(
+    "bot_lock_timeouts_total", "Coordination lock waits that exceeded COORDINATION_LOCK_WAIT.", ("scope",)))
+
+def resident_size(mapping) -> int:
+    return mapping.resident_count() if isinstance(mapping, PersistentMapping) else len(mapping)
+
+metrics.register(Gauge("bot_session_map_size", "Entries held in memory per session map.", ("map",), lambda: {
+    ("admin_sessions",): resident_size(admin_sessions),
+    ("admin_inquiries",): resident_size(admin_inquiries),
+    ("reply_sessions",): resident_size(reply_sessions),
+    ("quick_reply_pickers",): resident_size(quick_reply_pickers),
+    ("admin_cache",): len(admin_cache),
+    ("admin_rosters",): len(admin_rosters),
+    ("reaction_hot_posts",): len(reaction_dedup.hot),
+}))
+SESSIONS_EVICTED = metrics.register(Counter(
+    "bot_sessions_evicted_total", "Abandoned drafts removed by the session sweeper.", ("map", "reason")))
+metrics.register(Gauge("bot_sessions_live", "Open drafts per session map at the last sweep.", ("map",), lambda: {
+    (name,): count for name, count in session_live_counts.items()
+}))
+metrics.register(Gauge("bot_startup_phase_seconds", "Duration of each cold-start phase.", ("phase",), lambda: {
+    (name,): seconds for name, seconds in startup_phases.items()
+}))
+metrics.register(Gauge("bot_update_queue_depth", "Updates waiting in the in-process queue.", (), lambda: {
+    (): update_queue.qsize() if update_queue else 0,
+}))
+metrics.register(Gauge("bot_rate_limiter_waiters", "Requests waiting for a rate-limit token.", (), lambda: {
+    (): len(rate_limiter._waiters),
+}))
+
+CAMEL_RE = re.compile(r"(?<!^)(?=[A-Z])")
+
+def api_method_label(endpoint: str) -> str:
+    # sendPhoto → send_photo (نفس أسماء دوال PTB)
+    return CAMEL_RE.sub("_", endpoint).lower()
+
+def update_type(data: dict) -> str:
+    return next((k for k in data if k != "update_id"), "unknown")
+
+def timed_handler(callback):
+    name = callback.__name__
+
+    async def wrapper(update, context):
+        t0 = time.perf_counter()
+        try:
+            with span(f"handler:{name}"):
+                return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, name)
+
+    wrapper.__name__ = name
+    return wrapper
+
+def instrument_handlers(app):
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = timed_handler(handler.callback)
+
+# =========================
+# تتبّع التحديثات البطيئة (شجرة spans لكل تحديث عبر contextvars)
+# =========================
+class Span:
+    __slots__ = ("name", "start", "end", "attrs", "children")
+
+    def __init__(self, name: str, attrs: dict | None = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attrs = attrs or {}
+        self.children: list[Span] = []
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        out = {"name": self.name, "at_ms": round((self.start - origin) * 1000, 2), "ms": round((end - self.start) * 1000, 2)}
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.children:
+            out["children"] = [child.to_dict(origin) for child in self.children]
+        return out
+
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+trace_task: ContextVar[asyncio.Task | None] = ContextVar("trace_task", default=None)
+# أبطأ التحديثات: min-heap من (ms, seq, trace) بحجم SLOW_TRACE_KEEP
+slow_traces: list = []
+trace_stats = {"traced": 0, "slow": 0, "profiled": 0}
+# cProfile واحد للعملية: التحديثات تتداخل على نفس الخيط وخطّاف البروفايل واحد لكل خيط،
+# فنبروفل تحديثًا واحدًا في كل مرة ونتخطى ما يبدأ أثناءه
+update_profiler_busy = False
+
+@contextmanager
+def span(name: str, **attrs):
+    parent = current_span.get()
+    if parent is None or parent.end is not None:
+        # خارج تحديث (مهمة خلفية بدأت بعد انتهائه، أو المجدول): لا تتبّع
+        yield None
+        return
+    if asyncio.current_task() is not trace_task.get():
+        # مهمة خلفية أطلقها الهاندلر وما زالت ترث السياق
+        attrs["background"] = True
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+def start_update_profiler():
+    global update_profiler_busy
+    if not SLOW_UPDATE_PROFILE or update_profiler_busy:
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # أداة أخرى تراقب الخيط (3.12+: sys.monitoring)؛ لا نُفشل التحديث بسببها
+        return None
+    update_profiler_busy = True
+    trace_stats["profiled"] += 1
+    return profiler
+
+def stop_update_profiler(profiler):
+    global update_profiler_busy
+    if profiler:
+        profiler.disable()
+        update_profiler_busy = False
+
+async def traced_process_update(update: Update, data: dict):
+    root = Span("update", {"update_id": data.get("update_id"), "type": update_type(data)})
+    span_token = current_span.set(root)
+    task_token = trace_task.set(asyncio.current_task())
+    # الملف يشمل كل ما نُفّذ على الخيط أثناء هذا التحديث، بما فيه تحديثات أخرى متزامنة
+    profiler = start_update_profiler()
+    try:
+        await application.process_update(update)
+    finally:
+        stop_update_profiler(profiler)
+        root.end = time.perf_counter()
+        current_span.reset(span_token)
+        trace_task.reset(task_token)
+        elapsed = root.end - root.start
+        trace_stats["traced"] += 1
+        UPDATE_SECONDS.observe(elapsed, root.attrs["type"])
+        if elapsed * 1000 >= SLOW_UPDATE_MS:
+            record_slow_trace(root, profiler)
+
+def record_slow_trace(root: Span, profiler=None):
+    trace = {
+        "update_id": root.attrs.get("update_id"),
+        "type": root.attrs.get("type"),
+        "ms": round((root.end - root.start) * 1000, 2),
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "spans": root.to_dict(root.start),
+    }
+    if profiler:
+        import io
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        trace["profile"] = out.getvalue()
+    trace_stats["slow"] += 1
+    entry = (trace["ms"], trace_stats["slow"], trace)
+    if len(slow_traces) < SLOW_TRACE_KEEP:
+        heapq.heappush(slow_traces, entry)
+    else:
+        heapq.heappushpop(slow_traces, entry)
+    logging.warning("[TRACE] slow update %s (%s): %.0f ms", trace["update_id"], trace["type"], trace["ms"])
+
+# =========================
+# منظّم الإرسال: حدود تيليجرام (عام / لكل محادثة / لكل مجموعة) + أولويات
 # =========================
-application = ApplicationBuilder().token(TOKEN).build()
-
-# أوامر
-application.add_handler(CommandHandler("start", start), group=0)
-application.add_handler(CommandHandler("jop", handle_jop_command), group=0)
-
-application.add_handler(CommandHandler("webhookinfo", webhookinfo), group=0)
-application.add_handler(CommandHandler("status", status_cmd), group=0)
-application.add_handler(CommandHandler("reset", reset_publish), group=0)
-
-# ربط الوجهة عبر إعادة توجيه (خاص)
-# يصير:
-application.add_handler(CommandHandler("bind", bind_by_username), group=0)
-application.add_handler(MessageHandler(filters.ChatType.PRIVATE, bind_from_forward), group=0)
-
-# 🟢 رسائل المستخدم (الاستفسار)
-application.add_handler(MessageHandler(
-    filters.ChatType.PRIVATE
-    & ~filters.COMMAND
-    & (filters.TEXT | filters.PHOTO | filters.Document.ALL | filters.AUDIO | filters.VIDEO | filters.VOICE),
-    handle_inquiry_input
-), group=1)
-
-# 🟠 محتوى ردود الأدمن — داخل الخاص فقط
-application.add_handler(MessageHandler(
-    filters.ChatType.PRIVATE
-    & (filters.TEXT | filters.PHOTO | filters.Document.ALL | filters.AUDIO | filters.VIDEO | filters.VOICE),
-    handle_admin_reply_content
-), group=2)
-
-# ✏️ مدخلات تجهيز منشور الأدمن — داخل الخاص فقط
-application.add_handler(MessageHandler(filters.ChatType.PRIVATE & (filters.TEXT & ~filters.COMMAND), handle_text), group=3)
-application.add_handler(MessageHandler(
-    filters.ChatType.PRIVATE & (filters.PHOTO | filters.Document.ALL | filters.AUDIO | filters.VIDEO | filters.VOICE),
-    handle_media
-), group=3)
-
-# 🔔 أزرار المستخدم أولاً
-application.add_handler(CallbackQueryHandler(handle_inquiry_buttons, pattern="^(send_inquiry|cancel_inquiry)$"), group=4)
-
-# 🛠️ أزرار الأدمن
-application.add_handler(CallbackQueryHandler(
-    handle_admin_buttons,
-    pattern="^(admin_done_input|set_reactions_yes|set_reactions_no|preview_post|confirm_publish|cancel_publish)$"
-), group=4)
-
-# ردود الأدمن (جاهز/مخصص)
-application.add_handler(CallbackQueryHandler(handle_reply_button, pattern="^reply_"), group=5)
-application.add_handler(CallbackQueryHandler(cancel_reply, pattern="^cancel_reply$"), group=5)
-application.add_handler(CallbackQueryHandler(handle_quick_reply, pattern="^quick_reply\\|"), group=5)
-application.add_handler(CallbackQueryHandler(handle_send_quick_reply, pattern="^send_quick_reply\\|"), group=5)
-application.add_handler(CallbackQueryHandler(handle_custom_reply, pattern="^custom_reply\\|"), group=5)
-application.add_handler(CallbackQueryHandler(send_custom_reply, pattern="^send_custom_reply$"), group=5)
-
-# تفاعلات
-application.add_handler(CallbackQueryHandler(handle_reactions, pattern="^(like|dislike)$"), group=6)
+PRIORITY_HIGH = 0    # ردود المستخدمين والنشر في القنوات
+PRIORITY_NORMAL = 1  # الافتراضي
+PRIORITY_LOW = 2     # إشعارات المشرفين الجماعية
+
+# الطلبات التي تُنتج رسالة/تعديلًا وتخضع لحدود الإرسال
+RATE_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+def retry_after_seconds(e: RetryAfter) -> float:
+    ra = e.retry_after
+    return ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        # كم ثانية ننتظر قبل توفر توكن (0 = متاح الآن)
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        return now >= self.blocked_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    # يمر عبره كل طلب من context.bot. حد المحادثة ثم الحد العام، وكلاهما يُوزّع حسب الأولوية (الأقل رقمًا أولًا).
+    # عند 429 نوقف المحادثة (أو الكل) لمدة retry_after ونعيد المحاولة.
+    def __init__(self):
+        self.global_bucket = TokenBucket(RATE_LIMIT_GLOBAL, RATE_LIMIT_GLOBAL)
+        self.chat_buckets: dict[object, TokenBucket] = {}
+        # لكل محادثة عليها انتظار: heap بنفس شكل المسار العام + مهمة توزّع توكناتها
+        self._chat_waiters: dict[object, list] = {}
+        self._chat_dispatchers: dict[object, asyncio.Task] = {}
+        self._waiters: list = []   # heap: (priority, seq, future)
+        self._seq = 0
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self.stats = {"requests": 0, "queued": 0, "retry_after": 0, "gave_up": 0}
+
+    async def initialize(self):
+        # PTB يستدعيها مرتين (Application ثم Updater)
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for task in self._chat_dispatchers.values():
+            task.cancel()
+        self._chat_dispatchers.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= RATE_LIMIT_CHAT_BUCKETS_MAX:
+                now = time.monotonic()
+                for key in [k for k, b in self.chat_buckets.items() if b.idle(now) and k not in self._chat_waiters]:
+                    del self.chat_buckets[key]
+            # المعرّفات السالبة و@username = مجموعات/قنوات → 20 رسالة بالدقيقة
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(RATE_LIMIT_GROUP_PER_MIN / 60, 3) if is_group else TokenBucket(RATE_LIMIT_PRIVATE, 3)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _dispatch(self):
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self.global_bucket.delay(time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self.global_bucket.take()
+            fut.set_result(None)
+
+    async def _dispatch_chat(self, chat_id):
+        bucket = self._chat_bucket(chat_id)
+        waiters = self._chat_waiters[chat_id]
+        try:
+            while waiters:
+                wait = bucket.delay(time.monotonic())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                _, _, fut = heapq.heappop(waiters)
+                if fut.done():
+                    continue
+                bucket.take()
+                fut.set_result(None)
+        finally:
+            del self._chat_waiters[chat_id]
+            self._chat_dispatchers.pop(chat_id, None)
+
+    async def _acquire_chat(self, chat_id, priority: int):
+        bucket = self._chat_bucket(chat_id)
+        waiters = self._chat_waiters.get(chat_id)
+        # مسار سريع: لا أحد ينتظر هذه المحادثة والتوكن متاح
+        if waiters is None and bucket.delay(time.monotonic()) == 0:
+            bucket.take()
+            return
+        if waiters is None:
+            waiters = self._chat_waiters[chat_id] = []
+            self._chat_dispatchers[chat_id] = asyncio.create_task(self._dispatch_chat(chat_id))
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(waiters, (priority, self._seq, fut))
+        await fut
+
+    async def _acquire(self, chat_id, priority: int):
+        if chat_id is not None:
+            await self._acquire_chat(chat_id, priority)
+
+        # مسار سريع: لا أحد ينتظر والحد العام متاح
+        if not self._waiters and self.global_bucket.delay(time.monotonic()) == 0:
+            self.global_bucket.take()
+            return
+        self.stats["queued"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, fut))
+        self._wakeup.set()
+        await fut
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        self.stats["requests"] += 1
+        priority = PRIORITY_NORMAL if rate_limit_args is None else rate_limit_args
+        limited = endpoint.startswith(RATE_LIMITED_PREFIXES)
+        chat_id = data.get("chat_id") if limited else None
+        method = api_method_label(endpoint)
+
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            if limited:
+                with span("rate_limit_wait", priority=priority):
+                    await self._acquire(chat_id, priority)
+            API_REQUESTS.inc(method)
+            t0 = time.perf_counter()
+            try:
+                with span(f"api:{method}", attempt=attempt) as s:
+                    try:
+                        return await callback(*args, **kwargs)
+                    except Exception as err:
+                        if s is not None:
+                            s.attrs["error"] = type(err).__name__
+                        raise
+            except RetryAfter as e:
+                API_RETRY_AFTER.inc(method)
+                self.stats["retry_after"] += 1
+                delay = retry_after_seconds(e)
+                blocked = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                blocked.blocked_until = max(blocked.blocked_until, time.monotonic() + delay)
+                logging.warning(f"[RATE] 429 on {endpoint} chat={chat_id}: retry after {delay}s (attempt {attempt + 1})")
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    self.stats["gave_up"] += 1
+                    raise
+                if not limited:
+                    await asyncio.sleep(delay)
+            except Exception as e:
+                API_ERRORS.inc(method, type(e).__name__)
+                raise
+            finally:
+                API_SECONDS.observe(time.perf_counter() - t0, method)
+
+
+rate_limiter = PriorityRateLimiter()
+
+# =========================
+# موجّه رسائل الخاص: حالة المستخدم تُحدَّد مرة واحدة ثم هاندلر واحد فقط
+# =========================
+BIND_HINT_WORDS = ("bind", "ربط")
+
+def private_route(user_id: int, msg):
+    # الترتيب = أولوية الحالات؛ كلها قراءات من الذاكرة بدون أي طلب لتيليجرام
+    inq = admin_inquiries.get(user_id)
+    if inq and inq.get("stage") == "awaiting_text_or_media":
+        return handle_inquiry_input
+    if get_reply_session(user_id):
+        return handle_admin_reply_content
+
+    session = admin_sessions.get(user_id) or {}
+    # رسالة محوّلة = محاولة ربط فقط حين لا توجد مسودة مفتوحة؛ داخل المسودة هي محتوى
+    forwarded = getattr(msg, "forward_origin", None) or getattr(msg, "forward_from_chat", None)
+    if forwarded and not session.get("awaiting_input"):
+        return bind_from_forward
+    text = (msg.text or "").strip()
+    if msg.text is not None:
+        if session.get("awaiting_input") or session.get("awaiting_schedule") or JOP_RE.fullmatch(text):
+            return handle_text
+        if any(word in text.lower() for word in BIND_HINT_WORDS):
+            return bind_from_forward
+        return None
+    if session.get("awaiting_input"):
+        return handle_media
+    return None
+
+async def route_private_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.message or not update.effective_user:
+        return
+    handler = private_route(update.effective_user.id, update.message)
+    if handler is not None:
+        # كل مسار يُقاس باسمه ضمن نفس الهستوغرام
+        await timed_handler(handler)(update, context)
+
+# =========================
+# بناء تطبيق تيليجرام وتسجيل الهاندلرات (في bootstrap)
+# =========================
+# يُبنى في bootstrap(): بناء عميل HTTPX (سياق SSL + httpcore) يكلّف مئات الملّي ثانية
+application: Application | None = None
+
+def build_application():
+    global application
+    # JobQueue الخاص بـ PTB غير مستخدم (مهامنا في get_scheduler()): بدونه لا يُنشأ مجدول ثانٍ عند البناء
+    builder = ApplicationBuilder().token(TOKEN).rate_limiter(rate_limiter).job_queue(None)
+    if BOT_API_BASE_URL:
+        # خادم Bot API بديل: bench/fake_bot_api.py للاختبار أو Local Bot API Server
+        builder = builder.base_url(f"{BOT_API_BASE_URL}/bot").base_file_url(f"{BOT_API_BASE_URL}/file/bot")
+    application = builder.build()
+
+    # أوامر
+    application.add_handler(CommandHandler("start", start), group=0)
+    application.add_handler(CommandHandler("jop", handle_jop_command), group=0)
+
+    application.add_handler(CommandHandler("webhookinfo", webhookinfo), group=0)
+    application.add_handler(CommandHandler("status", status_cmd), group=0)
+    application.add_handler(CommandHandler("reset", reset_publish), group=0)
+
+    # ربط الوجهة عبر إعادة توجيه (خاص)
+    # يصير:
+    application.add_handler(CommandHandler("bind", bind_by_username), group=0)
+    application.add_handler(CommandHandler("dest_add", dest_add), group=0)
+    application.add_handler(CommandHandler("dest_remove", dest_remove), group=0)
+    application.add_handler(CommandHandler("dests", dests_cmd), group=0)
+    application.add_handler(CommandHandler("queue", queue_cmd), group=0)
+    application.add_handler(CommandHandler("inbox", inbox_cmd), group=0)
+    application.add_handler(CommandHandler("templates", templates_cmd), group=0)
+    application.add_handler(CommandHandler("tpl_add", tpl_add), group=0)
+    application.add_handler(CommandHandler("tpl_edit", tpl_edit), group=0)
+    application.add_handler(CommandHandler("tpl_move", tpl_move), group=0)
+    application.add_handler(CommandHandler("tpl_del", tpl_del), group=0)
+
+    # 📨 كل رسائل الخاص (ربط / استفسار / رد / نشر) عبر موجّه واحد
+    application.add_handler(MessageHandler(
+        filters.ChatType.PRIVATE
+        & ~filters.COMMAND
+        & (filters.TEXT | filters.PHOTO | filters.Document.ALL | filters.AUDIO | filters.VIDEO | filters.VOICE
+           | filters.FORWARDED),
+        route_private_message
+    ), group=1)
+
+    # 🔔 أزرار المستخدم أولاً
+    application.add_handler(CallbackQueryHandler(handle_inquiry_buttons, pattern="^(send_inquiry|cancel_inquiry)$"), group=4)
+
+    # 🛠️ أزرار الأدمن
+    application.add_handler(CallbackQueryHandler(
+        handle_admin_buttons,
+        pattern="^(admin_done_input|set_reactions_yes|set_reactions_no|preview_post|confirm_publish|schedule_publish|cancel_publish)$"
+    ), group=4)
+    application.add_handler(CallbackQueryHandler(handle_queue_buttons, pattern="^queue_cancel\\|"), group=4)
+
+    # ردود الأدمن (جاهز/مخصص)
+    application.add_handler(CallbackQueryHandler(handle_reply_button, pattern="^reply_"), group=5)
+    application.add_handler(CallbackQueryHandler(cancel_reply, pattern="^cancel_reply$"), group=5)
+    application.add_handler(CallbackQueryHandler(handle_quick_reply, pattern="^quick_reply\\|"), group=5)
+    application.add_handler(CallbackQueryHandler(handle_send_quick_reply, pattern="^send_quick_reply\\|"), group=5)
+    application.add_handler(CallbackQueryHandler(handle_pick_quick_reply, pattern="^qr\\|"), group=5)
+    application.add_handler(CallbackQueryHandler(handle_quick_reply_page, pattern="^qr_page\\|"), group=5)
+    application.add_handler(CallbackQueryHandler(handle_inbox_nav, pattern="^inbox\\|"), group=5)
+    application.add_handler(CallbackQueryHandler(handle_custom_reply, pattern="^custom_reply\\|"), group=5)
+    application.add_handler(CallbackQueryHandler(send_custom_reply, pattern="^send_custom_reply$"), group=5)
+
+    # تفاعلات
+    application.add_handler(CallbackQueryHandler(handle_reactions, pattern="^(like|dislike)$"), group=6)
+
+    # تغيّر صلاحيات الأعضاء/البوت → إسقاط كاش الإشراف
+    application.add_handler(ChatMemberHandler(handle_chat_member_update, ChatMemberHandler.ANY_CHAT_MEMBER), group=7)
+
+    # زمن وأخطاء كل هاندلر → /metrics
+    instrument_handlers(application)
+
+# =========================
+# سجل التحديثات (Journal) + مستهلك في الخلفية
+# =========================
+class UpdateJournal:
+    # ملف إلحاقي بسطر JSON لكل حدث:
+    #   {"t": "u", "id": update_id, "d": {...}}  ← تحديث خام وصل من تيليجرام
+    #   {"t": "a", "id": update_id}              ← تمت معالجته (ack)
+    # بعد أي انهيار نعيد تشغيل كل تحديث ليس له ack.
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.pending = 0
+        self._fh = None
+
+    def _write(self, entry: dict):
+        self._write_line(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+
+    def _write_line(self, line: str):
+        self._fh.write(line + "\n")
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+
+    def open(self) -> list[dict]:
+        # نقرأ السجل القديم ونستخرج التحديثات غير المُقرّة بنفس ترتيب وصولها
+        unacked: dict[int, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # سطر مبتور من انهيار أثناء الكتابة
+                        continue
+                    if entry.get("t") == "u":
+                        unacked[entry["id"]] = entry["d"]
+                    elif entry.get("t") == "a":
+                        unacked.pop(entry["id"], None)
+
+        # نضغط السجل: نعيد كتابته بالمعلّق فقط ثم نستبدله ذريًّا
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for update_id, data in unacked.items():
+                fh.write(json.dumps({"t": "u", "id": update_id, "d": data}, ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self.pending = len(unacked)
+        return list(unacked.values())
+
+    def append(self, data: dict, raw: bytes | None = None):
+        if raw is not None and b"\n" not in raw:
+            # جسم الطلب كما وصل (JSON صالح تم تحليله للتو): بدون إعادة تسلسل
+            self._write_line(f'{{"t":"u","id":{json.dumps(data.get("update_id"))},"d":{raw.decode()}}}')
+        else:
+            self._write({"t": "u", "id": data.get("update_id"), "d": data})
+        self.pending += 1
+
+    def ack(self, update_id: int | None):
+        self._write({"t": "a", "id": update_id})
+        self.pending = max(0, self.pending - 1)
+        # لا شيء معلّق والملف كبر → نبدأ ملفًا جديدًا
+        if self.pending == 0 and self._fh.tell() >= JOURNAL_COMPACT_BYTES:
+            self._fh.truncate(0)
+            self._fh.seek(0)
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+
+update_journal = UpdateJournal(JOURNAL_PATH, fsync=JOURNAL_FSYNC)
+
+
+class UpdateDedup:
+    # حلقة بآخر N معرّف + set لفحص O(1) + أعلى معرّف رأيناه.
+    # ما هو أقدم من النافذة بقليل إعادة إرسال متأخرة؛ الأقدم بكثير يعني أن تيليجرام بدأ تسلسلًا جديدًا
+    # (يحدث بعد أسبوع بلا تحديثات) فنبدأ من جديد بدل إسقاط كل شيء.
+    NS = "update_dedup"
+    STALE_HORIZON = 64  # بمضاعفات حجم النافذة
+
+    def __init__(self, size: int):
+        self.size = size
+        self.ring = array("q", [-1]) * size
+        self.members: set[int] = set()
+        self.pos = 0
+        self.high = -1
+        self.dirty = False
+
+    def _reset(self):
+        self.ring = array("q", [-1]) * self.size
+        self.members.clear()
+        self.pos = 0
+        self.high = -1
+
+    def check(self, update_id: int) -> str | None:
+        # يرجع سبب الإسقاط، أو None لو التحديث جديد؛ لا يسجّل شيئًا (التسجيل بعد كتابته في السجل: add)
+        if update_id in self.members:
+            return "window"
+        if self.size < self.high - update_id <= self.size * self.STALE_HORIZON:
+            return "stale"
+        return None
+
+    def add(self, update_id: int):
+        if update_id in self.members:
+            return
+        if self.high - update_id > self.size:
+            # check رفض المتأخر القريب؛ ما بقي هنا تسلسل جديد
+            self._reset()
+        evicted = self.ring[self.pos]
+        if evicted >= 0:
+            self.members.discard(evicted)
+        self.ring[self.pos] = update_id
+        self.members.add(update_id)
+        self.pos = (self.pos + 1) % self.size
+        self.high = max(self.high, update_id)
+        self.dirty = True
+
+    def checkpoint(self, store):
+        if not self.dirty:
+            return
+        # بالترتيب من الأقدم للأحدث حتى تُستعاد الحلقة كما هي
+        ordered = self.ring[self.pos:] + self.ring[:self.pos]
+        raw = json.dumps({"high": self.high, "ids": base64.b64encode(ordered.tobytes()).decode()})
+        store.blob_put_many(self.NS, [("window", raw)])
+        self.dirty = False
+
+    def restore(self, store):
+        raw = store.blob_get(self.NS, "window")
+        if not raw:
+            return
+        data = json.loads(raw)
+        ids = array("q")
+        ids.frombytes(base64.b64decode(data["ids"]))
+        for update_id in ids[-self.size:]:
+            if update_id >= 0:
+                self.add(update_id)
+        self.high = max(self.high, data["high"])
+        self.dirty = False
+
+
+update_dedup = UpdateDedup(UPDATE_DEDUP_WINDOW)
+
+def duplicate_reason(update_id: int | None) -> str | None:
+    if update_id is None:
+        return None
+    reason = update_dedup.check(update_id)
+    # الوضع المشترك: إعادة الإرسال قد تصل لـ worker آخر؛ الحجز ذرّي ويُلغى لو فشلت الكتابة في السجل
+    if reason is None and coordinator.shared and not coordinator.add_once("updates:seen", update_id):
+        reason = "shared"
+    return reason
+
+def release_update_id(update_id: int | None):
+    if update_id is not None and coordinator.shared:
+        coordinator.discard_once("updates:seen", update_id)
+
+async def checkpoint_update_dedup():
+    update_dedup.checkpoint(state_store)
+    if coordinator.shared:
+        coordinator.prune("updates:", time.time() - 3600)
+update_queue: asyncio.Queue | None = None
+update_consumer_task: asyncio.Task | None = None
+update_poller_task: asyncio.Task | None = None
+bootstrap_task: asyncio.Task | None = None
+bootstrap_error: str | None = None
+
+# مراحل التشغيل البارد (ثوانٍ) → السجل و /metrics
+startup_phases: dict[str, float] = {}
+
+@contextmanager
+def startup_phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases[name] = time.perf_counter() - t0
+
+updates_processed = 0
+updates_in_flight = 0
+
+# الوضع المشترك: خانة هذا الـ worker (تحدد ملف سجل التحديثات الخاص به)
+worker_slot: int | None = None
+worker_lease: str | None = None
+
+def claim_worker_slot() -> int:
+    global worker_slot, worker_lease
+    for slot in range(WORKER_SLOTS):
+        token = coordinator.acquire(f"worker_slot:{slot}", WORKER_LEASE_TTL)
+        if token:
+            worker_slot, worker_lease = slot, token
+            return slot
+    raise RuntimeError(f"all {WORKER_SLOTS} worker slots are taken; raise WORKER_SLOTS")
+
+async def renew_worker_slot():
+    if not coordinator.renew(f"worker_slot:{worker_slot}", worker_lease, WORKER_LEASE_TTL):
+        logging.error("[COORD] lost the lease on worker slot %s; its journal may be reused by another worker", worker_slot)
+
+@asynccontextmanager
+async def update_scope(update: Update):
+    # الوضع المشترك: تحديثات نفس المستخدم لا تُعالج في workerين معًا، والحالة تُقرأ طازجة وتُكتب فورًا
+    if not coordinator.shared:
+        yield
+        return
+    user = update.effective_user
+    if user is None:
+        async with fresh_state():
+            yield
+        return
+    # لا نعالج بدون القفل: ننتظره حتى يتحرر، وتحديثات نفس المستخدم التالية تنتظر خلفه في update_order
+    async with coordination_lock(f"user:{user.id}", retry=True), fresh_state():
+        yield
+
+# قفل لكل مستخدم يحفظ ترتيب تحديثاته؛ يُحذف حين لا ينتظره أحد
+update_order_locks: dict[int, list] = {}
+
+@asynccontextmanager
+async def update_order(key: int | None):
+    if key is None:
+        yield
+        return
+    entry = update_order_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del update_order_locks[key]
+
+def update_order_key(update: Update) -> int | None:
+    if update.effective_user:
+        return update.effective_user.id
+    return update.effective_chat.id if update.effective_chat else None
+
+# التحديثات المُعالجة التي لم تُكتب حالتها للقرص بعد (نُقرّها بعد التفريغ فقط)
+processed_unacked: list[int | None] = []
+
+async def process_queued_update(data: dict):
+    global updates_processed
+    try:
+        with state_store.scope():
+            update = Update.de_json(data, application.bot)
+            # لا await قبل طلب القفل: المهام تبدأ بترتيب إنشائها وانتظار القفل FIFO → ترتيب الوصول محفوظ
+            async with update_order(update_order_key(update)), update_scope(update):
+                await traced_process_update(update, data)
+                if update.effective_chat and update.effective_chat.type == "private":
+                    touch_sessions(update.effective_user.id)
+    except asyncio.CancelledError:
+        # إيقاف أثناء المعالجة: بدون ack حتى يُعاد التحديث بعد التشغيل
+        raise
+    except Exception as e:
+        logging.error(f"[JOURNAL] فشل معالجة التحديث {data.get('update_id')}: {e}")
+    # نُقرّ حتى عند الفشل حتى لا يتكرر تحديث معطوب مع كل إعادة تشغيل
+    processed_unacked.append(data.get("update_id"))
+    updates_processed += 1
+
+    # التفريغ آمن مع وجود تحديثات أخرى قيد المعالجة (state_store.scope)؛ نجمعه عند الهدوء أو امتلاء الدفعة
+    if (updates_in_flight == 1 and update_queue.empty()) or state_store.flush_due():
+        try:
+            state_store.flush()
+        except Exception as e:
+            logging.error(f"[STATE] فشل حفظ الحالة: {e}")
+        else:
+            for update_id in processed_unacked:
+                update_journal.ack(update_id)
+            processed_unacked.clear()
+
+async def consume_updates():
+    global updates_in_flight
+    # حتى UPDATE_CONCURRENCY تحديثًا بالتوازي؛ المستخدم الواحد يُخدم بالترتيب عبر update_order
+    slots = asyncio.Semaphore(UPDATE_CONCURRENCY)
+    running: set[asyncio.Task] = set()
+
+    async def run(data: dict):
+        global updates_in_flight
+        try:
+            await process_queued_update(data)
+        finally:
+            updates_in_flight -= 1
+            slots.release()
+            update_queue.task_done()
+
+    try:
+        while True:
+            data = await update_queue.get()
+            await slots.acquire()
+            updates_in_flight += 1
+            task = asyncio.create_task(run(data))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        for task in running:
+            task.cancel()
+
+async def flush_state_if_idle():
+    # async حتى يعمل على حلقة الأحداث لا في خيط منفصل؛ تعديلات المهام الخلفية (المجدول، الإشعارات) تُحفظ هنا لو لم تصل تحديثات تحفظها
+    if updates_in_flight or (update_queue and not update_queue.empty()):
+        return
+    try:
+        state_store.flush()
+    except Exception as e:
+        logging.error(f"[STATE] فشل حفظ الحالة: {e}")
+
+def update_wanted(kind: str, data: dict) -> bool:
+    # فحص على القاموس الخام: أرخص بكثير من Update.de_json لتحديث لن يلتقطه أي هاندلر
+    if kind not in HANDLED_UPDATE_TYPES:
+        return False
+    if kind == "message":
+        msg = data["message"]
+        # خارج الخاص لا توجد إلا هاندلرات أوامر
+        if (msg.get("chat") or {}).get("type") != "private":
+            return (msg.get("text") or "").startswith("/")
+    return True
+
+def ingest_update(data: dict, raw: bytes | None = None) -> bool:
+    # النوع والتكرار يُفحصان قبل السجل وقبل تحويل JSON لكائنات؛ الكتابة في السجل أولًا ثم الطابور
+    kind = update_type(data)
+    UPDATES_TOTAL.inc(kind)
+    if not update_wanted(kind, data):
+        UPDATES_IGNORED.inc(kind)
+        return False
+    update_id = data.get("update_id")
+    reason = duplicate_reason(update_id)
+    if reason:
+        UPDATES_DUPLICATE.inc(reason)
+        return False
+    try:
+        update_journal.append(data, raw)
+    except Exception:
+        # لم يُحفظ: الويبهوك يرد 500 وتيليجرام يعيد الإرسال، فلا نعتبره مكررًا حينها
+        release_update_id(update_id)
+        raise
+    if update_id is not None:
+        update_dedup.add(update_id)
+    update_queue.put_nowait(data)
+    return True
+
+# =========================
+# Long polling (بدون رابط عام: staging / تشغيل محلي)
+# =========================
+POLL_OFFSET_NS = "update_offset"
+
+def resolve_update_mode() -> str:
+    if UPDATE_MODE == "auto":
+        return "webhook" if APP_URL else "polling"
+    return UPDATE_MODE
+
+def load_poll_offset() -> int | None:
+    raw = state_store.blob_get(POLL_OFFSET_NS, "offset")
+    return json.loads(raw) if raw else None
+
+async def poll_updates():
+    # getUpdates خام عبر httpx: نفس JSON الذي يصل للويبهوك يدخل ingest_update (منع التكرار + السجل + الطابور)
+    url = f"{BOT_API_BASE_URL or 'https://api.telegram.org'}/bot{TOKEN}/getUpdates"
+    offset = load_poll_offset()
+    backoff = 1.0
+    async with httpx.AsyncClient(timeout=httpx.Timeout(POLL_TIMEOUT + 10, connect=10)) as client:
+        while True:
+            while update_queue.qsize() >= POLL_MAX_BACKLOG:
+                await asyncio.sleep(0.1)
+            params = {"limit": POLL_LIMIT, "timeout": POLL_TIMEOUT, "allowed_updates": ALLOWED_UPDATES}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                payload = (await client.post(url, json=params)).json()
+            except (httpx.HTTPError, ValueError) as e:
+                logging.warning("[POLL] getUpdates failed: %s; retrying in %.0fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            if not payload.get("ok"):
+                # 409: ويبهوك مفعّل أو نسخة أخرى تسحب التحديثات
+                retry_after = (payload.get("parameters") or {}).get("retry_after")
+                logging.warning("[POLL] getUpdates rejected: %s", payload.get("description"))
+                await asyncio.sleep(retry_after or backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            batch = payload["result"]
+            if not batch:
+                backoff = 1.0
+                continue
+            try:
+                for data in batch:
+                    ingest_update(data)
+                next_offset = batch[-1]["update_id"] + 1
+                state_store.blob_put_many(POLL_OFFSET_NS, [("offset", json.dumps(next_offset))])
+            except Exception as e:
+                # السجل لم يحفظ التحديث: لا نتقدم بالـ offset فيعيد تيليجرام الدفعة (ما دخل السجل منها يُسقط كمكرر)
+                logging.error("[POLL] could not journal updates: %s; retrying batch in %.0fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            # الدفعة في السجل الآن؛ الطلب التالي بهذا الـ offset يؤكدها لتيليجرام
+            offset = next_offset
 
 # =========================
 # FastAPI (لـ Render Web Service)
@@ -1398,47 +4355,226 @@ app = FastAPI()
 async def root():
     return PlainTextResponse("Bot is running. Use /health for uptime checks.")
 
-# فحص الصحة لـ UptimeRobot (GET)
+# فحص الصحة لـ UptimeRobot (GET): يرد فورًا حتى أثناء التهيئة، و503 فقط لو فشلت
 @app.get("/health")
 async def health():
+    if bootstrap_error:
+        return PlainTextResponse(f"bootstrap failed: {bootstrap_error}", status_code=503)
     return PlainTextResponse("ok")
 
+def bearer_ok(request: Request, token: str) -> bool:
+    # مقارنة بزمن ثابت؛ ?token= مقبول أيضًا للفتح من المتصفح
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ") or request.query_params.get("token", "")
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and not bearer_ok(request, METRICS_TOKEN):
+        return PlainTextResponse("forbidden", status_code=403)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/slow")
+async def debug_slow(request: Request):
+    # معطّل تمامًا بدون DEBUG_TOKEN (404 حتى لا يُكشف وجوده)
+    if not DEBUG_TOKEN or not bearer_ok(request, DEBUG_TOKEN):
+        return PlainTextResponse("not found", status_code=404)
+    return {
+        "threshold_ms": SLOW_UPDATE_MS,
+        "profiling": SLOW_UPDATE_PROFILE,
+        **trace_stats,
+        "traces": [trace for _, _, trace in sorted(slow_traces, reverse=True)],
+    }
+
 # دعم HEAD لـ /health لأن بعض أدوات المراقبة تستخدم HEAD
 @app.head("/health")
 async def health_head():
-    return PlainTextResponse("ok")
+    return await health()
 
 @app.on_event("startup")
 async def on_startup():
-    await application.initialize()
-    await application.start()
+    # سريع عمدًا: /health يرد فور انتهاء هذه الدالة، وكل ما يحتاج الشبكة يكمل في bootstrap()
+    global update_queue, bootstrap_task
+    with startup_phase("journal"):
+        # الوضع المشترك: سجل تحديثات مستقل لكل worker حتى لا يكتب اثنان في نفس الملف
+        if coordinator.shared:
+            update_journal.path = f"{JOURNAL_PATH}.{claim_worker_slot()}"
+            get_scheduler().add_job(
+                renew_worker_slot, "interval", seconds=WORKER_LEASE_TTL / 3,
+                id="renew_worker_slot", replace_existing=True, coalesce=True, max_instances=1,
+            )
+
+        # الويبهوك يقبل التحديثات من الآن (سجل + طابور)؛ المستهلك يبدأ بعد تهيئة التطبيق
+        update_queue = asyncio.Queue()
+        replay = update_journal.open()
+        if UPDATE_DEDUP_PERSIST_INTERVAL:
+            update_dedup.restore(state_store)
+        for data in replay:
+            if data.get("update_id") is not None:
+                update_dedup.add(data["update_id"])
+            update_queue.put_nowait(data)
+    if replay:
+        logging.info("[JOURNAL] إعادة تشغيل %d تحديث غير مُعالج", len(replay))
+    bootstrap_task = asyncio.create_task(bootstrap())
+
+async def bootstrap():
+    global update_consumer_task, bootstrap_error
+    try:
+        with startup_phase("build"):
+            build_application()
+        # الاستفسارات القديمة (bot_data بمفتاح المستخدم) تُنقل مرة واحدة لمخزن الاستفسارات
+        # (عدة workers تبدأ معًا: أولهم فقط ينقل)
+        with startup_phase("migrate"):
+            if coordinator.acquire("startup:migrate", COORDINATION_LOCK_TTL):
+                migrate_legacy_inquiries()
+        with startup_phase("initialize"):
+            await application.initialize()
+            await application.start()
+            await warm_up()
+        update_consumer_task = asyncio.create_task(consume_updates())
+        with startup_phase("scheduler"):
+            start_scheduler()
+        with startup_phase("updates"):
+            await start_receiving_updates()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # /health يرجع 503 حتى تعيد المنصة تشغيلنا بدل خدمة لا تعالج شيئًا
+        bootstrap_error = f"{type(e).__name__}: {e}"
+        logging.exception("[STARTUP] bootstrap failed")
+        return
+    logging.info(
+        "[STARTUP] ready in %.0f ms since process start (state backend=%s, coordination=%s, worker slot=%s) %s",
+        (time.monotonic() - PROCESS_STARTED_AT) * 1000, state_store.backend, coordinator.backend, worker_slot,
+        " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in startup_phases.items()),
+    )
+
+def start_scheduler():
+    get_scheduler().add_job(
+        refresh_admin_rosters, "interval", seconds=ROSTER_REFRESH_INTERVAL,
+        id="refresh_admin_rosters", replace_existing=True, coalesce=True, max_instances=1,
+    )
+    async def sweep_reaction_dedup():
+        # على حلقة الأحداث: الوظائف المتزامنة في APScheduler تعمل في خيوط منفصلة
+        if coordinator.shared:
+            if REACTION_DEDUP_MAX_AGE:
+                coordinator.prune("reaction:", time.time() - REACTION_DEDUP_MAX_AGE)
+            return
+        reaction_dedup.sweep()
+
+    get_scheduler().add_job(
+        sweep_reaction_dedup, "interval", seconds=REACTION_SWEEP_INTERVAL,
+        id="reaction_dedup_sweep", replace_existing=True, coalesce=True, max_instances=1,
+    )
+    get_scheduler().add_job(
+        flush_state_if_idle, "interval", seconds=max(1.0, STATE_FLUSH_INTERVAL),
+        id="flush_state_if_idle", replace_existing=True, coalesce=True, max_instances=1,
+    )
+    get_scheduler().add_job(
+        sweep_reply_sessions, "interval", seconds=max(60.0, REPLY_SESSION_TTL / 4),
+        id="sweep_reply_sessions", replace_existing=True, coalesce=True, max_instances=1,
+    )
+    get_scheduler().add_job(
+        sweep_idle_sessions, "interval", seconds=SESSION_SWEEP_INTERVAL,
+        id="sweep_idle_sessions", replace_existing=True, coalesce=True, max_instances=1,
+    )
+    if UPDATE_DEDUP_PERSIST_INTERVAL:
+        get_scheduler().add_job(
+            checkpoint_update_dedup, "interval", seconds=UPDATE_DEDUP_PERSIST_INTERVAL,
+            id="checkpoint_update_dedup", replace_existing=True, coalesce=True, max_instances=1,
+        )
+    restore_scheduled_posts()
+    get_scheduler().start()
 
+async def start_receiving_updates():
+    global update_poller_task
+    # بقية الـ workers تخدم نفس الويبهوك؛ يكفي أن يضبطه واحد (وgetUpdates لا يقبل إلا مستهلكًا واحدًا)
+    if worker_slot:
+        return
+    if resolve_update_mode() == "polling":
+        # getUpdates يرفض العمل والويبهوك مفعّل؛ التحديثات المعلّقة تبقى عند تيليجرام
+        await application.bot.delete_webhook()
+        update_poller_task = asyncio.create_task(poll_updates())
+        logging.info("[POLL] long polling started (offset=%s)", load_poll_offset())
+        return
     if not APP_URL:
         logging.warning("APP_URL (PUBLIC_URL/RENDER_EXTERNAL_URL) not set yet. Restart later to set webhook.")
         return
 
     webhook_path = f"/webhook/{WEBHOOK_SECRET}"
     webhook_url = f"{APP_URL}{webhook_path}"
-    await application.bot.set_webhook(url=webhook_url, secret_token=WEBHOOK_SECRET)
-    logging.info("Webhook set to: %s", webhook_url)
+    if await ensure_webhook(webhook_url):
+        logging.info("Webhook set to: %s", webhook_url)
+    else:
+        logging.info("Webhook already set to: %s", webhook_url)
+
+async def ensure_webhook(url: str) -> bool:
+    # تيليجرام لا يُرجع السر في getWebhookInfo، فنحفظ بصمته (مع الرابط وأنواع التحديثات) عند آخر ضبط
+    fingerprint = hashlib.sha256(
+        f"{url}|{WEBHOOK_SECRET}|{','.join(sorted(ALLOWED_UPDATES))}".encode()
+    ).hexdigest()
+    info = await application.bot.get_webhook_info()
+    if (
+        info.url == url
+        and sorted(info.allowed_updates or ()) == sorted(ALLOWED_UPDATES)
+        and state_store.blob_get("webhook", "fingerprint") == json.dumps(fingerprint)
+    ):
+        return False
+    await application.bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+    state_store.blob_put_many("webhook", [("fingerprint", json.dumps(fingerprint))])
+    return True
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    try:
-        await application.bot.delete_webhook()
-    except Exception:
-        pass
-    await application.stop()
-    await application.shutdown()
+    # لا نحذف الويبهوك: تيليجرام يعيد المحاولة حتى نعود، والتشغيل التالي لا يحتاج set_webhook
+    if bootstrap_task and not bootstrap_task.done():
+        bootstrap_task.cancel()
+    if update_poller_task:
+        update_poller_task.cancel()
+
+    # نمنح الطابور مهلة قصيرة ليفرغ؛ الباقي يبقى في السجل ويُعاد بعد التشغيل
+    if update_consumer_task:
+        try:
+            await asyncio.wait_for(update_queue.join(), timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning("[JOURNAL] بقي %d تحديث في السجل لإعادة التشغيل لاحقًا", update_journal.pending)
+        update_consumer_task.cancel()
+    update_journal.close()
+
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+    reaction_dedup.checkpoint()
+    if UPDATE_DEDUP_PERSIST_INTERVAL:
+        update_dedup.checkpoint(state_store)
+    state_store.close()
+    if worker_lease:
+        coordinator.release(f"worker_slot:{worker_slot}", worker_lease)
+    coordinator.close()
+
+    if application is not None:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
 
 # Webhook الحقيقي (POST فقط من تيليجرام)
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+WEBHOOK_SECRET_BYTES = WEBHOOK_SECRET.encode()
+loads_json = orjson.loads if orjson else json.loads
+
 @app.post(f"/webhook/{{secret}}")
 async def telegram_webhook(secret: str, request: Request):
-    if secret != WEBHOOK_SECRET:
+    # الهيدر الذي سجّلناه في set_webhook + المسار، بمقارنة زمن ثابت
+    header_ok = hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), WEBHOOK_SECRET_BYTES)
+    if not (header_ok and hmac.compare_digest(secret.encode(), WEBHOOK_SECRET_BYTES)):
         return PlainTextResponse("forbidden", status_code=403)
-    data = await request.json()
-    update = Update.de_json(data, application.bot)
-    await application.process_update(update)
+    body = await request.body()
+    try:
+        data = loads_json(body)
+    except ValueError:
+        return PlainTextResponse("bad request", status_code=400)
+    if not isinstance(data, dict):
+        return PlainTextResponse("bad request", status_code=400)
+    # نحفظ التحديث ونرد فورًا؛ زمن الاستجابة لا يتأثر ببطء الهاندلرات
+    ingest_update(data, body)
     return PlainTextResponse("ok")
 
 # (اختياري) تمكين GET على مسار الويبهوك لتجنّب 405 إذا انضبط في UptimeRobot بالخطأ
@@ -1446,4 +4582,7 @@ async def telegram_webhook(secret: str, request: Request):
 async def webhook_probe(secret: str):
     if secret != WEBHOOK_SECRET:
         return PlainTextResponse("forbidden", status_code=403)
-    return PlainTextResponse("ok")
\ No newline at end of file
+    return PlainTextResponse("ok")
+
+# جسم الوحدة بعد الاستيرادات (قوالب، تسجيل المقاييس...) = أول مرحلة من التشغيل البارد
+startup_phases["module"] = time.monotonic() - PROCESS_STARTED_AT
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# main.py يقرأ الإعدادات عند الاستيراد: توكن وهمي وملفات حالة مؤقتة بدل ملفات مجلد المشروع
+_tmp = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ.setdefault("TOKEN", "123456:test")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(_tmp, "state.db"))
+os.environ.setdefault("UPDATE_JOURNAL_PATH", os.path.join(_tmp, "updates.journal"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
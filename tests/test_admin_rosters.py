@@ -0,0 +1,44 @@
+import asyncio
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from telegram.error import Forbidden, NetworkError
+
+import main
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+
+    async def get_chat_administrators(self, chat_id):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        user = SimpleNamespace(id=abs(chat_id), is_bot=False)
+        return [SimpleNamespace(user=user)]
+
+
+def test_rosters_are_lru_capped(monkeypatch):
+    monkeypatch.setattr(main, "admin_rosters", OrderedDict())
+    monkeypatch.setattr(main, "ADMIN_CACHE_MAX", 2)
+    bot = FakeBot()
+
+    async def run():
+        await main.get_admin_ids(bot, -1)
+        await main.get_admin_ids(bot, -2)
+        await main.get_admin_ids(bot, -1)  # الأحدث استخدامًا
+        await main.get_admin_ids(bot, -3)
+
+    asyncio.run(run())
+    assert list(main.admin_rosters) == [-1, -3]
+
+
+def test_refresh_drops_chats_the_bot_lost(monkeypatch):
+    rosters = OrderedDict([(-1, [1]), (-2, [2]), (-3, [3])])
+    monkeypatch.setattr(main, "admin_rosters", rosters)
+    bot = FakeBot({-2: Forbidden("bot was kicked"), -3: NetworkError("timeout")})
+    monkeypatch.setattr(main, "application", SimpleNamespace(bot=bot))
+
+    asyncio.run(main.refresh_admin_rosters())
+    # خطأ عابر يُبقي القائمة القديمة حتى المحاولة التالية
+    assert dict(rosters) == {-1: [1], -3: [3]}
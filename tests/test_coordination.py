@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import main
+from main import CoordinationLockTimeout, LocalCoordinator, MemoryStateStore, SQLiteCoordinator, SQLiteStateStore
+
+
+def test_lock_timeout_does_not_run_unlocked(monkeypatch):
+    coordinator = LocalCoordinator(MemoryStateStore())
+    monkeypatch.setattr(main, "coordinator", coordinator)
+    assert coordinator.acquire("user:1", 60)
+
+    async def run():
+        async with main.coordination_lock("user:1", wait=0.05):
+            pytest.fail("ran without the lock")
+
+    with pytest.raises(CoordinationLockTimeout):
+        asyncio.run(run())
+
+
+def test_lock_retry_waits_for_release(monkeypatch):
+    coordinator = LocalCoordinator(MemoryStateStore())
+    monkeypatch.setattr(main, "coordinator", coordinator)
+    held = coordinator.acquire("user:1", 60)
+
+    async def run():
+        asyncio.get_running_loop().call_later(0.1, coordinator.release, "user:1", held)
+        async with main.coordination_lock("user:1", wait=0.02, retry=True) as token:
+            return token
+
+    token = asyncio.run(run())
+    assert token and token != held
+
+
+def test_locked_state_reloads_key_written_by_other_worker(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.db")
+    worker_a, worker_b = SQLiteStateStore(path), SQLiteStateStore(path)
+    monkeypatch.setattr(main, "state_store", worker_a)
+    monkeypatch.setattr(main, "coordinator", SQLiteCoordinator(path))
+
+    posts_a, posts_b = worker_a.mapping("scheduled_posts"), worker_b.mapping("scheduled_posts")
+    posts_a[7] = {"id": 7, "run_at": 100}
+    worker_a.flush()
+    assert posts_b[7]["run_at"] == 100
+
+    # worker A قرأ المنشور في بداية التحديث، ثم worker B حذفه (نُشر)
+    assert posts_a[7]["run_at"] == 100
+    del posts_b[7]
+    worker_b.flush()
+
+    async def move():
+        async with main.locked_state(posts_a, 7):
+            post = posts_a.get(7)
+            if post:
+                post["run_at"] = 200
+            return post
+
+    assert asyncio.run(move()) is None
+    worker_a.close()
+    assert 7 not in SQLiteStateStore(path).mapping("scheduled_posts")
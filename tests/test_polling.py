@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+import main
+from main import MemoryStateStore
+
+
+def test_journal_failure_retries_batch_without_advancing(monkeypatch):
+    batch = [{"update_id": 10, "message": {}}, {"update_id": 11, "message": {}}]
+    requested = []
+
+    class FakeResponse:
+        def json(self):
+            return {"ok": True, "result": batch}
+
+    class FakeClient:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def post(self, url, json):
+            requested.append(json.get("offset"))
+            if len(requested) == 3:
+                raise asyncio.CancelledError
+            return FakeResponse()
+
+    failures = [OSError("disk full")]
+
+    def ingest(data):
+        if data["update_id"] == 11 and failures:
+            raise failures.pop()
+        return True
+
+    async def no_sleep(delay):
+        pass
+
+    store = MemoryStateStore()
+    monkeypatch.setattr(main.httpx, "AsyncClient", FakeClient)
+    monkeypatch.setattr(main, "ingest_update", ingest)
+    monkeypatch.setattr(main, "state_store", store)
+    monkeypatch.setattr(main, "update_queue", asyncio.Queue())
+    monkeypatch.setattr(main.asyncio, "sleep", no_sleep)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(main.poll_updates())
+    # الدفعة أُعيد طلبها بنفس الـ offset، ثم تقدّم بعد نجاحها
+    assert requested == [None, None, 12]
+    assert main.load_poll_offset() == 12
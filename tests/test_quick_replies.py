@@ -0,0 +1,47 @@
+import asyncio
+
+import main
+from main import QUICK_REPLIES, QuickReplyRegistry, SQLiteCoordinator, SQLiteStateStore
+
+
+def test_edits_bump_version_and_keep_defaults():
+    registry = QuickReplyRegistry({})
+    assert registry.templates(-100) == (0, list(QUICK_REPLIES))
+    assert registry.add(-100, "new") == len(QUICK_REPLIES) + 1
+    registry.move(-100, len(QUICK_REPLIES), 0)
+    version, items = registry.templates(-100)
+    assert version == 2
+    assert items[0] == "new"
+    assert registry.delete(-100, 0) == "new"
+    assert registry.templates(-100) == (3, list(QUICK_REPLIES))
+
+
+def test_picker_cached_per_version():
+    registry = QuickReplyRegistry({})
+    first = registry.picker(-100)
+    assert registry.picker(-100) is first
+    registry.edit(-100, 0, "changed")
+    assert registry.picker(-100) is not first
+
+
+def test_concurrent_adds_from_two_workers(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.db")
+    worker_a, worker_b = SQLiteStateStore(path), SQLiteStateStore(path)
+    monkeypatch.setattr(main, "state_store", worker_a)
+    monkeypatch.setattr(main, "coordinator", SQLiteCoordinator(path))
+    registry_a = QuickReplyRegistry(worker_a.mapping("quick_reply_templates"))
+    registry_b = QuickReplyRegistry(worker_b.mapping("quick_reply_templates"))
+
+    # worker A قرأ القوالب في بداية التحديث، ثم أضاف worker B قالبًا
+    registry_a.templates(-100)
+    registry_b.add(-100, "from b")
+    worker_b.flush()
+
+    async def add():
+        async with registry_a.locked(-100):
+            registry_a.add(-100, "from a")
+
+    asyncio.run(add())
+    version, items = QuickReplyRegistry(SQLiteStateStore(path).mapping("quick_reply_templates")).templates(-100)
+    assert version == 2
+    assert items[-2:] == ["from b", "from a"]
@@ -0,0 +1,65 @@
+import asyncio
+
+import main
+from main import PRIORITY_HIGH, PRIORITY_LOW, PriorityRateLimiter, TokenBucket
+
+
+def test_bucket_starts_full_and_drains():
+    bucket = TokenBucket(rate=1, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        assert bucket.delay(now) == 0
+        bucket.take()
+    assert bucket.delay(now) == 1.0
+
+
+def test_bucket_refill_is_capped():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        bucket.take()
+    assert bucket.delay(now + 0.25) == 0.25
+    assert bucket.delay(now + 100) == 0
+    assert bucket.tokens == 3
+
+
+def test_bucket_blocked_until():
+    bucket = TokenBucket(rate=1, capacity=3)
+    now = bucket.updated
+    bucket.blocked_until = now + 5
+    assert bucket.delay(now + 1) == 4
+    assert not bucket.idle(now + 1)
+    assert bucket.idle(now + 5)
+
+
+def test_bucket_idle_only_when_full():
+    bucket = TokenBucket(rate=1, capacity=3)
+    now = bucket.updated
+    bucket.take()
+    assert not bucket.idle(now)
+    assert bucket.idle(now + 1)
+
+
+def test_chat_waiters_served_by_priority(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_PRIVATE", 50)
+
+    async def run():
+        limiter = PriorityRateLimiter()
+        await limiter.initialize()
+        await limiter.initialize()  # PTB تستدعيها مرتين
+        order = []
+
+        async def send(label, priority):
+            await limiter._acquire(1, priority)
+            order.append(label)
+
+        # 3 توكنات متاحة فورًا، والباقي ينتظر في heap المحادثة
+        tasks = [asyncio.create_task(send(f"low{i}", PRIORITY_LOW)) for i in range(6)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(send("HIGH", PRIORITY_HIGH)))
+        await asyncio.gather(*tasks)
+        await limiter.shutdown()
+        assert not limiter._chat_waiters
+        return order
+
+    assert asyncio.run(run()) == ["low0", "low1", "low2", "HIGH", "low3", "low4", "low5"]
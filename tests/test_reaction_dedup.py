@@ -0,0 +1,63 @@
+import main
+from main import MemoryStateStore, PostVoters, ReactionDedup
+
+
+def test_sorted_array_add():
+    voters = PostVoters()
+    assert voters.add(30)
+    assert voters.add(10)
+    assert voters.add(20)
+    assert not voters.add(10)
+    assert list(voters.users) == [10, 20, 30]
+    assert voters.count == 3
+    assert voters.dirty
+
+
+def test_array_round_trip():
+    voters = PostVoters()
+    for uid in (5, -1, 2**40):
+        voters.add(uid)
+    restored = PostVoters.from_json(voters.to_json())
+    assert list(restored.users) == list(voters.users)
+    assert restored.count == 3
+    assert restored.last_seen == voters.last_seen
+    assert restored.bloom is None
+    assert not restored.add(2**40)
+    assert restored.add(6)
+
+
+def test_bloom_switch_and_round_trip(monkeypatch):
+    monkeypatch.setattr(main, "REACTION_BLOOM_THRESHOLD", 100)
+    voters = PostVoters()
+    for uid in range(101):
+        assert voters.add(uid)
+    assert voters.bloom is not None
+    assert len(voters.users) == 0
+    assert voters.count == 101
+
+    restored = PostVoters.from_json(voters.to_json())
+    assert restored.bloom == voters.bloom
+    assert restored.count == 101
+    # لا سلبيات كاذبة: كل من تفاعل سابقًا مرفوض
+    assert not any(restored.add(uid) for uid in range(101))
+    assert restored.count == 101
+
+
+def test_hot_tier_checkpoint_and_cold_load():
+    store = MemoryStateStore()
+    dedup = ReactionDedup(store)
+    assert dedup.add("-100:1", 7)
+    dedup.checkpoint()
+    assert not dedup.hot["-100:1"].dirty
+
+    cold = ReactionDedup(store)
+    assert not cold.add("-100:1", 7)
+    assert cold.stats["cold_loads"] == 1
+
+
+def test_legacy_reacted_users_migration():
+    store = MemoryStateStore()
+    store.blob_put_many("reacted_users", [("-100:1", main.encode_state({3, 1}))])
+    dedup = ReactionDedup(store)
+    assert not dedup.add("-100:1", 1)
+    assert dedup.add("-100:1", 2)
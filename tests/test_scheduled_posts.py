@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from main import LocalCoordinator, SQLiteStateStore
+
+
+@pytest.fixture
+def scheduler_state(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path)
+    posts = store.mapping("scheduled_posts")
+    sent = []
+
+    async def send_message(chat_id, text):
+        sent.append((chat_id, text))
+
+    monkeypatch.setattr(main, "state_store", store)
+    monkeypatch.setattr(main, "scheduled_posts", posts)
+    monkeypatch.setattr(main, "coordinator", LocalCoordinator(store))
+    monkeypatch.setattr(main, "application", SimpleNamespace(bot=SimpleNamespace(send_message=send_message)))
+    posts[1] = {
+        "id": 1, "admin_id": 42, "run_at": 100, "post": {"text": "hi"},
+        "destinations": [-1, -2], "titles": [[-1, "A"], [-2, "B"]],
+    }
+    store.flush()
+    return path, posts, sent
+
+
+def test_destinations_marked_durably_before_sending(scheduler_state, monkeypatch):
+    path, _, _ = scheduler_state
+
+    async def crash(bot, destinations, post):
+        # ما يراه worker بعد إعادة التشغيل لو انهارت العملية الآن
+        assert SQLiteStateStore(path).mapping("scheduled_posts")[1]["started"] == [-1, -2]
+        raise SystemExit
+
+    monkeypatch.setattr(main, "publish_to_destinations", crash)
+    with pytest.raises(SystemExit):
+        asyncio.run(main.run_publish_slot(120))
+
+
+def test_restart_does_not_republish_started_destinations(scheduler_state, monkeypatch):
+    _, posts, sent = scheduler_state
+    posts[1]["started"] = [-1]
+    published = []
+
+    async def publish(bot, destinations, post):
+        published.extend(destinations)
+        return [(chat_id, None) for chat_id in destinations]
+
+    monkeypatch.setattr(main, "publish_to_destinations", publish)
+    asyncio.run(main.run_publish_slot(120))
+
+    assert published == [-2]
+    assert 1 not in posts
+    assert sent[0][0] == 42
+    assert "✅ B" in sent[0][1]
+    assert main.SCHEDULE_INTERRUPTED in sent[0][1]
+
+
+def test_future_posts_are_left_alone(scheduler_state, monkeypatch):
+    _, posts, _ = scheduler_state
+    monkeypatch.setattr(main, "publish_to_destinations", None)
+    asyncio.run(main.run_publish_slot(60))
+    assert "started" not in posts[1]
@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+import main
+from main import SQLiteStateStore
+
+
+def test_flush_and_reload(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path)
+    sessions = store.mapping("admin_sessions")
+    sessions[1] = {"target_channel_id": -100, "tags": {"a", "b"}}
+    sessions[2] = {"text": "draft"}
+    store.flush()
+    assert store.stats["rows_written"] == 2
+    store.close()
+
+    reopened = SQLiteStateStore(path).mapping("admin_sessions")
+    assert reopened[1] == {"target_channel_id": -100, "tags": {"a", "b"}}
+    assert sorted(reopened) == [1, 2]
+
+
+def test_in_place_mutation_is_written(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    sessions = store.mapping("admin_sessions")
+    sessions[1] = {"text": None}
+    store.flush()
+
+    # التعديل داخل القيمة بدون إعادة الإسناد: الوصول وحده يكفي لفحصها عند التفريغ
+    sessions[1]["text"] = "updated"
+    store.flush()
+    assert store.stats["rows_written"] == 2
+
+    # لا تغيير → لا كتابة
+    sessions.get(1)
+    store.flush()
+    assert store.stats["rows_written"] == 2
+    store.close()
+    assert SQLiteStateStore(str(tmp_path / "state.db")).mapping("admin_sessions")[1]["text"] == "updated"
+
+
+def test_delete_and_missing_keys(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path)
+    sessions = store.mapping("admin_sessions")
+    sessions[1] = {"x": 1}
+    store.flush()
+    del sessions[1]
+    assert sessions.get(1) is None
+    store.close()
+
+    reopened = SQLiteStateStore(path).mapping("admin_sessions")
+    assert 1 not in reopened
+    assert len(reopened) == 0
+
+
+def test_scope_keeps_keys_touched_mid_update(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path)
+    sessions = store.mapping("admin_sessions")
+    sessions[1] = {"step": 0}
+    store.flush()
+
+    with store.scope():
+        session = sessions[1]
+        session["step"] = 1
+        # تفريغ من تحديث آخر انتهى بينما هذا ما زال يعمل
+        store.flush()
+        # تعديل بعد await داخل نفس التحديث: لا وصول جديد للمفتاح
+        session["step"] = 2
+    store.flush()
+    store.close()
+
+    assert SQLiteStateStore(path).mapping("admin_sessions")[1] == {"step": 2}
+
+
+def test_memory_backend_scope_is_noop():
+    with main.MemoryStateStore().scope():
+        pass
+
+
+def test_failed_flush_is_retried(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path)
+    sessions = store.mapping("admin_sessions")
+    sessions[1] = {"step": 0}
+    sessions[2] = {"step": 0}
+    store.flush()
+
+    class FailingConnection:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, *args):
+            return self.conn.execute(*args)
+
+        def executemany(self, *args):
+            raise sqlite3.OperationalError("disk I/O error")
+
+    real = store.conn
+    store._conn = FailingConnection(real)
+    sessions[1]["step"] = 1
+    del sessions[2]
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+
+    store._conn = real
+    store.flush()
+    store.close()
+    reopened = SQLiteStateStore(path).mapping("admin_sessions")
+    assert reopened[1] == {"step": 1}
+    assert 2 not in reopened
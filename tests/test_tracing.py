@@ -0,0 +1,20 @@
+import main
+
+
+def test_one_update_profiled_at_a_time(monkeypatch):
+    monkeypatch.setattr(main, "SLOW_UPDATE_PROFILE", True)
+    first = main.start_update_profiler()
+    try:
+        assert first is not None
+        # تحديث متزامن آخر لا يستبدل خطّاف البروفايل ولا يفشل
+        assert main.start_update_profiler() is None
+    finally:
+        main.stop_update_profiler(first)
+    second = main.start_update_profiler()
+    assert second is not None
+    main.stop_update_profiler(second)
+    assert not main.update_profiler_busy
+
+
+def test_profiling_disabled_by_default():
+    assert main.start_update_profiler() is None
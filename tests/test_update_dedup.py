@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import main
+from main import MemoryStateStore, UpdateDedup
+
+
+def test_check_does_not_record():
+    dedup = UpdateDedup(4)
+    assert dedup.check(10) is None
+    assert dedup.check(10) is None
+    dedup.add(10)
+    assert dedup.check(10) == "window"
+
+
+def test_window_eviction_and_stale():
+    dedup = UpdateDedup(4)
+    for update_id in range(100, 110):
+        dedup.add(update_id)
+    assert dedup.check(109) == "window"
+    # خرج من الحلقة لكنه ضمن النافذة الحجمية: يُعتبر جديدًا
+    assert dedup.check(105) is None
+    # أقدم من النافذة بقليل: إعادة إرسال متأخرة
+    assert dedup.check(100) == "stale"
+
+
+def test_far_gap_starts_new_sequence():
+    dedup = UpdateDedup(4)
+    for update_id in range(10_000, 10_004):
+        dedup.add(update_id)
+    assert dedup.check(5) is None
+    dedup.add(5)
+    assert dedup.high == 5
+    assert dedup.members == {5}
+
+
+def test_checkpoint_and_restore():
+    store = MemoryStateStore()
+    dedup = UpdateDedup(4)
+    for update_id in range(1, 7):
+        dedup.add(update_id)
+    dedup.checkpoint(store)
+    assert not dedup.dirty
+
+    restored = UpdateDedup(4)
+    restored.restore(store)
+    assert restored.members == {3, 4, 5, 6}
+    assert restored.high == 6
+    assert not restored.dirty
+    # نفس ترتيب الحلقة: الإضافة التالية تُخرج الأقدم
+    restored.add(7)
+    assert restored.members == {4, 5, 6, 7}
+
+
+def test_ingest_failure_is_not_recorded(monkeypatch):
+    class BrokenJournal:
+        def append(self, data, raw=None):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(main, "update_dedup", UpdateDedup(16))
+    monkeypatch.setattr(main, "update_journal", BrokenJournal())
+    monkeypatch.setattr(main, "update_queue", asyncio.Queue())
+    update = {"update_id": 42, "message": {"chat": {"type": "private"}, "text": "hi"}}
+
+    with pytest.raises(OSError):
+        main.ingest_update(update)
+    assert main.update_dedup.check(42) is None
+    assert main.update_queue.empty()